@@ -0,0 +1,137 @@
+"""Générateur d'arborescences `receipts/` synthétiques pour les benchmarks.
+
+    python benchmarks/generate_receipts.py /tmp/arbre --tickets 100000 --months 36
+
+Les enseignes suivent une loi de Zipf (quelques enseignes très fréquentes, une longue traîne),
+les catégories sont déséquilibrées, et une partie des tickets partage la date et l'enseigne
+du ticket précédent pour produire des noms en collision (_1, _2...).
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import itertools
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker.storage import format_receipt_markdown, pack_closed_months, receipt_filename
+
+MERCHANTS = [
+    "Carrefour", "Lidl", "Leclerc", "Auchan", "Intermarché", "Monoprix", "Franprix", "Picard", "Amazon", "SNCF",
+    "TotalEnergies", "Shell", "RATP", "Uber", "Boulangerie Paul", "McDonald's", "KFC", "Starbucks", "Fnac", "Darty",
+    "Decathlon", "Ikea", "Leroy Merlin", "Castorama", "Zara", "H&M", "Primark", "Uniqlo", "Pharmacie", "Doctolib",
+    "Orange", "Free", "EDF", "Engie", "Netflix", "Spotify", "Cinéma Pathé", "Fnac Spectacles", "Airbnb", "Booking",
+]
+# Catégories de l'application et leur poids relatif
+CATEGORIES = {
+    "Alimentation": 40, "Transport": 18, "Restaurant": 14, "Logement": 8, "Loisirs": 8,
+    "Vêtements": 5, "Santé": 4, "Autre": 3,
+}
+NOTES = ["", "", "", "Paiement par carte", "Remboursement attendu", "Achat groupé avec la famille"]
+
+# Fonction pour construire la liste des enseignes (connues puis longue traîne) et leurs poids cumulés (loi de Zipf)
+def merchant_distribution(count, exponent=1.1):
+    merchants = MERCHANTS + [f"Commerce {i}" for i in range(len(MERCHANTS), count)]
+    merchants = merchants[:count]
+    weights = [1 / (rank ** exponent) for rank in range(1, len(merchants) + 1)]
+    return merchants, list(itertools.accumulate(weights))
+
+# Fonction pour lister les M mois se terminant au mois donné (AAAA-MM), du plus ancien au plus récent
+def month_range(end_month, months):
+    year, month = int(end_month[:4]), int(end_month[5:7])
+    index = year * 12 + month - 1
+    return [((i // 12), (i % 12) + 1) for i in range(index - months + 1, index + 1)]
+
+# Fonction pour générer les tickets : (date, enseigne, total, catégorie, notes), dans l'ordre d'écriture
+def generate_receipts(tickets, months, end_month, merchants=500, collision_rate=0.05, seed=42):
+    rng = random.Random(seed)
+    names, cumulative_weights = merchant_distribution(merchants)
+    month_list = month_range(end_month, months)
+    categories = list(CATEGORIES)
+    category_weights = list(itertools.accumulate(CATEGORIES.values()))
+    
+    # Chaque enseigne a une catégorie habituelle (80 % des tickets) et un montant typique
+    usual_category = {name: rng.choices(categories, cum_weights=category_weights)[0] for name in names}
+    typical_amount = {name: rng.lognormvariate(3, 0.8) for name in names}
+    
+    previous = None
+    for _ in range(tickets):
+        if previous is not None and rng.random() < collision_rate:
+            day, merchant = previous
+        else:
+            year, month = rng.choice(month_list)
+            last_day = (date(year + month // 12, month % 12 + 1, 1) - date(year, month, 1)).days
+            day = date(year, month, rng.randint(1, last_day)).isoformat()
+            merchant = rng.choices(names, cum_weights=cumulative_weights)[0]
+        previous = (day, merchant)
+        category = usual_category[merchant] if rng.random() < 0.8 else rng.choices(categories, cum_weights=category_weights)[0]
+        total = round(typical_amount[merchant] * rng.uniform(0.5, 1.5) * 100)  # en centimes
+        yield day, merchant, total, category, rng.choice(NOTES)
+
+# Fonction pour écrire l'arborescence receipts/ dans `root` ; retourne le nombre de noms en collision
+def write_receipt_tree(root, receipts):
+    counters = {}
+    collisions = 0
+    folders = set()
+    for day, merchant, total, category, notes in receipts:
+        year_month = day[:4] + '_' + day[5:7]
+        folder = os.path.join(root, "receipts", year_month)
+        if year_month not in folders:
+            os.makedirs(folder, exist_ok=True)
+            folders.add(year_month)
+        
+        stem = f"{day}_{merchant.replace(' ', '_')}"
+        suffix = counters.get((year_month, stem), 0)
+        counters[(year_month, stem)] = suffix + 1
+        collisions += suffix > 0
+        with open(os.path.join(folder, receipt_filename(stem, suffix)), 'w', encoding='utf-8') as f:
+            f.write(format_receipt_markdown(day, merchant, total, category, notes))
+    return collisions
+
+# Fonction pour générer une arborescence complète et décrire ses paramètres dans tree.json
+def generate_tree(root, tickets, months=36, end_month="2025-12", merchants=500, collision_rate=0.05, seed=42, pack=False):
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    receipts = generate_receipts(tickets, months, end_month, merchants, collision_rate, seed)
+    collisions = write_receipt_tree(root, receipts)
+    
+    if pack:
+        # Archiver les mois terminés (les chemins de l'application sont relatifs au dossier courant)
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            pack_closed_months()
+        finally:
+            os.chdir(cwd)
+    
+    description = {
+        'tickets': tickets, 'months': months, 'end_month': end_month, 'merchants': merchants,
+        'collision_rate': collision_rate, 'seed': seed, 'pack': pack, 'collisions': collisions,
+    }
+    with open(os.path.join(root, "tree.json"), 'w', encoding='utf-8') as f:
+        json.dump(description, f, indent=2)
+    return description
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Générer une arborescence receipts/ synthétique")
+    parser.add_argument("root", help="dossier à créer (contiendra receipts/ et data/)")
+    parser.add_argument("--tickets", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--end-month", default="2025-12", help="dernier mois généré (AAAA-MM)")
+    parser.add_argument("--merchants", type=int, default=500, help="nombre d'enseignes distinctes")
+    parser.add_argument("--collision-rate", type=float, default=0.05,
+                        help="part des tickets reprenant la date et l'enseigne du ticket précédent")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pack", action="store_true", help="archiver les mois terminés après génération")
+    args = parser.parse_args(argv)
+    
+    if os.path.exists(os.path.join(args.root, "receipts")):
+        parser.error(f"{args.root} contient déjà un dossier receipts/")
+    description = generate_tree(args.root, args.tickets, args.months, args.end_month, args.merchants,
+                                args.collision_rate, args.seed, args.pack)
+    print(json.dumps(description, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmarks du chargement, des agrégats, des noms de fichiers et des graphiques.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,100000,1000000 --output resultats.json
+    python benchmarks/run_benchmarks.py --sizes 1000 --compare resultats.json
+
+Pour chaque taille, une arborescence synthétique est générée une fois (puis réutilisée) dans --workdir.
+Chaque opération est mesurée plusieurs fois (latence médiane et minimale, débit), puis une dernière fois
+sous tracemalloc pour le pic de mémoire. Les résultats JSON peuvent être comparés entre deux versions.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import importlib.util
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_receipts import generate_tree
+from expense_tracker.aggregates import (
+    ReceiptAggregates,
+    calculate_category_totals,
+    calculate_monthly_totals,
+    load_rollup_table,
+)
+from expense_tracker.money import cents_to_euros
+from expense_tracker.storage import generate_unique_filename, load_all_receipts
+from expense_tracker.store import ReceiptStore
+
+RESULTS_FORMAT = 1
+DEFAULT_SIZES = "1000,100000,1000000"
+FILENAME_CALLS = 1000
+# Écart de latence médiane en dessous duquel une opération n'est pas signalée comme régression (secondes)
+DEFAULT_MIN_DELTA = 0.001
+
+# Une opération mesurée : `setup` prépare chaque mesure (non chronométré), `run` est chronométré
+class Benchmark:
+    def __init__(self, name, run, setup=None, count=None, unit="tickets"):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.count = count    # nombre d'éléments traités par appel (débit)
+        self.unit = unit
+
+# Fonction pour mesurer une opération : au moins une fois, au plus `repeat` fois ou `max_seconds` secondes
+def measure(benchmark, repeat, max_seconds):
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < repeat and (not durations or time.perf_counter() - started < max_seconds):
+        state = benchmark.setup() if benchmark.setup else None
+        start = time.perf_counter()
+        benchmark.run(state)
+        durations.append(time.perf_counter() - start)
+    
+    # Pic de mémoire (allocations Python et numpy) sur une exécution supplémentaire
+    state = benchmark.setup() if benchmark.setup else None
+    tracemalloc.start()
+    try:
+        benchmark.run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    median = statistics.median(durations)
+    return {
+        'operation': benchmark.name,
+        'repeats': len(durations),
+        'median_s': round(median, 6),
+        'min_s': round(min(durations), 6),
+        'max_s': round(max(durations), 6),
+        'throughput_per_s': round(benchmark.count / median, 1) if benchmark.count and median else None,
+        'unit': benchmark.unit,
+        'peak_memory_bytes': peak,
+    }
+
+# Fonction pour charger le script Streamlit comme module (fonctions de rendu des graphiques)
+# Retourne None si Streamlit ou matplotlib ne sont pas installés
+def load_app_module():
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        spec = importlib.util.spec_from_file_location("expense_tracker_app", os.path.join(ROOT, "expense-tracker-app.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except ImportError:
+        return None
+
+# Fonction pour supprimer l'index (chargement à froid)
+def remove_index():
+    for path in glob.glob(os.path.join("data", "*.sqlite*")):
+        os.remove(path)
+
+# Fonction pour construire un magasin à jour
+def loaded_store():
+    store = ReceiptStore()
+    store.refresh()
+    return store
+
+# Fonction pour retirer les agrégats mémorisés sur un instantané (calcul complet à chaque mesure)
+def fresh_columns(store):
+    store.columns.__dict__.pop('aggregates', None)
+    return store.columns
+
+# Fonction pour lister les opérations mesurées sur une arborescence de `tickets` tickets
+def build_benchmarks(tickets, app):
+    store = loaded_store()
+    benchmarks = [
+        Benchmark("load_all_receipts (index absent)", lambda _: load_all_receipts(), remove_index, tickets),
+        Benchmark("load_all_receipts (index à jour)", lambda _: load_all_receipts(), None, tickets),
+        Benchmark("ReceiptStore.refresh", lambda s: s.refresh(), ReceiptStore, tickets),
+        Benchmark("calculate_monthly_totals", calculate_monthly_totals, lambda: fresh_columns(store), tickets),
+        Benchmark("calculate_category_totals", calculate_category_totals, lambda: fresh_columns(store), tickets),
+        # Vue d'ensemble à partir des récapitulatifs mensuels, sans charger les tickets
+        Benchmark("ReceiptAggregates (récapitulatifs)", lambda _: ReceiptAggregates(load_rollup_table()), None, tickets),
+        # Noms en collision : même date et même enseigne à chaque appel
+        Benchmark("generate_unique_filename (collisions)",
+                  lambda _: [generate_unique_filename("2025-12-01", "Carrefour") for _ in range(FILENAME_CALLS)],
+                  None, FILENAME_CALLS, "appels"),
+    ]
+    
+    if app is not None:
+        # Graphiques en euros, comme dans l'application
+        monthly_totals = calculate_monthly_totals(store.columns)
+        months, totals = tuple(sorted(monthly_totals)), tuple(cents_to_euros(monthly_totals[m]) for m in sorted(monthly_totals))
+        category_totals = calculate_category_totals(store.columns)
+        categories, category_values = tuple(category_totals), tuple(map(cents_to_euros, category_totals.values()))
+        # Fonctions de rendu appelées sans le cache Streamlit
+        benchmarks += [
+            Benchmark("render_monthly_chart (matplotlib)",
+                      lambda _: app.render_monthly_chart.__wrapped__(months, totals), None, 1, "graphiques"),
+            Benchmark("render_category_chart (matplotlib)",
+                      lambda _: app.render_category_chart.__wrapped__(categories, category_values), None, 1, "graphiques"),
+            Benchmark("monthly_chart_spec (Vega-Lite)",
+                      lambda _: app.monthly_chart_spec(months, totals), None, 1, "graphiques"),
+        ]
+    return benchmarks
+
+# Fonction pour obtenir (ou générer) l'arborescence d'une taille donnée
+def prepare_tree(workdir, tickets, months, seed, pack):
+    root = os.path.join(workdir, f"receipts-{tickets}-{months}m-s{seed}{'-pack' if pack else ''}")
+    if not os.path.exists(os.path.join(root, "tree.json")):
+        print(f"Génération de {tickets} tickets dans {root}...", file=sys.stderr)
+        generate_tree(root, tickets, months, seed=seed, pack=pack)
+    return root
+
+# Fonction pour obtenir la révision git du code mesuré (None hors dépôt git)
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Fonction pour comparer deux résultats ; retourne le nombre de régressions
+# Régression : médiane plus lente que `threshold` fois l'ancienne et d'au moins `min_delta` secondes
+# (en dessous, l'écart relève du bruit de mesure des opérations de moins d'une milliseconde)
+def compare_results(previous, current, threshold, min_delta=DEFAULT_MIN_DELTA):
+    before = {(r['operation'], r['tickets']): r for r in previous['results']}
+    regressions = 0
+    print(f"\n{'Opération':<42} {'Tickets':>9} {'Avant':>10} {'Après':>10} {'Ratio':>7}")
+    for result in current['results']:
+        old = before.get((result['operation'], result['tickets']))
+        if old is None or not old['median_s']:
+            continue
+        ratio = result['median_s'] / old['median_s']
+        flag = ""
+        if ratio > threshold and result['median_s'] - old['median_s'] >= min_delta:
+            flag = "  RÉGRESSION"
+            regressions += 1
+        print(f"{result['operation']:<42} {result['tickets']:>9} {old['median_s'] * 1000:>8.1f}ms "
+              f"{result['median_s'] * 1000:>8.1f}ms {ratio:>6.2f}x{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du Tracker de Dépenses")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="nombres de tickets, séparés par des virgules")
+    parser.add_argument("--months", type=int, default=36, help="nombre de mois couverts par les tickets")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pack", action="store_true", help="mesurer des arborescences aux mois terminés archivés")
+    parser.add_argument("--repeat", type=int, default=5, help="nombre maximal de mesures par opération")
+    parser.add_argument("--max-seconds", type=float, default=20, help="durée au-delà de laquelle on arrête de répéter")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "expense-tracker-bench"),
+                        help="dossier des arborescences générées (réutilisées d'une exécution à l'autre)")
+    parser.add_argument("--skip-charts", action="store_true", help="ne pas mesurer le rendu des graphiques")
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    parser.add_argument("--compare", help="résultats JSON d'une version précédente")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio de latence médiane signalé comme régression (avec --compare)")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA,
+                        help="écart de latence médiane minimal d'une régression, en secondes (avec --compare)")
+    args = parser.parse_args(argv)
+    
+    app = None if args.skip_charts else load_app_module()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    cwd = os.getcwd()
+    results = []
+    for tickets in sizes:
+        root = prepare_tree(os.path.abspath(args.workdir), tickets, args.months, args.seed, args.pack)
+        os.chdir(root)
+        try:
+            for benchmark in build_benchmarks(tickets, app):
+                result = measure(benchmark, args.repeat, args.max_seconds)
+                result['tickets'] = tickets
+                results.append(result)
+                throughput = f"{result['throughput_per_s']:>12,.0f} {result['unit']}/s" if result['throughput_per_s'] else ""
+                print(f"{benchmark.name:<42} {tickets:>9} {result['median_s'] * 1000:>10.1f}ms {throughput} "
+                      f"{result['peak_memory_bytes'] / 2 ** 20:>8.1f} Mo", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    
+    report = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {'months': args.months, 'seed': args.seed, 'pack': args.pack, 'repeat': args.repeat},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare_results(previous, report, args.threshold, args.min_delta):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,177 +1,354 @@
+import time
+
+# Début de l'exécution du script (mesure du temps jusqu'au premier affichage)
+SCRIPT_START = time.perf_counter()
+
 import streamlit as st
+from streamlit import runtime
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import sys
 from datetime import datetime
-import re
-import glob
+import io
+import json
+import logging
+import statistics
+from collections import deque
+import numpy as np
 
-# Configuration de la page avec un thème plus élégant
-st.set_page_config(
-    page_title="Tracker de Dépenses",
-    layout="wide",
-    initial_sidebar_state="expanded",
+from expense_tracker import cli
+from expense_tracker.aggregates import calculate_category_totals, get_receipt_aggregates
+from expense_tracker.importer import DEFAULT_IMPORT_CATEGORY, import_bank_statement
+from expense_tracker.journal import start_receipt_writer
+from expense_tracker.metrics import (
+    PROCESS_METRICS,
+    MetricsRecorder,
+    activate_recorder,
+    deactivate_recorder,
+    format_prometheus_scopes,
+    metrics_as_dict,
+    record_time,
+    timed,
+    write_metrics_file,
+)
+from expense_tracker.money import MAX_AMOUNT_CENTS, cents_to_euros, euros_to_cents, format_amount
+from expense_tracker.storage import (
+    create_folder_structure,
+    delete_receipt,
+    open_receipt_index,
+    save_receipt_as_markdown,
+    search_query,
+    search_receipts,
+    view_receipt,
 )
+from expense_tracker.store import ReceiptStore, find_receipt_position, is_receipt_at
+from expense_tracker.watcher import start_receipt_watcher
 
 # Charger le fichier CSS externe
 def load_css(css_file):
     with open(css_file, "r", encoding="utf-8") as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
-# Charger le fichier CSS
-load_css("style.css")
+# Configuration de la page (uniquement sous Streamlit, pas en ligne de commande)
+if runtime.exists():
+    # Configuration de la page avec un thème plus élégant
+    st.set_page_config(
+        page_title="Tracker de Dépenses",
+        layout="wide",
+        initial_sidebar_state="expanded",
+    )
+    
+    # Charger le fichier CSS
+    load_css("style.css")
 
-# Initialisation des variables de session
-if 'receipts' not in st.session_state:
-    st.session_state.receipts = []
-if 'monthly_totals' not in st.session_state:
-    st.session_state.monthly_totals = {}
+# Fonction pour obtenir le magasin partagé (une seule instance par processus)
+@st.cache_resource(show_spinner=False)
+def get_receipt_store():
+    return ReceiptStore()
 
-# Fonction pour créer les dossiers nécessaires
-def create_folder_structure():
-    os.makedirs("data", exist_ok=True)
-    os.makedirs("receipts", exist_ok=True)
+# Fonction pour démarrer la surveillance du dossier receipts (une seule par processus, None si désactivée)
+# Les fichiers ajoutés, modifiés ou supprimés par d'autres processus sont appliqués au magasin partagé
+@st.cache_resource(show_spinner=False)
+def get_receipt_watcher():
+    return start_receipt_watcher(get_receipt_store())
 
-# Fonction pour générer un nom de fichier unique
-def generate_unique_filename(date, enterprise):
-    base_filename = f"{date}_{enterprise.replace(' ', '_')}.md"
-    year_month = date.split('-')[0] + '_' + date.split('-')[1]
-    folder_path = os.path.join("receipts", year_month)
-    os.makedirs(folder_path, exist_ok=True)
-    
-    counter = 1
-    filename = base_filename
-    while os.path.exists(os.path.join(folder_path, filename)):
-        filename = f"{date}_{enterprise.replace(' ', '_')}_{counter}.md"
-        counter += 1
+# Fonction pour démarrer l'écriture différée (une seule par processus, None si désactivée)
+# Un enregistrement ou une suppression est acquitté dès son ajout au journal ; fichiers et index suivent par lots
+@st.cache_resource(show_spinner=False)
+def get_receipt_writer():
+    return start_receipt_writer(get_receipt_store())
+
+# Relancer l'affichage dès que le magasin change (fichiers écrits par un autre processus ou une synchronisation)
+@st.fragment(run_every=1)
+def follow_receipt_changes(store, version):
+    if store.columns.version != version:
+        st.rerun()
+
+# Vues de la section « Statistiques & Graphiques »
+MONTHLY_VIEW = "📊 Évolution Mensuelle"
+CATEGORY_VIEW = "🔄 Répartition par Catégorie"
+DETAIL_VIEW = "🧮 Détail Mensuel"
+STATS_VIEWS = [MONTHLY_VIEW, CATEGORY_VIEW, DETAIL_VIEW]
+
+# Rendu des graphiques : image matplotlib (mise en cache) ou graphique natif Vega-Lite (sans matplotlib)
+# pandas, matplotlib et seaborn ne sont importés qu'au moment où une vue en a besoin
+MATPLOTLIB_CHART_BACKEND = "Image (Matplotlib)"
+NATIVE_CHART_BACKEND = "Natif (Vega-Lite)"
+CHART_BACKENDS = [MATPLOTLIB_CHART_BACKEND, NATIVE_CHART_BACKEND]
+DEFAULT_CHART_BACKEND = os.environ.get("EXPENSE_TRACKER_CHART_BACKEND", MATPLOTLIB_CHART_BACKEND)
+
+# Fonction pour convertir une figure matplotlib en image PNG (mêmes réglages que st.pyplot)
+def figure_to_png(fig):
+    import matplotlib.pyplot as plt
     
-    return year_month, filename
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
 
-# Fonction pour sauvegarder un ticket en markdown
-def save_receipt_as_markdown(date, enterprise, total, category, notes):
-    year_month, filename = generate_unique_filename(date, enterprise)
-    filepath = os.path.join("receipts", year_month, filename)
+# Graphique des dépenses mensuelles, mis en cache selon les mois et les totaux
+@st.cache_data(show_spinner=False, max_entries=32)
+@timed("chart_render")
+def render_monthly_chart(months, totals):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    fig, ax = plt.subplots(figsize=(10, 6))
     
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(f"# Ticket: {enterprise}\n\n")
-        f.write(f"**Date:** {date}\n\n")
-        f.write(f"**Catégorie:** {category}\n\n")
-        f.write(f"**Total:** {total}€\n\n")
-        f.write("## Notes\n\n")
-        f.write(notes if notes else "_Aucune note_")
+    # Palette de couleurs élégante
+    bars = ax.bar(months, totals, color=sns.color_palette("viridis", len(months)))
     
-    # Mise à jour des données de session
-    update_session_data()
+    ax.set_title('Évolution des Dépenses Mensuelles', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Mois', fontsize=12)
+    ax.set_ylabel('Montant (€)', fontsize=12)
     
-    return year_month, filename
+    # Améliorer l'apparence
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_color('#DDDDDD')
+    ax.spines['bottom'].set_color('#DDDDDD')
+    ax.tick_params(bottom=False, left=False)
+    
+    # Ajouter une grille légère
+    ax.yaxis.grid(True, color='#EEEEEE')
+    ax.xaxis.grid(False)
+    
+    # Rotation des labels
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    
+    # Ajouter les valeurs sur les barres
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + max(totals)*0.02,
+               f"{height:.2f}€",
+               ha='center', va='bottom', fontweight='bold', color='#1E88E5')
+    
+    fig.tight_layout()
+    return figure_to_png(fig)
 
-# Fonction pour charger tous les tickets
-def load_all_receipts():
-    receipts = []
-    receipt_folders = glob.glob("receipts/*_*/")
+# Graphique en anneau des catégories, mis en cache selon les catégories et les totaux
+@st.cache_data(show_spinner=False, max_entries=32)
+@timed("chart_render")
+def render_category_chart(categories, totals):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
-    for folder in receipt_folders:
-        receipt_files = glob.glob(os.path.join(folder, "*.md"))
-        for receipt_file in receipt_files:
-            year_month = os.path.basename(os.path.dirname(receipt_file))
-            filename = os.path.basename(receipt_file)
-            
-            # Extraire les informations du nom de fichier
-            date_match = re.match(r"(\d{4}-\d{2}-\d{2})_(.+?)(?:_\d+)?\.md$", filename)
-            if date_match:
-                date = date_match.group(1)
-                enterprise = date_match.group(2).replace('_', ' ')
-                
-                # Lire le contenu pour extraire le total et la catégorie
-                try:
-                    with open(receipt_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        total_match = re.search(r'\*\*Total:\*\* (\d+(?:\.\d+)?)€', content)
-                        category_match = re.search(r'\*\*Catégorie:\*\* (.+?)\n', content)
-                        
-                        category = category_match.group(1) if category_match else "Non catégorisé"
-                        total = float(total_match.group(1)) if total_match else 0.0
-                        
-                        receipts.append({
-                            'date': date,
-                            'enterprise': enterprise,
-                            'total': total,
-                            'category': category,
-                            'year_month': year_month,
-                            'filename': filename
-                        })
-                except Exception as e:
-                    st.warning(f"Erreur lors de la lecture de {receipt_file}: {str(e)}")
+    fig, ax = plt.subplots(figsize=(10, 7))
     
-    # Trier par date (plus récent au plus ancien)
-    receipts.sort(key=lambda x: x['date'], reverse=True)
-    return receipts
+    # Utiliser une belle palette de couleurs
+    colors = sns.color_palette('viridis', len(categories))
+    
+    wedges, texts, autotexts = ax.pie(
+        totals,
+        labels=list(categories),
+        autopct='',
+        startangle=90,
+        colors=colors,
+        wedgeprops=dict(width=0.5, edgecolor='w')
+    )
+    
+    # Calculer le pourcentage pour chaque catégorie
+    total_amount = sum(totals)
+    percentages = [(amount/total_amount)*100 for amount in totals]
+    
+    # Ajouter une légende élégante
+    legend_labels = [f"{cat} ({per:.1f}% - {amount:.2f}€)" for cat, per, amount in zip(categories, percentages, totals)]
+    ax.legend(wedges, legend_labels, title="Catégories", loc="best", bbox_to_anchor=(1, 0, 0.5, 1))
+    
+    ax.set_title('Répartition des Dépenses par Catégorie', fontsize=16, fontweight='bold', pad=20)
+    ax.set_aspect('equal')
+    
+    fig.tight_layout()
+    return figure_to_png(fig)
 
-# Fonction pour supprimer un ticket
-def delete_receipt(year_month, filename):
-    filepath = os.path.join("receipts", year_month, filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
-        # Vérifier si le dossier est vide après suppression
-        if not os.listdir(os.path.join("receipts", year_month)):
-            os.rmdir(os.path.join("receipts", year_month))
-        update_session_data()
-        return True
-    return False
+# Spécification Vega-Lite du graphique mensuel (rendu côté navigateur)
+def monthly_chart_spec(months, totals):
+    return {
+        "title": "Évolution des Dépenses Mensuelles",
+        "data": {"values": [{"Mois": month, "Total": round(total, 2)} for month, total in zip(months, totals)]},
+        "mark": {"type": "bar", "cornerRadiusTopLeft": 3, "cornerRadiusTopRight": 3},
+        "encoding": {
+            "x": {"field": "Mois", "type": "ordinal", "sort": None, "axis": {"labelAngle": -45}},
+            "y": {"field": "Total", "type": "quantitative", "title": "Montant (€)"},
+            "color": {"field": "Mois", "type": "ordinal", "sort": None, "scale": {"scheme": "viridis"}, "legend": None},
+            "tooltip": [{"field": "Mois"}, {"field": "Total", "format": ".2f", "title": "Total (€)"}]
+        }
+    }
 
-# Fonction pour afficher un ticket
-def view_receipt(year_month, filename):
-    filepath = os.path.join("receipts", year_month, filename)
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return content
-    return None
+# Spécification Vega-Lite du graphique en anneau des catégories
+def category_chart_spec(categories, totals):
+    return {
+        "title": "Répartition des Dépenses par Catégorie",
+        "data": {"values": [{"Catégorie": category, "Total": round(total, 2)} for category, total in zip(categories, totals)]},
+        "mark": {"type": "arc", "innerRadius": 60, "stroke": "white"},
+        "encoding": {
+            "theta": {"field": "Total", "type": "quantitative", "stack": True},
+            "color": {"field": "Catégorie", "type": "nominal", "sort": None, "scale": {"scheme": "viridis"}},
+            "order": {"field": "Total", "type": "quantitative", "sort": "descending"},
+            "tooltip": [{"field": "Catégorie"}, {"field": "Total", "format": ".2f", "title": "Total (€)"}]
+        }
+    }
 
-# Fonction pour calculer les totaux mensuels
-def calculate_monthly_totals(receipts):
-    monthly_totals = {}
-    for receipt in receipts:
-        year_month = receipt['year_month']
-        if year_month in monthly_totals:
-            monthly_totals[year_month] += receipt['total']
-        else:
-            monthly_totals[year_month] = receipt['total']
+# Rapport des temps d'affichage (depuis le début du script), partagé par le processus
+TIMING_STEPS = ["Configuration", "Formulaire", "Liste des tickets", "Statistiques", "Total"]
+# Phase mesurée entre deux étapes consécutives (construction des widgets et envoi au navigateur compris)
+TIMING_PHASES = {"Configuration": "startup", "Formulaire": "form", "Liste des tickets": "list_build",
+                 "Statistiques": "stats_render", "Total": "detail"}
+logger = logging.getLogger("expense_tracker")
+
+# Instrumentation détaillée dans la barre latérale (désactivée par défaut)
+# et export optionnel des mesures du processus à chaque affichage (texte Prometheus, ou JSON si le nom finit par .json)
+DEBUG_METRICS = os.environ.get("EXPENSE_TRACKER_DEBUG", "") not in ("", "0")
+METRICS_FILE = os.environ.get("EXPENSE_TRACKER_METRICS_FILE")
+
+@st.cache_resource(show_spinner=False)
+def get_timing_report():
+    return {'cold_start': None, 'runs': deque(maxlen=200)}
+
+# Fonction pour noter le temps écoulé (en ms) depuis le début du script
+def mark_timing(timings, step):
+    timings[step] = (time.perf_counter() - SCRIPT_START) * 1000
+
+# Fonction pour enregistrer les temps d'un affichage et les présenter dans la barre latérale
+# Les mesures de l'affichage sont ajoutées à celles de la session, puis journalisées et exportées
+def report_timings(timings, recorder):
+    previous = 0.0
+    for step in TIMING_STEPS:
+        if step in timings:
+            record_time(TIMING_PHASES[step], (timings[step] - previous) / 1000)
+            previous = timings[step]
+    session_metrics = st.session_state.setdefault('session_metrics', MetricsRecorder())
+    session_metrics.merge(recorder)
+    
+    report = get_timing_report()
+    cold_start = report['cold_start'] is None
+    if cold_start:
+        report['cold_start'] = dict(timings)
+    report['runs'].append(dict(timings))
+    logger.info("timings %s", json.dumps({'cold_start': cold_start, **{k: round(v, 1) for k, v in timings.items()},
+                                          'metrics': metrics_as_dict(recorder)}))
+    if METRICS_FILE:
+        write_metrics_file(METRICS_FILE.format(pid=os.getpid()))
+    
+    with st.sidebar.expander("⏱️ Temps d'affichage"):
+        rows = ["| Étape | Dernier | Médiane | Démarrage |", "|---|---|---|---|"]
+        for step in TIMING_STEPS:
+            samples = [run[step] for run in report['runs'] if step in run]
+            if not samples:
+                continue
+            first = report['cold_start'].get(step)
+            rows.append(f"| {step} | {samples[-1]:.0f} ms | {statistics.median(samples):.0f} ms | "
+                        f"{f'{first:.0f} ms' if first is not None else '-'} |")
+        st.markdown("\n".join(rows))
+        st.caption(f"{len(report['runs'])} affichage(s) mesuré(s) dans ce processus")
     
-    # Trier par date
-    sorted_totals = {k: monthly_totals[k] for k in sorted(monthly_totals.keys(), reverse=True)}
-    return sorted_totals
+    if st.sidebar.checkbox("🐞 Instrumentation", value=DEBUG_METRICS, key="debug_metrics"):
+        report_metrics(recorder, session_metrics)
 
-# Fonction pour calculer les totaux par catégorie
-def calculate_category_totals(receipts):
-    category_totals = {}
-    for receipt in receipts:
-        category = receipt['category']
-        if category in category_totals:
-            category_totals[category] += receipt['total']
-        else:
-            category_totals[category] = receipt['total']
+# Fonction pour présenter les phases et compteurs de l'affichage, de la session et du processus
+def report_metrics(recorder, session_metrics):
+    scopes = [recorder.snapshot(), session_metrics.snapshot(), PROCESS_METRICS.snapshot()]
     
-    # Trier par montant (du plus grand au plus petit)
-    sorted_totals = {k: v for k, v in sorted(category_totals.items(), key=lambda item: item[1], reverse=True)}
-    return sorted_totals
+    with st.sidebar.expander("🐞 Instrumentation", expanded=True):
+        rows = ["| Phase | Affichage | Session | Processus |", "|---|---|---|---|"]
+        for phase in sorted(set().union(*(timers for timers, _ in scopes))):
+            cells = []
+            for timers, _ in scopes:
+                calls, seconds, _ = timers.get(phase, (0, 0.0, 0.0))
+                cells.append(f"{seconds * 1000:.1f} ms ({calls})" if calls else "-")
+            rows.append(f"| {phase} | {' | '.join(cells)} |")
+        st.markdown("\n".join(rows))
+        st.caption("Durée cumulée (nombre d'exécutions). sync comprend scan, parse et index_write.")
+        
+        rows = ["| Compteur | Affichage | Session | Processus |", "|---|---|---|---|"]
+        for name in sorted(set().union(*(counters for _, counters in scopes))):
+            rows.append(f"| {name} | {' | '.join(f'{counters.get(name, 0):,}' for _, counters in scopes)} |")
+        st.markdown("\n".join(rows))
+        
+        prometheus = format_prometheus_scopes([(PROCESS_METRICS, {"scope": "process"}),
+                                               (session_metrics, {"scope": "session"})])
+        st.download_button("Exporter (Prometheus)", prometheus, file_name="expense_tracker_metrics.prom",
+                           mime="text/plain")
+        st.download_button("Exporter (JSON)", json.dumps({
+            'rerun': metrics_as_dict(recorder),
+            'session': metrics_as_dict(session_metrics),
+            'process': metrics_as_dict(PROCESS_METRICS),
+        }, indent=2), file_name="expense_tracker_metrics.json", mime="application/json")
 
-# Fonction pour mettre à jour les données de session
-def update_session_data():
-    st.session_state.receipts = load_all_receipts()
-    st.session_state.monthly_totals = calculate_monthly_totals(st.session_state.receipts)
+# Pagination de la liste des tickets
+PAGE_SIZE_OPTIONS = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+# Nombre maximal de tickets retournés par une recherche plein texte (les plus récents)
+SEARCH_LIMIT = 1000
+
+# Fonction pour rechercher des tickets dans l'index plein texte et retrouver leurs positions dans les colonnes
+# Les filtres (mois, catégorie, montant, période) sont appliqués par l'index, pour ne pas gaspiller la limite
+# Retourne (positions, True si la limite est atteinte) ; les tickets absents de l'instantané sont ignorés
+def find_search_positions(columns, text, **filters):
+    conn = open_receipt_index()
+    try:
+        receipts = search_receipts(conn, text, limit=SEARCH_LIMIT, **filters)
+    finally:
+        conn.close()
+    positions = []
+    for receipt in receipts:
+        position = find_receipt_position(columns, receipt['date'], receipt['year_month'], receipt['filename'])
+        if is_receipt_at(columns, position, receipt['year_month'], receipt['filename']):
+            positions.append(position)
+    return np.array(positions, dtype=np.intp), len(receipts) == SEARCH_LIMIT
 
 # Interface utilisateur
 def main():
+    # Mesures de cet affichage (phases et compteurs de lecture), retirées du fil d'exécution à la fin
+    # de l'affichage : les exécutions de fragments qui suivent ne s'y ajoutent pas
+    recorder = MetricsRecorder()
+    token = activate_recorder(recorder)
+    try:
+        render_page(recorder)
+    finally:
+        deactivate_recorder(token)
+
+def render_page(recorder):
+    timings = {}
+    mark_timing(timings, "Configuration")
     create_folder_structure()
     
     # Titre élégant
     st.markdown("<h1 class='main-header'>Tracker de Dépenses</h1>", unsafe_allow_html=True)
     
-    # Si c'est le premier chargement, charger tous les tickets
-    if not st.session_state.receipts:
-        update_session_data()
+    # Magasin partagé : resynchronisé avec les fichiers au premier chargement de chaque session
+    # Avec la surveillance du dossier, le magasin est déjà à jour : aucune relecture par session
+    store = get_receipt_store()
+    watcher = get_receipt_watcher()
+    writer = get_receipt_writer()
+    if watcher is None and 'store_synced' not in st.session_state:
+        for error in store.refresh():
+            st.warning(error)
+        st.session_state.store_synced = True
+    
+    # Choix du rendu des graphiques
+    chart_backend = st.sidebar.radio("Rendu des graphiques", CHART_BACKENDS,
+                                     index=CHART_BACKENDS.index(DEFAULT_CHART_BACKEND)
+                                     if DEFAULT_CHART_BACKEND in CHART_BACKENDS else 0)
     
     # Disposition en deux colonnes
     col1, col2 = st.columns([2, 3])
@@ -189,7 +366,8 @@ def main():
             
             cols_form2 = st.columns(2)
             with cols_form2[0]:
-                manual_total = st.number_input("Montant total (€)", value=0.0, format="%.2f", min_value=0.0)
+                manual_total = st.number_input("Montant total (€)", value=0.0, format="%.2f", min_value=0.0,
+                                               max_value=cents_to_euros(MAX_AMOUNT_CENTS))
             with cols_form2[1]:
                 # Liste des catégories prédéfinies mais modifiables
                 categories = ["Alimentation", "Transport", "Logement", "Loisirs", "Santé", "Vêtements", "Restaurant", "Autre"]
@@ -201,69 +379,176 @@ def main():
             
             if manual_submitted and manual_enterprise and manual_total > 0:
                 date_str = manual_date.strftime('%Y-%m-%d')
-                year_month, filename = save_receipt_as_markdown(date_str, manual_enterprise, manual_total, manual_category, manual_notes)
-                st.success(f"✅ Ticket '{manual_enterprise}' sauvegardé avec succès!")
+                # Montant saisi en euros, enregistré en centimes
+                # Avec l'écriture différée, le ticket apparaît dans la liste dès que son lot est appliqué
+                try:
+                    if writer is not None:
+                        writer.save(date_str, manual_enterprise, euros_to_cents(manual_total), manual_category,
+                                    manual_notes)
+                    else:
+                        save_receipt_as_markdown(date_str, manual_enterprise, euros_to_cents(manual_total),
+                                                 manual_category, manual_notes, store)
+                except ValueError as e:
+                    st.error(f"❌ Ticket non enregistré : {str(e)}")
+                else:
+                    st.success(f"✅ Ticket '{manual_enterprise}' sauvegardé avec succès!")
+        
+        # Import en masse d'un relevé bancaire
+        with st.expander("📥 Importer un relevé bancaire (CSV / OFX)"):
+            uploaded_statement = st.file_uploader("Relevé bancaire", type=["csv", "ofx", "qfx", "txt"])
+            import_category = st.selectbox("Catégorie par défaut", categories, key="import_category",
+                                           index=categories.index(DEFAULT_IMPORT_CATEGORY))
+            include_credits = st.checkbox("Importer aussi les crédits (montants positifs)")
+            
+            if uploaded_statement is not None and st.button("Importer le relevé"):
+                try:
+                    receipts, generation, stats = import_bank_statement(
+                        uploaded_statement, uploaded_statement.name, import_category, include_credits)
+                except ValueError as e:
+                    st.error(f"❌ Import impossible : {str(e)}")
+                else:
+                    # Même chemin que le watcher (clé mois / nom de fichier) : les tickets qu'il a déjà vus ne sont pas doublés
+                    if receipts:
+                        store.apply_writes(receipts, [], generation)
+                    st.success(f"✅ {stats['imported']} ticket(s) importé(s) depuis '{uploaded_statement.name}' "
+                               f"({stats['skipped']} crédit(s) ignoré(s), {stats['invalid']} ligne(s) invalide(s))")
         
         st.markdown("</div>", unsafe_allow_html=True)
+        mark_timing(timings, "Formulaire")
+        
+        # Instantané des tickets pour ce rendu (inclut un éventuel ticket tout juste enregistré)
+        columns = store.columns
+        aggregates = get_receipt_aggregates(columns)
+        if watcher is not None or writer is not None:
+            follow_receipt_changes(store, columns.version)
         
         # Liste des tickets
         st.markdown("<div class='card'><h2 class='sub-header'>Liste des Tickets</h2>", unsafe_allow_html=True)
         
-        if not st.session_state.receipts:
+        if not len(columns):
             st.info("📝 Aucun ticket enregistré.")
         else:
             # Filtres
             col_filter1, col_filter2 = st.columns(2)
             with col_filter1:
                 # Extraire les mois uniques
-                unique_months = list(set([r['year_month'] for r in st.session_state.receipts]))
-                unique_months.sort(reverse=True)
+                unique_months = sorted((columns.month_labels[code] for code in np.flatnonzero(columns.counts.sum(axis=1))), reverse=True)
                 month_labels = ["Tous les mois"] + [f"{m.split('_')[0]}-{m.split('_')[1]}" for m in unique_months]
                 month_values = ["all"] + unique_months
                 selected_month = st.selectbox("Filtrer par mois", options=month_values, format_func=lambda x: month_labels[month_values.index(x)])
             
             with col_filter2:
                 # Extraire les catégories uniques
-                unique_categories = list(set([r['category'] for r in st.session_state.receipts]))
-                unique_categories.sort()
+                unique_categories = sorted(columns.category_labels[code] for code in np.flatnonzero(columns.counts.sum(axis=0)))
                 category_options = ["Toutes les catégories"] + unique_categories
                 selected_category = st.selectbox("Filtrer par catégorie", options=category_options)
             
-            # Filtrer les tickets
-            filtered_receipts = st.session_state.receipts
+            # Recherche plein texte (entreprise, catégorie et notes, en début de mot) et filtres de montant et de période
+            search_text = st.text_input("🔎 Rechercher", placeholder="Entreprise, catégorie ou notes (ex. rembours)")
+            col_search1, col_search2, col_search3 = st.columns([1, 1, 2])
+            with col_search1:
+                min_total = st.number_input("Montant min (€)", min_value=0.0, max_value=cents_to_euros(MAX_AMOUNT_CENTS),
+                                            value=None, step=1.0, format="%.2f")
+            with col_search2:
+                max_total = st.number_input("Montant max (€)", min_value=0.0, max_value=cents_to_euros(MAX_AMOUNT_CENTS),
+                                            value=None, step=1.0, format="%.2f")
+            with col_search3:
+                date_range = st.date_input("Période", value=[], format="YYYY-MM-DD")
+            date_from = date_range[0] if len(date_range) > 0 else None
+            date_to = date_range[1] if len(date_range) > 1 else None
+            # Montants saisis en euros, comparés en centimes
+            min_cents = euros_to_cents(min_total) if min_total is not None else None
+            max_cents = euros_to_cents(max_total) if max_total is not None else None
+            narrowed = search_query(search_text) is not None or min_total is not None or max_total is not None \
+                or date_from is not None
+            
+            # Filtrer les tickets (masques vectorisés sur les colonnes)
+            mask = np.ones(len(columns), dtype=bool)
             if selected_month != "all":
-                filtered_receipts = [r for r in filtered_receipts if r['year_month'] == selected_month]
+                mask &= columns.month_codes == columns.months[selected_month]
             
             if selected_category != "Toutes les catégories":
-                filtered_receipts = [r for r in filtered_receipts if r['category'] == selected_category]
+                mask &= columns.category_codes == columns.categories[selected_category]
+            
+            if min_cents is not None:
+                mask &= columns.totals >= min_cents
+            if max_cents is not None:
+                mask &= columns.totals <= max_cents
+            if date_from is not None:
+                mask &= columns.dates >= np.datetime64(date_from, 'D')
+            if date_to is not None:
+                mask &= columns.dates <= np.datetime64(date_to, 'D')
+            
+            search_truncated = False
+            if search_query(search_text) is not None:
+                search_positions, search_truncated = find_search_positions(
+                    columns, search_text,
+                    year_month=selected_month if selected_month != "all" else None,
+                    category=selected_category if selected_category != "Toutes les catégories" else None,
+                    min_total=min_cents, max_total=max_cents,
+                    date_from=date_from.isoformat() if date_from else None,
+                    date_to=date_to.isoformat() if date_to else None)
+                search_mask = np.zeros(len(columns), dtype=bool)
+                search_mask[search_positions] = True
+                mask &= search_mask
+            
+            filtered_positions = np.flatnonzero(mask)
             
             # Afficher le nombre de tickets filtrés
-            st.write(f"🧾 {len(filtered_receipts)} ticket(s) trouvé(s)")
+            st.write(f"🧾 {len(filtered_positions)} ticket(s) trouvé(s)")
+            if search_truncated:
+                st.caption(f"Seuls les {SEARCH_LIMIT} tickets les plus récents correspondant à la recherche sont affichés.")
+            
+            # Regrouper les tickets par mois (du plus récent au plus ancien), l'ordre par date est conservé
+            month_ranks = np.zeros(len(columns.month_labels), dtype=np.intp)
+            month_ranks[[columns.months[m] for m in aggregates.months]] = np.arange(len(aggregates.months))
+            filtered_positions = filtered_positions[
+                np.argsort(-month_ranks[columns.month_codes[filtered_positions]], kind='stable')]
+            
+            # Pagination : seuls les tickets de la page affichée sont transformés en widgets
+            col_page1, col_page2 = st.columns(2)
+            with col_page1:
+                page_size = st.selectbox("Tickets par page", options=PAGE_SIZE_OPTIONS,
+                                         index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE))
+            with col_page2:
+                page_count = max(1, -(-len(filtered_positions) // page_size))
+                page = st.number_input(f"Page (sur {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+            page_positions = filtered_positions[(page - 1) * page_size:page * page_size]
             
-            # Grouper par mois
-            months = {}
-            for receipt in filtered_receipts:
-                if receipt['year_month'] not in months:
-                    months[receipt['year_month']] = []
-                months[receipt['year_month']].append(receipt)
+            # Grouper la page par mois
+            page_month_codes = columns.month_codes[page_positions]
+            boundaries = np.flatnonzero(np.diff(page_month_codes)) + 1
+            sorted_months = [
+                (columns.month_labels[columns.month_codes[group[0]]], group)
+                for group in np.split(page_positions, boundaries) if len(group)
+            ]
             
             # Afficher par mois
-            sorted_months = sorted(months.items(), reverse=True)
-            for i, (month, receipts) in enumerate(sorted_months):
+            for i, (month, positions) in enumerate(sorted_months):
                 year, month_num = month.split('_')
                 month_name = datetime(int(year), int(month_num), 1).strftime('%B %Y').capitalize()
-                monthly_total = sum(r['total'] for r in receipts)
+                # Total du mois lu dans le tableau croisé (restreint à la catégorie filtrée), sur toute la sélection
+                # Avec une recherche ou un filtre de montant ou de période : somme des tickets retenus du mois
+                month_position = aggregates.month_positions[month]
+                if narrowed:
+                    monthly_total = columns.totals[
+                        filtered_positions[columns.month_codes[filtered_positions] == columns.months[month]]].sum()
+                elif selected_category != "Toutes les catégories":
+                    monthly_total = aggregates.crosstab[month_position, aggregates.category_positions[selected_category]]
+                else:
+                    monthly_total = aggregates.monthly_totals[month_position]
+                receipts = [columns.receipt(position) for position in positions]
                 
                 # On garde le premier mois déroulé, les autres seront fermés par défaut
                 is_expanded = (i == 0)
                 
-                with st.expander(f"📅 {month_name} - Total: {monthly_total:.2f}€", expanded=is_expanded):
+                with st.expander(f"📅 {month_name} - Total: {format_amount(monthly_total)}€", expanded=is_expanded):
                     for receipt in receipts:
                         # Format simple pour les tickets
                         st.markdown(f"""
                         <div class='ticket-text'>
                             <strong>{receipt['date']}</strong> | {receipt['enterprise']} | 
-                            <span style='color:#1E88E5'>{receipt['total']:.2f}€</span> | 
+                            <span style='color:#1E88E5'>{format_amount(receipt['total'])}€</span> | 
                             <span style='background-color:#e3f2fd; padding:2px 8px; border-radius:12px; font-size:0.8em'>{receipt['category']}</span>
                         </div>
                         """, unsafe_allow_html=True)
@@ -278,74 +563,42 @@ def main():
                         
                         with col_btn2:
                             if st.button("🗑️ Supprimer", key=f"delete_{receipt['year_month']}_{receipt['filename']}"):
-                                if delete_receipt(receipt['year_month'], receipt['filename']):
+                                if writer is not None:
+                                    writer.delete(receipt['year_month'], receipt['filename'])
+                                    st.rerun()
+                                elif delete_receipt(receipt['year_month'], receipt['filename'], store):
                                     st.rerun()
         
         st.markdown("</div>", unsafe_allow_html=True)
+        mark_timing(timings, "Liste des tickets")
     
     with col2:
         st.markdown("<div class='card'><h2 class='sub-header'>Statistiques & Graphiques</h2>", unsafe_allow_html=True)
         
         # Afficher graphique des dépenses mensuelles avec un design amélioré
-        if st.session_state.monthly_totals:
-            # Préparation des données
-            months = list(st.session_state.monthly_totals.keys())
-            totals = list(st.session_state.monthly_totals.values())
+        if aggregates.months:
+            # Préparation des données (mois déjà triés chronologiquement, montants convertis en euros)
+            totals = cents_to_euros(aggregates.monthly_totals)
             
             # Convertir les clés année_mois en dates lisibles
             readable_months = []
-            for m in months:
+            for m in aggregates.months:
                 year, month = m.split('_')
                 month_name = datetime(int(year), int(month), 1).strftime('%b %y')
                 readable_months.append(month_name)
             
-            # Créer le dataframe
-            df = pd.DataFrame({
-                'Mois': readable_months,
-                'Total': totals,
-                'Mois_Sort': [datetime.strptime(f"{m.split('_')[0]}-{m.split('_')[1]}", '%Y-%m') for m in months]
-            })
-            
-            # Trier par date
-            df = df.sort_values(by='Mois_Sort')
-            
-            # Onglets pour différents graphiques
-            tab1, tab2 = st.tabs(["📊 Évolution Mensuelle", "🔄 Répartition par Catégorie"])
+            # Vues statistiques : seule la vue sélectionnée est calculée et rendue
+            # (st.tabs exécuterait le contenu de tous les onglets à chaque affichage)
+            selected_view = st.radio("Vue", STATS_VIEWS, horizontal=True, label_visibility="collapsed")
             
-            with tab1:
-                # Créer le graphique des dépenses mensuelles
-                fig, ax = plt.subplots(figsize=(10, 6))
-                
-                # Palette de couleurs élégante
-                bars = ax.bar(df['Mois'], df['Total'], color=sns.color_palette("viridis", len(df)))
-                
-                ax.set_title('Évolution des Dépenses Mensuelles', fontsize=16, fontweight='bold', pad=20)
-                ax.set_xlabel('Mois', fontsize=12)
-                ax.set_ylabel('Montant (€)', fontsize=12)
-                
-                # Améliorer l'apparence
-                ax.spines['top'].set_visible(False)
-                ax.spines['right'].set_visible(False)
-                ax.spines['left'].set_color('#DDDDDD')
-                ax.spines['bottom'].set_color('#DDDDDD')
-                ax.tick_params(bottom=False, left=False)
-                
-                # Ajouter une grille légère
-                ax.yaxis.grid(True, color='#EEEEEE')
-                ax.xaxis.grid(False)
-                
-                # Rotation des labels
-                plt.xticks(rotation=45, ha='right')
-                
-                # Ajouter les valeurs sur les barres
-                for i, bar in enumerate(bars):
-                    height = bar.get_height()
-                    ax.text(bar.get_x() + bar.get_width()/2., height + max(totals)*0.02,
-                           f"{height:.2f}€",
-                           ha='center', va='bottom', fontweight='bold', color='#1E88E5')
-                
-                plt.tight_layout()
-                st.pyplot(fig)
+            if selected_view == MONTHLY_VIEW:
+                # Graphique des dépenses mensuelles (rendu mis en cache selon les données)
+                if chart_backend == NATIVE_CHART_BACKEND:
+                    st.vega_lite_chart(spec=monthly_chart_spec(tuple(readable_months), tuple(totals.tolist())),
+                                       use_container_width=True)
+                else:
+                    st.image(render_monthly_chart(tuple(readable_months), tuple(totals.tolist())),
+                             use_column_width=True)
                 
                 # Statistiques en cartes élégantes
                 st.markdown("<h3 style='text-align:center; margin:20px 0;'>Vue d'ensemble</h3>", unsafe_allow_html=True)
@@ -353,41 +606,37 @@ def main():
                 stats_col1, stats_col2, stats_col3 = st.columns(3)
                 
                 with stats_col1:
-                    total_depense = sum(totals)
+                    total_depense = format_amount(aggregates.total)
                     st.markdown(f"""
                     <div style='text-align:center; padding:20px; background-color:white; border-radius:10px; box-shadow:0 2px 5px rgba(0,0,0,0.05);'>
                         <div class='metric-label'>Total des dépenses</div>
-                        <div class='metric-value'>{total_depense:.2f}€</div>
+                        <div class='metric-value'>{total_depense}€</div>
                     </div>
                     """, unsafe_allow_html=True)
                 
                 with stats_col2:
-                    avg_mensuel = sum(totals)/len(totals) if totals else 0
+                    avg_mensuel = format_amount(round(aggregates.monthly_average))
                     st.markdown(f"""
                     <div style='text-align:center; padding:20px; background-color:white; border-radius:10px; box-shadow:0 2px 5px rgba(0,0,0,0.05);'>
                         <div class='metric-label'>Moyenne mensuelle</div>
-                        <div class='metric-value'>{avg_mensuel:.2f}€</div>
+                        <div class='metric-value'>{avg_mensuel}€</div>
                     </div>
                     """, unsafe_allow_html=True)
                 
                 with stats_col3:
-                    max_mensuel = max(totals) if totals else 0
-                    max_month = readable_months[totals.index(max_mensuel)] if totals else ""
+                    max_mensuel = format_amount(aggregates.monthly_totals[aggregates.max_month])
+                    max_month = readable_months[aggregates.max_month]
                     st.markdown(f"""
                     <div style='text-align:center; padding:20px; background-color:white; border-radius:10px; box-shadow:0 2px 5px rgba(0,0,0,0.05);'>
                         <div class='metric-label'>Mois le plus coûteux</div>
-                        <div class='metric-value'>{max_mensuel:.2f}€</div>
+                        <div class='metric-value'>{max_mensuel}€</div>
                         <div style='font-size:14px; color:#757575;'>{max_month}</div>
                     </div>
                     """, unsafe_allow_html=True)
                 
                 # Tendance des 3 derniers mois
-                if len(totals) >= 3:
-                    last_3_months = totals[:3]  # Les données sont déjà triées du plus récent au plus ancien
-                    last_3_months_avg = sum(last_3_months) / 3
-                    overall_avg = avg_mensuel
-                    
-                    trend_percentage = ((last_3_months_avg - overall_avg) / overall_avg * 100) if overall_avg > 0 else 0
+                if aggregates.trend_percentage is not None:
+                    trend_percentage = aggregates.trend_percentage
                     
                     trend_color = "#EF5350" if trend_percentage > 0 else "#66BB6A"
                     trend_icon = "↑" if trend_percentage > 0 else "↓"
@@ -401,45 +650,21 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
             
-            with tab2:
-                # Calculer les totaux par catégorie
-                category_totals = calculate_category_totals(st.session_state.receipts)
+            elif selected_view == CATEGORY_VIEW:
+                # Calculer les totaux par catégorie (en centimes)
+                category_totals = calculate_category_totals(columns)
+                category_euros = tuple(cents_to_euros(amount) for amount in category_totals.values())
                 
                 if category_totals:
-                    # Créer le dataframe
-                    df_cat = pd.DataFrame({
-                        'Catégorie': list(category_totals.keys()),
-                        'Total': list(category_totals.values())
-                    })
-                    
-                    # Créer le graphique en camembert
-                    fig, ax = plt.subplots(figsize=(10, 7))
+                    # Graphique en anneau (rendu mis en cache selon les données)
+                    if chart_backend == NATIVE_CHART_BACKEND:
+                        st.vega_lite_chart(spec=category_chart_spec(tuple(category_totals), category_euros),
+                                           use_container_width=True)
+                    else:
+                        st.image(render_category_chart(tuple(category_totals), category_euros),
+                                 use_column_width=True)
                     
-                    # Utiliser une belle palette de couleurs
-                    colors = sns.color_palette('viridis', len(df_cat))
-                    
-                    wedges, texts, autotexts = ax.pie(
-                        df_cat['Total'], 
-                        labels=list(df_cat['Catégorie']), #None,
-                        autopct='',
-                        startangle=90,
-                        colors=colors,
-                        wedgeprops=dict(width=0.5, edgecolor='w')
-                    )
-                    
-                    # Calculer le pourcentage pour chaque catégorie
-                    total_amount = sum(df_cat['Total'])
-                    percentages = [(amount/total_amount)*100 for amount in df_cat['Total']]
-                    
-                    # Ajouter une légende élégante
-                    legend_labels = [f"{cat} ({per:.1f}% - {amount:.2f}€)" for cat, per, amount in zip(df_cat['Catégorie'], percentages, df_cat['Total'])]
-                    ax.legend(wedges, legend_labels, title="Catégories", loc="best", bbox_to_anchor=(1, 0, 0.5, 1))
-                    
-                    plt.title('Répartition des Dépenses par Catégorie', fontsize=16, fontweight='bold', pad=20)
-                    ax.set_aspect('equal')
-                    
-                    plt.tight_layout()
-                    st.pyplot(fig)
+                    total_amount = sum(category_totals.values())
                     
                     # Top 3 des catégories les plus coûteuses
                     st.markdown("<h3 style='text-align:center; margin:20px 0;'>Top 3 des catégories</h3>", unsafe_allow_html=True)
@@ -454,16 +679,31 @@ def main():
                                 st.markdown(f"""
                                 <div style='text-align:center; padding:15px; background-color:white; border-radius:10px; box-shadow:0 2px 5px rgba(0,0,0,0.05);'>
                                     <div style='font-size:14px; color:#757575;'>{i+1}. {cat}</div>
-                                    <div class='metric-value'>{amount:.2f}€</div>
+                                    <div class='metric-value'>{format_amount(amount)}€</div>
                                     <div style='font-size:14px; color:#1E88E5;'>{percent:.1f}% du total</div>
                                 </div>
                                 """, unsafe_allow_html=True)
                 else:
                     st.info("Aucune donnée de catégorie disponible pour afficher le graphique.")
+            
+            else:
+                # Tableau croisé mois × catégorie avec moyenne glissante et évolution sur un an
+                import pandas as pd
+                
+                df_detail = pd.DataFrame(cents_to_euros(aggregates.crosstab), columns=aggregates.categories)
+                df_detail.insert(0, 'Mois', readable_months)
+                df_detail.insert(1, 'Tickets', aggregates.monthly_counts)
+                df_detail.insert(2, 'Total (€)', totals)
+                df_detail.insert(3, 'Moyenne 3 mois (€)', cents_to_euros(aggregates.rolling_averages))
+                df_detail.insert(4, 'Sur un an (%)', aggregates.year_over_year)
+                
+                # Du plus récent au plus ancien, comme la liste des tickets
+                st.dataframe(df_detail.iloc[::-1].round(2), hide_index=True, use_container_width=True)
         else:
             st.info("Aucune donnée disponible pour afficher les graphiques.")
         
         st.markdown("</div>", unsafe_allow_html=True)
+        mark_timing(timings, "Statistiques")
         
         # Afficher le contenu d'un ticket si demandé
         if 'viewing_receipt' in st.session_state:
@@ -480,6 +720,12 @@ def main():
                 del st.session_state.viewing_title
                 st.rerun()
             st.markdown("</div>", unsafe_allow_html=True)
+    
+    mark_timing(timings, "Total")
+    report_timings(timings, recorder)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if runtime.exists():
+        main()
+    else:
+        cli.main(sys.argv[1:])
\ No newline at end of file
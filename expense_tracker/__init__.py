@@ -0,0 +1,13 @@
+"""Tracker de Dépenses : stockage, agrégats et import des tickets, utilisables sans Streamlit.
+
+Seul le stockage est exposé ici ; numpy n'est importé qu'avec expense_tracker.store
+et expense_tracker.aggregates.
+"""
+
+from expense_tracker.storage import (
+    create_folder_structure,
+    delete_receipt,
+    load_all_receipts,
+    save_receipt_as_markdown,
+    view_receipt,
+)
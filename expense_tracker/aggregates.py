@@ -0,0 +1,119 @@
+"""Agrégats des tickets calculés à partir du tableau (mois, catégorie) du magasin, ou des récapitulatifs mensuels.
+
+Les montants sont en centimes : totaux entiers (exacts), moyennes à virgule.
+"""
+
+import numpy as np
+
+from expense_tracker.metrics import timed
+from expense_tracker.rollups import read_month_rollups
+
+# Agrégats des tickets (totaux mensuels, par catégorie, tableau croisé, tendances)
+# Tout est dérivé du tableau (mois, catégorie) tenu à jour par le magasin : aucune boucle par ticket
+# (ou d'un RollupTable, reconstitué à partir des récapitulatifs mensuels sans charger les tickets)
+class ReceiptAggregates:
+    def __init__(self, columns, window=3):
+        month_counts = columns.counts.sum(axis=1)
+        category_counts = columns.counts.sum(axis=0)
+        
+        # Mois présents triés chronologiquement, catégories triées par montant décroissant
+        month_codes = np.array(sorted(np.flatnonzero(month_counts), key=lambda code: columns.month_labels[code]),
+                               dtype=np.intp)
+        category_codes = np.flatnonzero(category_counts)
+        category_codes = category_codes[np.argsort(-columns.sums.sum(axis=0)[category_codes], kind='stable')]
+        
+        self.months = [columns.month_labels[code] for code in month_codes]
+        self.categories = [columns.category_labels[code] for code in category_codes]
+        self.month_positions = {month: i for i, month in enumerate(self.months)}
+        self.category_positions = {category: i for i, category in enumerate(self.categories)}
+        
+        # Tableau croisé mois × catégorie (montants et nombres de tickets)
+        self.crosstab = columns.sums[np.ix_(month_codes, category_codes)]
+        self.crosstab_counts = columns.counts[np.ix_(month_codes, category_codes)]
+        
+        self.monthly_totals = self.crosstab.sum(axis=1)
+        self.monthly_counts = self.crosstab_counts.sum(axis=1)
+        self.category_totals = self.crosstab.sum(axis=0)
+        self.category_counts = self.crosstab_counts.sum(axis=0)
+        
+        self.total = int(self.monthly_totals.sum())
+        self.monthly_average = self.total / len(self.months) if self.months else 0.0
+        self.rolling_averages = rolling_average(self.monthly_totals, window)
+        self.year_over_year = year_over_year(self.months, self.monthly_totals)
+        
+        # Mois le plus coûteux (le plus récent en cas d'égalité)
+        if self.months:
+            self.max_month = len(self.months) - 1 - int(np.argmax(self.monthly_totals[::-1]))
+        else:
+            self.max_month = None
+        
+        # Tendance des derniers mois par rapport à la moyenne mensuelle
+        if len(self.months) >= window and self.monthly_average > 0:
+            recent_average = self.monthly_totals[-window:].mean()
+            self.trend_percentage = float((recent_average - self.monthly_average) / self.monthly_average * 100)
+        elif len(self.months) >= window:
+            self.trend_percentage = 0.0
+        else:
+            self.trend_percentage = None
+
+# Fonction pour calculer une moyenne glissante (fenêtre partielle sur les premiers mois)
+def rolling_average(values, window):
+    cumulative = np.concatenate(([0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+# Fonction pour calculer l'évolution sur un an (en %, NaN si le mois de l'année précédente manque)
+def year_over_year(months, totals):
+    indexes = np.array([int(m.split('_')[0]) * 12 + int(m.split('_')[1]) - 1 for m in months], dtype=np.int64)
+    previous = np.searchsorted(indexes, indexes - 12)
+    found = previous < len(indexes)
+    found[found] = indexes[previous[found]] == indexes[found] - 12
+    changes = np.full(len(months), np.nan)
+    previous_totals = totals[previous[found]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        changes[found] = np.where(previous_totals > 0, (totals[found] - previous_totals) / previous_totals * 100, np.nan)
+    return changes
+
+# Fonction pour obtenir les agrégats d'un instantané (calculés une fois, puis partagés par toutes les sessions)
+def get_receipt_aggregates(columns):
+    aggregates = getattr(columns, 'aggregates', None)
+    if aggregates is None:
+        with timed("aggregate"):
+            aggregates = columns.aggregates = ReceiptAggregates(columns)
+    return aggregates
+
+# Fonction pour calculer les totaux mensuels (en centimes)
+def calculate_monthly_totals(columns):
+    aggregates = get_receipt_aggregates(columns)
+    
+    # Trier par date (plus récent au plus ancien)
+    return {month: int(total) for month, total in zip(aggregates.months[::-1], aggregates.monthly_totals[::-1])}
+
+# Fonction pour calculer les totaux par catégorie (en centimes)
+def calculate_category_totals(columns):
+    aggregates = get_receipt_aggregates(columns)
+    
+    # Déjà trié par montant (du plus grand au plus petit)
+    return {category: int(total) for category, total in zip(aggregates.categories, aggregates.category_totals)}
+
+# Tableau (mois, catégorie) reconstitué à partir des récapitulatifs, sous la forme attendue par ReceiptAggregates
+class RollupTable:
+    def __init__(self, rollups):
+        self.month_labels = sorted(rollups)
+        self.category_labels = sorted({category for rollup in rollups.values() for category in rollup['categories']})
+        category_positions = {category: i for i, category in enumerate(self.category_labels)}
+        
+        shape = (len(self.month_labels), len(self.category_labels))
+        self.sums = np.zeros(shape, dtype=np.int64)
+        self.counts = np.zeros(shape, dtype=np.int64)
+        for i, year_month in enumerate(self.month_labels):
+            for category, cell in rollups[year_month]['categories'].items():
+                self.sums[i, category_positions[category]] = cell['sum']
+                self.counts[i, category_positions[category]] = cell['count']
+        self.minimums = np.array([rollups[m]['min'] for m in self.month_labels], dtype=np.int64)
+        self.maximums = np.array([rollups[m]['max'] for m in self.month_labels], dtype=np.int64)
+
+# Fonction pour lire les récapitulatifs sous forme de tableau (mois, catégorie)
+def load_rollup_table():
+    return RollupTable(read_month_rollups())
@@ -0,0 +1,154 @@
+"""Archives des mois terminés : un seul fichier `receipts/AAAA_MM.pack` par mois au lieu d'un fichier par ticket.
+
+Format (en ajout seul) :
+    en-tête    PACK_MAGIC, position et longueur de la table (24 octets)
+    données    contenus Markdown des tickets, les uns à la suite des autres
+    table      JSON {nom de fichier: [position, longueur, date, entreprise, total, catégorie, notes]}
+
+Les totaux de la table sont en centimes.
+
+Supprimer un ticket ajoute une nouvelle table en fin de fichier puis réécrit l'en-tête :
+une interruption entre les deux laisse l'archive dans son état précédent.
+"""
+
+import os
+import json
+import struct
+import functools
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+from expense_tracker.files import replace_file
+from expense_tracker.metrics import count
+
+PACK_MAGIC = b"ETPACK02"
+PACK_HEADER = struct.Struct("<8sQQ")
+PACK_SUFFIX = ".pack"
+
+# Fonction pour obtenir le chemin de l'archive d'un mois
+def pack_path(year_month):
+    return os.path.join("receipts", year_month + PACK_SUFFIX)
+
+# Fonction pour obtenir la signature (mtime, taille) d'une archive (None si elle n'existe pas)
+def pack_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def read_pack_header(f):
+    magic, table_offset, table_length = PACK_HEADER.unpack(f.read(PACK_HEADER.size))
+    if magic != PACK_MAGIC:
+        raise ValueError(f"{f.name} n'est pas une archive de tickets")
+    return table_offset, table_length
+
+# Table d'une archive, mise en cache tant que l'archive n'a pas changé (la signature fait partie de la clé)
+@functools.lru_cache(maxsize=64)
+def read_pack_table_at(path, signature):
+    with open(path, 'rb') as f:
+        table_offset, table_length = read_pack_header(f)
+        f.seek(table_offset)
+        data = f.read(table_length)
+    count("files_read")
+    count("bytes_read", len(data))
+    return json.loads(data.decode('utf-8'))
+
+# Fonction pour lire la table d'une archive : (signature, {nom: entrée}), ou (None, {}) si elle n'existe pas
+def read_pack_table(path):
+    signature = pack_signature(path)
+    if signature is None:
+        return None, {}
+    return signature, read_pack_table_at(path, signature)
+
+# Fonction pour lire le contenu Markdown d'un ticket archivé (None s'il n'est pas dans l'archive)
+def read_packed_receipt(path, filename):
+    _, table = read_pack_table(path)
+    entry = table.get(filename)
+    if entry is None:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(entry[0])
+        data = f.read(entry[1])
+    count("bytes_read", len(data))
+    return data.decode('utf-8')
+
+# Fonction pour écrire une archive complète (fichier temporaire puis remplacement atomique)
+# Reçoit des couples (contenu Markdown, ticket) ; l'archive est sur le disque au retour (dossier compris)
+def write_receipt_pack(path, items):
+    table = {}
+    with replace_file(path) as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, 0, 0))
+        for content, receipt in items:
+            data = content.encode('utf-8')
+            table[receipt['filename']] = [f.tell(), len(data), receipt['date'], receipt['enterprise'],
+                                          receipt['total'], receipt['category'], receipt.get('notes', "")]
+            f.write(data)
+        write_pack_table(f, table)
+    return table
+
+# Fonction pour ajouter une table en fin d'archive puis pointer l'en-tête dessus
+def write_pack_table(f, table):
+    data = json.dumps(table, ensure_ascii=False).encode('utf-8')
+    f.seek(0, os.SEEK_END)
+    table_offset = f.tell()
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    f.seek(0)
+    f.write(PACK_HEADER.pack(PACK_MAGIC, table_offset, len(data)))
+    f.flush()
+    os.fsync(f.fileno())
+
+# Fonction pour obtenir le fichier de verrou d'une archive (data/AAAA_MM.pack.lock, toujours présent une fois créé)
+def pack_lock_path(path):
+    return os.path.join("data", os.path.basename(path) + ".lock")
+
+# Verrou exclusif pendant la réécriture d'une archive
+# Le fichier de verrou sépare deux archivages du même mois, même avant la création de l'archive ;
+# l'archive elle-même, si elle existe, est aussi verrouillée pour attendre les suppressions en cours
+@contextlib.contextmanager
+def lock_receipt_pack(path):
+    os.makedirs("data", exist_ok=True)
+    with open(pack_lock_path(path), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            yield
+            return
+        with f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+# Fonction pour retirer un ticket d'une archive ; retourne la table restante (None si le ticket est absent)
+def remove_packed_receipt(path, filename):
+    while True:
+        try:
+            f = open(path, 'r+b')
+        except FileNotFoundError:
+            return None
+        with f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # L'archive a pu être réécrite ou supprimée pendant l'attente du verrou : recommencer
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    return None
+                if current != os.fstat(f.fileno()).st_ino:
+                    continue
+            table_offset, table_length = read_pack_header(f)
+            f.seek(table_offset)
+            table = json.loads(f.read(table_length).decode('utf-8'))
+            if filename not in table:
+                return None
+            del table[filename]
+            write_pack_table(f, table)
+        return table
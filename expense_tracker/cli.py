@@ -0,0 +1,290 @@
+"""Ligne de commande : consultation, totaux, export et import des tickets (sans Streamlit).
+
+    python -m expense_tracker list --month 2025-03
+    python -m expense_tracker totals --by category
+    python -m expense_tracker --no-sync overview
+    python -m expense_tracker search rembours --min 20 --from 2025-01-01
+    python -m expense_tracker export --format jsonl --output tickets.jsonl
+    python -m expense_tracker import releve.csv
+    python -m expense_tracker pack --before 2025-01
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime
+from contextlib import closing
+
+from expense_tracker.archive import pack_path
+from expense_tracker.importer import DEFAULT_IMPORT_CATEGORY, import_bank_statement
+from expense_tracker.journal import replay_receipt_journal
+from expense_tracker.metrics import PROCESS_METRICS, format_prometheus, metrics_as_dict, timed
+from expense_tracker.money import cents_to_euros, format_amount, parse_amount
+from expense_tracker.rollups import read_month_rollups
+from expense_tracker.storage import (
+    create_folder_structure,
+    indexed_totals,
+    is_month_folder,
+    iter_indexed_receipts,
+    open_receipt_index,
+    open_synced_receipt_index,
+    pack_closed_months,
+    pack_receipt_month,
+    search_receipts,
+)
+
+RECEIPT_FIELDS = ['date', 'enterprise', 'total', 'category', 'year_month', 'filename']
+
+# Fonction pour ouvrir l'index, synchronisé avec les fichiers sauf avec --no-sync
+# Les fichiers illisibles sont signalés sur la sortie d'erreur sans interrompre la commande
+def open_index(args):
+    if args.no_sync:
+        return open_receipt_index()
+    # Opérations acquittées par l'application mais pas encore appliquées (arrêt brutal)
+    replay_receipt_journal()
+    errors = []
+    conn = open_synced_receipt_index(errors, args.workers)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return conn
+
+# Fonction pour lire un mois saisi en AAAA-MM (ou AAAA_MM, nom du dossier)
+def month_argument(value):
+    month = value.replace("-", "_")
+    if not is_month_folder(month):
+        raise argparse.ArgumentTypeError(f"mois invalide : {value} (format attendu AAAA-MM)")
+    return month
+
+# Fonction pour lire une date saisie en AAAA-MM-JJ
+def date_argument(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"date invalide : {value} (format attendu AAAA-MM-JJ)")
+
+# Fonction pour lire un montant saisi en euros ("12.50", "12,50") ; retourne des centimes
+def amount_argument(value):
+    try:
+        return parse_amount(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"montant invalide : {value}")
+
+# Fonction pour exprimer le total d'un ticket en euros : texte "12.50" (CSV) ou nombre 12.5 (JSON)
+def receipt_in_euros(receipt, as_text):
+    return {**receipt, 'total': format_amount(receipt['total']) if as_text else cents_to_euros(receipt['total'])}
+
+# Fonction pour écrire des tickets au fil de l'eau (texte, CSV, JSON ou JSON Lines)
+def write_receipts(receipts, output, output_format):
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=RECEIPT_FIELDS)
+        writer.writeheader()
+        writer.writerows(receipt_in_euros(receipt, True) for receipt in receipts)
+    elif output_format == "jsonl":
+        for receipt in receipts:
+            output.write(json.dumps(receipt_in_euros(receipt, False), ensure_ascii=False) + "\n")
+    elif output_format == "json":
+        # Tableau JSON écrit élément par élément, sans construire la liste en mémoire
+        output.write("[")
+        for i, receipt in enumerate(receipts):
+            output.write(("," if i else "") + "\n  " + json.dumps(receipt_in_euros(receipt, False), ensure_ascii=False))
+        output.write("\n]\n")
+    else:
+        for receipt in receipts:
+            output.write(f"{receipt['date']}  {format_amount(receipt['total']):>10}€  {receipt['category']:<15}  "
+                         f"{receipt['enterprise']}\n")
+
+# Fonction pour limiter le nombre de tickets parcourus
+def take(receipts, limit):
+    for i, receipt in enumerate(receipts):
+        if limit is not None and i >= limit:
+            break
+        yield receipt
+
+def list_command(args):
+    with closing(open_index(args)) as conn:
+        receipts = iter_indexed_receipts(conn, args.month, args.category)
+        write_receipts(take(receipts, args.limit), sys.stdout, args.format)
+
+def search_command(args):
+    with closing(open_index(args)) as conn:
+        receipts = search_receipts(conn, " ".join(args.text), args.month, args.category, args.min, args.max,
+                                   args.date_from, args.date_to, args.limit)
+    write_receipts(receipts, sys.stdout, args.format)
+
+def totals_command(args):
+    with closing(open_index(args)) as conn:
+        rows = list(indexed_totals(conn, args.by))
+    
+    if args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow([args.by, "count", "total"])
+        writer.writerows((key, count, format_amount(total)) for key, count, total in rows)
+    elif args.format == "json":
+        json.dump([{args.by: key, 'count': count, 'total': cents_to_euros(total)} for key, count, total in rows],
+                  sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for key, count, total in rows:
+            print(f"{key:<20} {count:>6} ticket(s) {format_amount(total):>12}€")
+        print(f"{'Total':<20} {sum(row[1] for row in rows):>6} ticket(s) {format_amount(sum(row[2] for row in rows)):>12}€")
+
+# Vue d'ensemble calculée à partir des récapitulatifs mensuels (un fichier par mois, sans lire les tickets)
+def overview_command(args):
+    # numpy n'est chargé que pour cette commande
+    from expense_tracker.aggregates import ReceiptAggregates, RollupTable
+    
+    if not args.no_sync:
+        # Synchroniser l'index, et donc les récapitulatifs, avec les fichiers
+        open_index(args).close()
+    rollups = read_month_rollups()
+    aggregates = ReceiptAggregates(RollupTable(rollups))
+    top_categories = [
+        {'category': category, 'total': int(total),
+         'percent': round(int(total) / aggregates.total * 100, 1) if aggregates.total else 0.0}
+        for category, total in zip(aggregates.categories[:3], aggregates.category_totals[:3])
+    ]
+    
+    if args.format == "json":
+        json.dump({
+            'total': cents_to_euros(aggregates.total),
+            'count': int(aggregates.monthly_counts.sum()),
+            'monthly_average': round(cents_to_euros(aggregates.monthly_average), 2),
+            'max_month': aggregates.months[aggregates.max_month] if aggregates.months else None,
+            'trend_percentage': None if aggregates.trend_percentage is None else round(aggregates.trend_percentage, 1),
+            'top_categories': [{**category, 'total': cents_to_euros(category['total'])} for category in top_categories],
+            'months': [{'year_month': month, 'count': rollups[month]['count'],
+                        **{key: cents_to_euros(rollups[month][key]) for key in ('sum', 'min', 'max')}}
+                       for month in aggregates.months],
+        }, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+        return
+    
+    if not aggregates.months:
+        print("Aucun ticket enregistré")
+        return
+    max_month = aggregates.months[aggregates.max_month]
+    print(f"Total des dépenses     {format_amount(aggregates.total):>12}€  ({int(aggregates.monthly_counts.sum())} ticket(s), "
+          f"{len(aggregates.months)} mois)")
+    print(f"Moyenne mensuelle      {format_amount(round(aggregates.monthly_average)):>12}€")
+    print(f"Mois le plus coûteux   {format_amount(aggregates.monthly_totals[aggregates.max_month]):>12}€  ({max_month})")
+    if aggregates.trend_percentage is not None:
+        print(f"Tendance sur 3 mois    {aggregates.trend_percentage:>+11.1f} %  (par rapport à la moyenne)")
+    for i, category in enumerate(top_categories):
+        print(f"{i + 1}. {category['category']:<20} {format_amount(category['total']):>12}€  ({category['percent']:.1f} %)")
+    print()
+    for month in reversed(aggregates.months):
+        rollup = rollups[month]
+        print(f"{month:<8} {rollup['count']:>6} ticket(s) {format_amount(rollup['sum']):>12}€  "
+              f"min {format_amount(rollup['min']):>9}€  max {format_amount(rollup['max']):>9}€")
+
+def export_command(args):
+    with closing(open_index(args)) as conn:
+        receipts = iter_indexed_receipts(conn, args.month, args.category)
+        if args.output in (None, "-"):
+            write_receipts(receipts, sys.stdout, args.format)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                write_receipts(receipts, f, args.format)
+
+def import_command(args):
+    for path in args.files:
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            _, _, stats = import_bank_statement(f, path, args.category, args.include_credits)
+        print(f"{path} : {stats['imported']} ticket(s) importé(s), {stats['skipped']} crédit(s) ignoré(s), "
+              f"{stats['invalid']} ligne(s) invalide(s) en {time.perf_counter() - start:.1f}s")
+
+def pack_command(args):
+    errors = []
+    if args.month:
+        if args.month >= datetime.now().strftime('%Y_%m'):
+            raise SystemExit(f"Le mois {args.month} n'est pas terminé : seuls les mois passés sont archivés")
+        packed = {args.month: pack_receipt_month(args.month, errors)}
+    else:
+        packed = pack_closed_months(args.before, errors)
+    for error in errors:
+        print(error, file=sys.stderr)
+    for year_month, count in packed.items():
+        print(f"{year_month} : {count} ticket(s) archivé(s) dans {pack_path(year_month)}")
+    print(f"{sum(packed.values())} ticket(s) archivé(s) au total")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="expense_tracker", description="Tracker de Dépenses en ligne de commande")
+    parser.add_argument("--root", help="dossier de l'application (contenant receipts/ et data/)")
+    parser.add_argument("--no-sync", action="store_true",
+                        help="lire l'index tel quel, sans le resynchroniser avec les fichiers")
+    parser.add_argument("--workers", type=int,
+                        help="nombre de fichiers lus en parallèle lors de la synchronisation (1 : lecture séquentielle)")
+    parser.add_argument("--metrics", choices=["prometheus", "json"],
+                        help="afficher les temps des phases et les compteurs de lecture sur la sortie d'erreur")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    list_parser = subparsers.add_parser("list", help="lister les tickets (du plus récent au plus ancien)")
+    list_parser.add_argument("--month", type=month_argument, help="mois au format AAAA-MM")
+    list_parser.add_argument("--category", help="catégorie")
+    list_parser.add_argument("--limit", type=int, help="nombre maximal de tickets")
+    list_parser.add_argument("--format", choices=["text", "csv", "json"], default="text")
+    list_parser.set_defaults(handler=list_command)
+    
+    search_parser = subparsers.add_parser("search", help="rechercher dans l'entreprise, la catégorie et les notes (début de mot)")
+    search_parser.add_argument("text", nargs="*", help="mots recherchés (tous doivent être présents)")
+    search_parser.add_argument("--min", type=amount_argument, help="montant minimal (€)")
+    search_parser.add_argument("--max", type=amount_argument, help="montant maximal (€)")
+    search_parser.add_argument("--from", dest="date_from", type=date_argument, help="date de début (AAAA-MM-JJ)")
+    search_parser.add_argument("--to", dest="date_to", type=date_argument, help="date de fin incluse (AAAA-MM-JJ)")
+    search_parser.add_argument("--month", type=month_argument, help="mois au format AAAA-MM")
+    search_parser.add_argument("--category", help="catégorie")
+    search_parser.add_argument("--limit", type=int, help="nombre maximal de tickets")
+    search_parser.add_argument("--format", choices=["text", "csv", "json"], default="text")
+    search_parser.set_defaults(handler=search_command)
+    
+    totals_parser = subparsers.add_parser("totals", help="totaux par mois ou par catégorie")
+    totals_parser.add_argument("--by", choices=["month", "category"], default="month")
+    totals_parser.add_argument("--format", choices=["text", "csv", "json"], default="text")
+    totals_parser.set_defaults(handler=totals_command)
+    
+    overview_parser = subparsers.add_parser("overview", help="vue d'ensemble (récapitulatifs mensuels, sans lire les tickets)")
+    overview_parser.add_argument("--format", choices=["text", "json"], default="text")
+    overview_parser.set_defaults(handler=overview_command)
+    
+    export_parser = subparsers.add_parser("export", help="exporter les tickets")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export_parser.add_argument("--output", help="fichier de sortie (sortie standard par défaut)")
+    export_parser.add_argument("--month", type=month_argument, help="mois au format AAAA-MM")
+    export_parser.add_argument("--category", help="catégorie")
+    export_parser.set_defaults(handler=export_command)
+    
+    import_parser = subparsers.add_parser("import", help="importer des relevés bancaires CSV ou OFX")
+    import_parser.add_argument("files", nargs="+", help="fichiers de relevé (.csv, .ofx, .qfx)")
+    import_parser.add_argument("--category", default=DEFAULT_IMPORT_CATEGORY, help="catégorie des tickets importés")
+    import_parser.add_argument("--include-credits", action="store_true", help="importer aussi les montants positifs")
+    import_parser.set_defaults(handler=import_command)
+    
+    pack_parser = subparsers.add_parser("pack", help="archiver les mois terminés (un fichier .pack par mois)")
+    pack_parser.add_argument("--month", type=month_argument, help="n'archiver que ce mois (AAAA-MM)")
+    pack_parser.add_argument("--before", type=month_argument,
+                             help="archiver les mois antérieurs à celui-ci (par défaut : le mois en cours)")
+    pack_parser.set_defaults(handler=pack_command)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    
+    # Les chemins des tickets et de l'index sont relatifs au dossier de l'application
+    if args.root:
+        os.chdir(args.root)
+    create_folder_structure()
+    
+    try:
+        with timed("command"):
+            args.handler(args)
+        if args.metrics == "prometheus":
+            sys.stderr.write(format_prometheus(PROCESS_METRICS))
+        elif args.metrics == "json":
+            print(json.dumps(metrics_as_dict(PROCESS_METRICS), indent=2), file=sys.stderr)
+    except BrokenPipeError:
+        # Sortie coupée (ex. | head) : terminer sans trace d'erreur
+        sys.stderr.close()
@@ -0,0 +1,37 @@
+"""Écriture des fichiers de l'application (archives, journal, récapitulatifs, mesures) : remplacement atomique
+et synchronisation des dossiers."""
+
+import os
+import contextlib
+
+# Fonction pour rendre durables les créations, renommages et suppressions dans un dossier
+def fsync_directory(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Dossier supprimé entre-temps, ou système qui ne permet pas d'ouvrir un dossier (Windows)
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Remplacer un fichier d'un coup : le contenu est écrit (en binaire) dans un fichier temporaire propre au processus,
+# qui prend ensuite la place de `path` ; un lecteur voit l'ancien fichier ou le nouveau, jamais un fichier à moitié écrit
+# Avec `durable`, le fichier puis son dossier sont synchronisés (fsync) : le nouveau contenu survit à un arrêt brutal
+@contextlib.contextmanager
+def replace_file(path, durable=True):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, 'wb') as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary_path)
+        raise
+    if durable:
+        fsync_directory(os.path.dirname(path) or os.curdir)
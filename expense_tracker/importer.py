@@ -0,0 +1,200 @@
+"""Import en masse de relevés bancaires (CSV ou OFX) sous forme de tickets."""
+
+import os
+import re
+import io
+import csv
+import functools
+import unicodedata
+from datetime import datetime
+
+from expense_tracker.money import parse_amount
+from expense_tracker.storage import (
+    create_receipt_files,
+    format_receipt_markdown,
+    index_receipts,
+    parse_receipt_filename,
+)
+
+# Import en masse de relevés bancaires (CSV ou OFX)
+IMPORT_CHUNK_SIZE = 5000
+DEFAULT_IMPORT_CATEGORY = "Autre"
+
+# En-têtes reconnus dans les exports CSV (comparés sans accents ni majuscules)
+CSV_DATE_COLUMNS = ("date", "date operation", "date de l'operation", "date comptable", "date de valeur",
+                    "booking date", "transaction date")
+CSV_LABEL_COLUMNS = ("libelle", "libelle operation", "libelle de l'operation", "description", "label",
+                     "intitule", "beneficiaire", "payee", "name")
+CSV_AMOUNT_COLUMNS = ("montant", "montant (eur)", "montant (euros)", "amount")
+CSV_DEBIT_COLUMNS = ("debit", "montant debit", "debit (eur)")
+CSV_CREDIT_COLUMNS = ("credit", "montant credit", "credit (eur)")
+CSV_CATEGORY_COLUMNS = ("categorie", "category")
+# Formats de date acceptés
+IMPORT_DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%Y%m%d")
+
+# Fonction pour normaliser un en-tête de colonne (minuscules, sans accents)
+def normalize_header(header):
+    header = unicodedata.normalize('NFKD', header.strip().strip('"').lower())
+    return "".join(c for c in header if not unicodedata.combining(c))
+
+# Fonction pour convertir un montant de relevé ("-1 234,56", "12.50 €") en centimes (None s'il est absent ou illisible)
+def parse_import_amount(text):
+    try:
+        return parse_amount(text)
+    except ValueError:
+        return None
+
+# Fonction pour créer le convertisseur de dates d'un relevé : date du relevé -> AAAA-MM-JJ (None si illisible)
+# Propre à un import (ni partagé entre sessions, ni entre fils d'exécution) : le dernier format reconnu est
+# essayé en premier, un relevé n'en utilisant qu'un ; mise en cache, les dates se répètent
+def import_date_parser():
+    formats = list(IMPORT_DATE_FORMATS)
+    
+    @functools.lru_cache(maxsize=4096)
+    def parse_import_date(text):
+        text = text.strip()
+        for i, date_format in enumerate(formats):
+            try:
+                date = datetime.strptime(text, date_format)
+            except ValueError:
+                continue
+            if i:
+                formats.insert(0, formats.pop(i))
+            return date.strftime('%Y-%m-%d')
+        return None
+    
+    return parse_import_date
+
+# Fonction pour transformer un libellé bancaire en nom d'entreprise utilisable dans un nom de fichier
+@functools.lru_cache(maxsize=4096)
+def clean_enterprise_name(label):
+    name = re.sub(r"[^\w&'.\- ]+", " ", label, flags=re.UNICODE)
+    name = re.sub(r"\s+", " ", name).strip(" .-")
+    return name[:60].strip() or "Inconnu"
+
+# Fonction pour lire les transactions d'un export CSV, ligne par ligne
+# Produit des tuples (date, libellé, montant, catégorie ou None)
+def read_csv_transactions(stream):
+    header_line = stream.readline()
+    delimiter = max(";,\t", key=header_line.count)
+    header = [normalize_header(h) for h in next(csv.reader([header_line], delimiter=delimiter))]
+    
+    def find_column(names):
+        return next((header.index(name) for name in names if name in header), None)
+    
+    date_column = find_column(CSV_DATE_COLUMNS)
+    label_column = find_column(CSV_LABEL_COLUMNS)
+    amount_column = find_column(CSV_AMOUNT_COLUMNS)
+    debit_column = find_column(CSV_DEBIT_COLUMNS)
+    credit_column = find_column(CSV_CREDIT_COLUMNS)
+    category_column = find_column(CSV_CATEGORY_COLUMNS)
+    if date_column is None or label_column is None or (amount_column is None and debit_column is None):
+        raise ValueError(f"Colonnes date, libellé et montant introuvables dans l'en-tête : {header_line.strip()}")
+    
+    parse_import_date = import_date_parser()
+    for row in csv.reader(stream, delimiter=delimiter):
+        if len(row) < len(header):
+            row = row + [""] * (len(header) - len(row))
+        if amount_column is not None:
+            amount = parse_import_amount(row[amount_column])
+        else:
+            # Colonnes débit / crédit séparées : un débit est une dépense
+            debit = parse_import_amount(row[debit_column])
+            credit = parse_import_amount(row[credit_column]) if credit_column is not None else None
+            amount = -abs(debit) if debit else credit
+        category = row[category_column].strip() if category_column is not None else None
+        yield parse_import_date(row[date_column]), row[label_column].strip(), amount, category or None
+
+# Fonction pour lire les transactions d'un export OFX/QFX (SGML ou XML), ligne par ligne
+def read_ofx_transactions(stream):
+    parse_import_date = import_date_parser()
+    transaction = None
+    for line in stream:
+        for closing, tag, value in re.findall(r"<(/?)(\w+)>([^<\r\n]*)", line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and transaction is not None:
+                    yield (parse_import_date(transaction.get("DTPOSTED", "")[:8]),
+                           (transaction.get("NAME") or transaction.get("MEMO") or "").strip(),
+                           parse_import_amount(transaction.get("TRNAMT", "")), None)
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+            elif transaction is not None and not closing:
+                transaction[tag] = value.strip()
+
+# Fonction pour choisir le lecteur selon le format du fichier
+def read_bank_transactions(stream, filename):
+    if filename.lower().endswith((".ofx", ".qfx")):
+        return read_ofx_transactions(stream)
+    return read_csv_transactions(stream)
+
+# Fonction pour découper un itérable en lots
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Fonction pour importer des transactions bancaires comme tickets
+# Par lot de IMPORT_CHUNK_SIZE transactions : noms de fichiers réservés en une fois, fichiers écrits, puis index
+# mis à jour en une transaction (un import interrompu laisse les lots déjà écrits indexés)
+def import_transactions(transactions, category=DEFAULT_IMPORT_CATEGORY, include_credits=False, source=""):
+    imported = []
+    generation = None
+    stats = {'imported': 0, 'skipped': 0, 'invalid': 0}
+    
+    for chunk in iter_chunks(transactions, IMPORT_CHUNK_SIZE):
+        tickets = []
+        for date, label, amount, row_category in chunk:
+            if date is None or amount is None or not label:
+                stats['invalid'] += 1
+                continue
+            if amount >= 0 and not include_credits:
+                # Crédit (salaire, remboursement...) : ce n'est pas une dépense
+                stats['skipped'] += 1
+                continue
+            
+            enterprise = clean_enterprise_name(label)
+            notes = f"Importé depuis {source} : {label}" if source else f"Importé : {label}"
+            tickets.append((date, enterprise, abs(amount), row_category or category, notes))
+        if not tickets:
+            continue
+        
+        names = create_receipt_files([(date, enterprise, format_receipt_markdown(date, enterprise, total, receipt_category, notes))
+                                      for date, enterprise, total, receipt_category, notes in tickets])
+        written = []
+        for (date, _, total, receipt_category, notes), (year_month, filename) in zip(tickets, names):
+            written.append((os.path.join("receipts", year_month, filename), {
+                'date': date,
+                'enterprise': parse_receipt_filename(filename)[1],
+                'total': total,
+                'category': receipt_category,
+                'year_month': year_month,
+                'filename': filename,
+                'notes': notes
+            }))
+        generation = index_receipts(written)
+        imported.extend(receipt for _, receipt in written)
+        stats['imported'] += len(written)
+    
+    return imported, generation, stats
+
+# Fonction pour importer un relevé bancaire depuis un flux binaire (fichier ou téléversement)
+def import_bank_statement(binary_stream, filename, category=DEFAULT_IMPORT_CATEGORY, include_credits=False):
+    # Les exports bancaires français sont souvent en Windows-1252 plutôt qu'en UTF-8
+    head = binary_stream.read(65536)
+    binary_stream.seek(0)
+    try:
+        head.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        encoding = 'utf-8-sig' if e.start > len(head) - 4 else 'cp1252'
+    
+    stream = io.TextIOWrapper(binary_stream, encoding=encoding, errors='replace', newline='')
+    transactions = read_bank_transactions(stream, filename)
+    return import_transactions(transactions, category, include_credits, source=os.path.basename(filename))
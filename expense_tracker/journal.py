@@ -0,0 +1,428 @@
+"""File d'écriture différée des tickets : un enregistrement ou une suppression est acquitté dès son ajout au journal
+`data/receipts_journal.jsonl` (écriture puis fsync), sans attendre les fichiers Markdown ni l'index.
+
+Un fil d'exécution applique ensuite les opérations par lots : noms de fichiers réservés en une transaction,
+fichiers écrits ou supprimés, index mis à jour en une transaction, puis magasin partagé. Le journal est vidé
+dès que toutes les opérations acquittées sont appliquées.
+
+Journal (une ligne JSON par enregistrement) :
+    {"seq": 1, "op": "save", "date": ..., "enterprise": ..., "content": ...}    ticket à enregistrer
+    {"seq": 2, "op": "delete", "year_month": ..., "filename": ...}              ticket à supprimer
+    {"seq": 1, "op": "allocated", "year_month": ..., "filename": ...}           nom réservé pour un ticket
+    {"seq": 2, "op": "applied"}                                                  opérations appliquées jusqu'à seq
+
+Après un arrêt brutal, les opérations non appliquées sont rejouées au démarrage suivant. Rejouer une opération
+déjà faite est sans effet : le nom d'un ticket est journalisé avant l'écriture de son fichier, et supprimer un
+ticket absent ne fait rien. Un seul processus à la fois tient le journal ; dans les autres, les écritures
+restent synchrones.
+
+Une opération qui échoue encore après MAX_ATTEMPTS essais (hors disque plein ou en lecture seule) est mise de
+côté dans `data/receipts_journal.failed.jsonl`, avec son erreur, et les suivantes sont appliquées.
+"""
+
+import os
+import json
+import errno
+import time
+import atexit
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+from expense_tracker.files import fsync_directory, replace_file
+from expense_tracker.metrics import count, timed
+from expense_tracker.storage import (
+    check_receipt_name,
+    format_receipt_markdown,
+    generate_unique_filenames,
+    is_month_folder,
+    parse_receipt_content,
+    parse_receipt_filename,
+    remove_receipt_file,
+    reserve_filenames,
+    update_receipt_index,
+)
+
+logger = logging.getLogger("expense_tracker")
+
+JOURNAL_PATH = os.path.join("data", "receipts_journal.jsonl")
+JOURNAL_LOCK_PATH = os.path.join("data", "receipts_journal.lock")
+DEFAULT_WRITE_BEHIND = os.environ.get("EXPENSE_TRACKER_WRITE_BEHIND", "on") != "off"
+
+# Délai de regroupement des opérations avant application (des enregistrements simultanés = un seul lot)
+BATCH_DELAY = 0.05
+MAX_BATCH = 500
+# Délai avant un nouvel essai quand un lot n'a pas pu être appliqué (disque plein, droits...)
+RETRY_DELAY = 1.0
+# Nombre d'échecs après lequel une opération est mise de côté (fichier .failed.jsonl) pour laisser passer les suivantes
+MAX_ATTEMPTS = 5
+# Erreurs qui touchent toutes les opérations (disque plein, quota, lecture seule) : jamais mises de côté
+UNAVAILABLE_ERRNOS = {errno.ENOSPC, errno.EDQUOT, errno.EROFS}
+# Taille au-delà de laquelle le journal est réécrit sans les opérations appliquées (s'il ne se vide jamais)
+JOURNAL_COMPACT_SIZE = 1 << 20
+
+# Fonction pour encoder un enregistrement du journal (une ligne : les retours à la ligne sont échappés par JSON)
+def journal_line(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+# Fonction pour lire un journal : (opérations non appliquées dans l'ordre, {seq: (mois, nom de fichier)})
+# Une dernière ligne incomplète (arrêt pendant son écriture, donc jamais acquittée) est ignorée
+def read_journal(path):
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return [], {}
+    operations, allocations, applied = [], {}, 0
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record['op'] == 'allocated':
+                allocations[record['seq']] = (record['year_month'], record['filename'])
+            elif record['op'] == 'applied':
+                applied = max(applied, record['seq'])
+            else:
+                operations.append(record)
+    operations = [operation for operation in operations if operation['seq'] > applied]
+    pending = {operation['seq'] for operation in operations}
+    return operations, {seq: name for seq, name in allocations.items() if seq in pending}
+
+# Fonction pour écrire le fichier d'un ticket de la file sous le nom qui lui a été réservé
+# Retourne False si le nom est pris par un autre fichier. Un fichier existant n'est repris (complété s'il est
+# partiel) que si `resume` : un essai précédent de la même opération a pu l'écrire. Sinon, même identique,
+# c'est celui d'un autre ticket et il ne doit pas être confondu avec celui-ci
+def write_pending_receipt(year_month, filename, content, resume=False):
+    # Seul le dossier du mois est créé : le nom de fichier ne contient pas de séparateur (receipt_stem)
+    os.makedirs(os.path.join("receipts", year_month), exist_ok=True)
+    filepath = os.path.join("receipts", year_month, filename)
+    try:
+        f = open(filepath, 'x', encoding='utf-8')
+    except FileExistsError:
+        if not resume:
+            return False
+        try:
+            with open(filepath, encoding='utf-8') as existing:
+                written = existing.read()
+        except UnicodeDecodeError:
+            return False
+        if written == content:
+            return True
+        if not content.startswith(written):
+            return False
+        f = open(filepath, 'w', encoding='utf-8')
+    with f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+# File d'écriture différée d'un magasin (une seule par processus, et un seul processus par dossier data/)
+class ReceiptWriteQueue:
+    def __init__(self, store=None, path=JOURNAL_PATH, lock_path=JOURNAL_LOCK_PATH):
+        self.store = store
+        self.path = path
+        self.lock_path = lock_path
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.sync_lock = threading.Lock()
+        self.pending = []        # opérations acquittées, pas encore appliquées (dans l'ordre du journal)
+        self.allocations = {}    # {seq: (mois, nom de fichier)} des tickets en attente
+        self.resumable = set()   # seq des tickets dont le fichier a pu être (en partie) écrit par un essai précédent
+        self.next_seq = 1
+        self.written = 0         # écritures faites dans le journal
+        self.synced = 0          # écritures rendues durables (fsync)
+        self.journal = None
+        self.lock_file = None
+        self.thread = None
+        self.stopping = False
+        self.replayed = 0        # opérations reprises du journal au démarrage
+        self.attempts = {}       # {seq: échecs} des opérations en attente
+        self.index_failures = 0  # échecs consécutifs de la mise à jour de l'index
+        self.failed_path = os.path.splitext(path)[0] + ".failed.jsonl"
+    
+    # Démarrer la file : prendre le journal, reprendre les opérations non appliquées, lancer le fil d'exécution
+    # Retourne False si le journal est tenu par un autre processus
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.lock_file.close()
+                return False
+        
+        self.pending, self.allocations = read_journal(self.path)
+        # Noms journalisés avant l'arrêt : réservés, même si leur fichier n'a pas encore été écrit
+        reserve_filenames(self.allocations.values())
+        self.resumable = set(self.allocations)
+        self.next_seq = max((operation['seq'] for operation in self.pending), default=0) + 1
+        self.replayed = len(self.pending)
+        if self.pending:
+            logger.info("Journal des tickets : %d opération(s) non appliquée(s) à rejouer", len(self.pending))
+        # Repartir d'un journal propre (sans opérations appliquées ni ligne incomplète)
+        self.rewrite_journal()
+        
+        self.thread = threading.Thread(target=self.run, name="receipt-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        return True
+    
+    # Arrêter la file après avoir appliqué les opérations en attente (au plus `timeout` secondes)
+    def stop(self, timeout=10):
+        with self.lock:
+            self.stopping = True
+            self.changed.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+    
+    # Libérer le journal (après stop) pour un autre processus
+    def close(self):
+        with self.sync_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+    
+    # Enregistrer un ticket (total en centimes) ; retourne dès que l'opération est dans le journal
+    def save(self, date, enterprise, total, category, notes):
+        # Nom, total et contenu vérifiés tout de suite (ValueError) : une opération acquittée ne doit pas échouer ensuite
+        check_receipt_name(date, enterprise)
+        content = format_receipt_markdown(date, enterprise, total, category, notes)
+        with timed("journal_append"):
+            return self.enqueue({'op': 'save', 'date': date, 'enterprise': enterprise, 'content': content})
+    
+    # Supprimer un ticket ; il disparaît tout de suite du magasin, le fichier et l'index suivent avec le lot
+    def delete(self, year_month, filename):
+        if not is_month_folder(year_month) or os.path.basename(filename) != filename \
+                or parse_receipt_filename(filename) is None:
+            raise ValueError(f"Ticket invalide : {year_month}/{filename}")
+        with timed("journal_append"):
+            self.enqueue({'op': 'delete', 'year_month': year_month, 'filename': filename})
+        if self.store is not None:
+            self.store.remove(year_month, filename)
+        return True
+    
+    # Attendre que les opérations acquittées soient appliquées ; retourne False si le délai est dépassé
+    def flush(self, timeout=None):
+        with self.lock:
+            return self.changed.wait_for(lambda: not self.pending, timeout)
+    
+    def enqueue(self, operation):
+        with self.lock:
+            operation = {'seq': self.next_seq, **operation}
+            self.next_seq += 1
+            position = self.write_records([operation])
+            self.pending.append(operation)
+            self.changed.notify_all()
+        self.sync(position)
+        return operation['seq']
+    
+    # Écrire des enregistrements à la fin du journal (verrou `lock` tenu) ; retourne leur position pour sync
+    def write_records(self, records):
+        self.journal.write(b"".join(journal_line(record) for record in records))
+        self.journal.flush()
+        self.written += 1
+        return self.written
+    
+    # Attendre que le journal soit sur le disque jusqu'à `position`
+    # Les sessions qui écrivent en même temps partagent un même fsync
+    def sync(self, position):
+        with self.sync_lock:
+            if self.synced >= position:
+                return
+            # Tout ce qui a été écrit jusqu'ici (y compris par d'autres sessions) est couvert par ce fsync
+            target = self.written
+            os.fsync(self.journal.fileno())
+            self.synced = target
+        count("journal_fsyncs")
+    
+    # Réécrire le journal avec les seules opérations en attente (fichier temporaire puis remplacement atomique)
+    def rewrite_journal(self):
+        records = []
+        for operation in self.pending:
+            records.append(operation)
+            if operation['seq'] in self.allocations:
+                year_month, filename = self.allocations[operation['seq']]
+                records.append({'seq': operation['seq'], 'op': 'allocated', 'year_month': year_month, 'filename': filename})
+        with self.sync_lock:
+            try:
+                with replace_file(self.path) as f:
+                    f.write(b"".join(journal_line(record) for record in records))
+                    # Journal fermé avant d'être remplacé (Windows ne remplace pas un fichier ouvert)
+                    if self.journal is not None:
+                        self.journal.close()
+            finally:
+                # Nouveau journal, ou l'ancien (intact) si le remplacement a échoué
+                self.journal = open(self.path, 'ab')
+            self.synced = self.written
+    
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopping:
+                    self.changed.wait()
+                if not self.pending:
+                    return
+            if not self.stopping:
+                # Laisser arriver les opérations simultanées : elles partiront dans le même lot
+                time.sleep(BATCH_DELAY)
+            with self.lock:
+                batch = self.pending[:MAX_BATCH]
+            with timed("write_behind"):
+                try:
+                    done, error = self.apply_batch(batch)
+                except Exception as e:
+                    done, error = 0, e
+            if done:
+                self.complete(batch[:done])
+            if error is not None:
+                # Les opérations restantes sont gardées dans le journal : nouvel essai un peu plus tard
+                logger.error("Erreur lors de l'application du journal des tickets", exc_info=error)
+                time.sleep(RETRY_DELAY)
+    
+    # Réserver les noms de fichiers de tickets à enregistrer, et les journaliser avant d'écrire les fichiers
+    def allocate(self, operations):
+        if not operations:
+            return
+        names = generate_unique_filenames([(operation['date'], operation['enterprise']) for operation in operations])
+        # Nom créé entre-temps par un autre processus : un autre est réservé. Un nom journalisé est ainsi libre
+        # au moment de l'opération, et un fichier trouvé plus tard sous ce nom ne peut venir que d'elle
+        for i, operation in enumerate(operations):
+            while os.path.lexists(os.path.join("receipts", *names[i])):
+                names[i] = generate_unique_filenames([(operation['date'], operation['enterprise'])])[0]
+        with self.lock:
+            position = self.write_records([{'seq': operation['seq'], 'op': 'allocated', 'year_month': year_month,
+                                            'filename': filename}
+                                           for operation, (year_month, filename) in zip(operations, names)])
+            self.allocations.update((operation['seq'], name) for operation, name in zip(operations, names))
+            self.resumable.difference_update(operation['seq'] for operation in operations)
+        self.sync(position)
+    
+    # Appliquer une opération sur les fichiers : (mois, ticket écrit) ou (mois, résultat de remove_receipt_file)
+    def apply_file_operation(self, operation):
+        if operation['op'] == 'delete':
+            return operation['year_month'], remove_receipt_file(operation['year_month'], operation['filename'])
+        if operation['seq'] not in self.allocations:
+            self.allocate([operation])
+        while True:
+            year_month, filename = self.allocations[operation['seq']]
+            resume = operation['seq'] in self.resumable
+            self.resumable.add(operation['seq'])
+            if write_pending_receipt(year_month, filename, operation['content'], resume):
+                return year_month, parse_receipt_content(operation['content'], year_month, filename)
+            # Nom pris entre-temps par un autre fichier (ex. import en cours) : un nouveau nom est réservé
+            self.allocate([operation])
+    
+    # Compter l'échec d'une opération ; après MAX_ATTEMPTS échecs, elle est mise de côté dans le fichier
+    # des opérations en échec pour ne pas bloquer les suivantes. Retourne True si elle est mise de côté
+    def give_up(self, operation, error):
+        if isinstance(error, OSError) and error.errno in UNAVAILABLE_ERRNOS:
+            return False
+        attempts = self.attempts[operation['seq']] = self.attempts.get(operation['seq'], 0) + 1
+        if attempts < MAX_ATTEMPTS:
+            return False
+        with open(self.failed_path, 'ab') as f:
+            f.write(journal_line({**operation, 'error': f"{type(error).__name__}: {error}"}))
+            f.flush()
+            os.fsync(f.fileno())
+        logger.error("Opération %d du journal des tickets mise de côté dans %s après %d échecs : %s",
+                     operation['seq'], self.failed_path, attempts, error)
+        count("write_behind_failures")
+        return True
+    
+    # Appliquer un lot dans l'ordre du journal : fichiers écrits ou supprimés (rendus durables), index
+    # en une transaction, puis magasin. Retourne (nombre d'opérations faites ou mises de côté, erreur qui a
+    # arrêté le lot ou None) ; les opérations qui suivent une erreur sont reprises au prochain essai
+    def apply_batch(self, batch):
+        try:
+            self.allocate([operation for operation in batch
+                           if operation['op'] == 'save' and operation['seq'] not in self.allocations])
+        except Exception:
+            # Les noms sont réservés un par un ci-dessous : un ticket impossible à nommer ne bloque pas les autres
+            pass
+        
+        entries, removed, removed_keys, folders = [], [], [], set()
+        done, error = 0, None
+        for operation in batch:
+            try:
+                year_month, result = self.apply_file_operation(operation)
+            except Exception as e:
+                if not self.give_up(operation, e):
+                    error = e
+                    break
+            else:
+                if operation['op'] == 'save':
+                    entries.append((os.path.join("receipts", year_month, result['filename']), result))
+                else:
+                    key = (year_month, operation['filename'])
+                    # Fichier déjà supprimé (essai précédent) : la ligne de l'index est retirée quand même
+                    removed.append((key, result or (None, None)))
+                    removed_keys.append(key)
+                folders.add(year_month)
+            done += 1
+        for year_month in folders:
+            fsync_directory(os.path.join("receipts", year_month))
+        fsync_directory("receipts")
+        
+        generation = None
+        if entries or removed:
+            try:
+                generation = update_receipt_index(entries, removed)
+            except Exception:
+                # Les fichiers sont écrits : après MAX_ATTEMPTS échecs, l'index est laissé à la prochaine synchronisation
+                self.index_failures += 1
+                if self.index_failures < MAX_ATTEMPTS:
+                    raise
+                logger.exception("Index non mis à jour par le journal des tickets (rattrapé à la prochaine synchronisation)")
+            self.index_failures = 0
+        if self.store is not None:
+            self.store.apply_writes([receipt for _, receipt in entries], removed_keys, generation)
+        count("write_behind_operations", done)
+        return done, error
+    
+    # Retirer un lot appliqué du journal : vidé s'il ne reste rien, réécrit s'il devient trop gros
+    # La marque « applied » n'a pas besoin de fsync : rejouer un lot déjà appliqué est sans effet
+    def complete(self, batch):
+        with self.lock:
+            self.write_records([{'seq': batch[-1]['seq'], 'op': 'applied'}])
+            del self.pending[:len(batch)]
+            for operation in batch:
+                self.allocations.pop(operation['seq'], None)
+                self.attempts.pop(operation['seq'], None)
+                self.resumable.discard(operation['seq'])
+            if not self.pending:
+                with self.sync_lock:
+                    self.journal.truncate(0)
+                    self.synced = self.written
+            elif self.journal.tell() > JOURNAL_COMPACT_SIZE:
+                self.rewrite_journal()
+            self.changed.notify_all()
+
+# Fonction pour démarrer la file d'écriture différée d'un magasin
+# Retourne None si elle est désactivée (EXPENSE_TRACKER_WRITE_BEHIND=off) ou si un autre processus tient le journal
+def start_receipt_writer(store, enabled=DEFAULT_WRITE_BEHIND):
+    if not enabled:
+        return None
+    writer = ReceiptWriteQueue(store)
+    return writer if writer.start() else None
+
+# Fonction pour appliquer les opérations laissées dans le journal par un arrêt brutal (ligne de commande)
+# Sans effet si le journal est absent ou tenu par un processus en cours ; retourne le nombre d'opérations rejouées
+def replay_receipt_journal():
+    if not os.path.exists(JOURNAL_PATH) or not os.path.getsize(JOURNAL_PATH):
+        return 0
+    writer = ReceiptWriteQueue()
+    if not writer.start():
+        return 0
+    writer.stop()
+    writer.close()
+    return writer.replayed
@@ -0,0 +1,138 @@
+"""Instrumentation : chronomètres et compteurs des phases coûteuses (synchronisation, lecture, agrégats, graphiques...).
+
+Chaque mesure est ajoutée au total du processus et, s'il y en a un, à l'enregistreur actif du fil
+d'exécution courant (un affichage Streamlit, une commande de la ligne de commande).
+"""
+
+import time
+import json
+import threading
+import contextlib
+import contextvars
+
+from expense_tracker.files import replace_file
+
+# Totaux d'un ensemble de mesures : chronomètres {nom: [appels, secondes, maximum]} et compteurs {nom: valeur}
+class MetricsRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+    
+    def add_time(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+    
+    def add_count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    # Ajouter les mesures d'un autre enregistreur (ex. un affichage au total de la session)
+    def merge(self, other):
+        timers, counters = other.snapshot()
+        with self.lock:
+            for name, (calls, seconds, maximum) in timers.items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += calls
+                timer[1] += seconds
+                timer[2] = max(timer[2], maximum)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+    
+    # Copie cohérente des mesures : (chronomètres, compteurs)
+    def snapshot(self):
+        with self.lock:
+            return {name: tuple(timer) for name, timer in self.timers.items()}, dict(self.counters)
+
+# Mesures de tout le processus (toutes sessions et fils d'exécution confondus)
+PROCESS_METRICS = MetricsRecorder()
+active_recorder = contextvars.ContextVar("expense_tracker_metrics", default=None)
+
+# Fonction pour activer un enregistreur dans le fil d'exécution courant ; retourne un jeton pour le désactiver
+def activate_recorder(recorder):
+    return active_recorder.set(recorder)
+
+def deactivate_recorder(token):
+    active_recorder.reset(token)
+
+def record_time(name, seconds):
+    PROCESS_METRICS.add_time(name, seconds)
+    recorder = active_recorder.get()
+    if recorder is not None:
+        recorder.add_time(name, seconds)
+
+def count(name, value=1):
+    PROCESS_METRICS.add_count(name, value)
+    recorder = active_recorder.get()
+    if recorder is not None:
+        recorder.add_count(name, value)
+
+# Chronométrer un bloc : with timed("parse"): ...
+@contextlib.contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+# Fonction pour mettre des mesures sous forme de dictionnaire (journaux structurés, JSON)
+def metrics_as_dict(recorder):
+    timers, counters = recorder.snapshot()
+    return {
+        'timers': {name: {'calls': calls, 'seconds': round(seconds, 6), 'max_seconds': round(maximum, 6)}
+                   for name, (calls, seconds, maximum) in sorted(timers.items())},
+        'counters': dict(sorted(counters.items())),
+    }
+
+# Fonction pour formater des mesures au format texte de Prometheus
+# `labels` est ajouté à chaque série (ex. {"scope": "process"})
+def format_prometheus(recorder, labels=None, prefix="expense_tracker"):
+    return format_prometheus_scopes([(recorder, labels)], prefix)
+
+# Fonction pour formater les mesures de plusieurs enregistreurs dans un même fichier Prometheus
+# `scopes` : couples (enregistreur, étiquettes), ex. [(PROCESS_METRICS, {"scope": "process"}), ...]
+# Chaque métrique n'a qu'un en-tête HELP/TYPE, suivi de toutes ses séries (le format exige des familles contiguës)
+def format_prometheus_scopes(scopes, prefix="expense_tracker"):
+    families = {}    # {métrique: (aide, [(étiquettes, valeur)])}
+    
+    def series(metric, help_text, labels, value):
+        families.setdefault(metric, (help_text, []))[1].append((labels, value))
+    
+    for recorder, labels in scopes:
+        timers, counters = recorder.snapshot()
+        label_items = sorted((labels or {}).items())
+        for name, (calls, seconds, maximum) in sorted(timers.items()):
+            series(f"{prefix}_phase_seconds_total", "Temps passé dans chaque phase.",
+                   [("phase", name)] + label_items, f"{seconds:.6f}")
+            series(f"{prefix}_phase_calls_total", "Nombre d'exécutions de chaque phase.",
+                   [("phase", name)] + label_items, calls)
+        for name, value in sorted(counters.items()):
+            series(f"{prefix}_{name}_total", None, label_items, value)
+    
+    lines = []
+    for metric, (help_text, values) in families.items():
+        if help_text:
+            lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in values:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+# Fonction pour écrire les mesures du processus dans un fichier (collecteur « textfile » de node_exporter)
+# Écriture dans un fichier temporaire puis remplacement, pour ne jamais exposer un fichier à moitié écrit
+# (sans fsync : le fichier est réécrit à chaque affichage)
+def write_metrics_file(path, recorder=PROCESS_METRICS, labels=None):
+    if path.endswith(".json"):
+        text = json.dumps(metrics_as_dict(recorder), indent=2)
+    else:
+        text = format_prometheus(recorder, labels)
+    with replace_file(path, durable=False) as f:
+        f.write(text.encode('utf-8'))
@@ -0,0 +1,76 @@
+"""Montants en centimes : les totaux sont lus, stockés et additionnés sous forme d'entiers (int64).
+
+Les sommes sont exactes et ne dépendent pas de l'ordre de lecture des tickets. Les euros n'apparaissent
+qu'aux bords : saisie, contenu Markdown des tickets, relevés bancaires et affichage.
+"""
+
+import re
+import operator
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+AMOUNT_PATTERN = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)")
+# Montant sans signe ni séparateur de milliers, au plus deux décimales (cas de presque tous les tickets)
+PLAIN_AMOUNT_PATTERN = re.compile(r"(\d+)(?:[.,](\d{1,2}))?")
+CENT = Decimal("0.01")
+# Montant maximal d'un ticket (9 999 999 999,99 €) : un million de tickets à ce montant tiennent encore
+# dans une somme int64 (et dans une colonne INTEGER de SQLite)
+MAX_AMOUNT_CENTS = 10 ** 12 - 1
+
+# Fonction pour vérifier qu'un montant en centimes reste dans les limites (ValueError sinon)
+def checked_cents(cents, value):
+    if abs(cents) > MAX_AMOUNT_CENTS:
+        raise ValueError(f"Montant hors limites : {value!r}")
+    return cents
+
+# Fonction pour convertir un montant reconnu par PLAIN_AMOUNT_PATTERN en centimes (calcul entier, sans Decimal)
+def plain_amount_cents(match):
+    euros, cents = match.groups()
+    return int(euros) * 100 + (int(cents.ljust(2, "0")) if cents else 0)
+
+# Fonction pour convertir un montant en euros (nombre, Decimal ou texte "12.5") en centimes, arrondi au plus proche
+# Lève ValueError si ce n'est pas un montant ou s'il dépasse MAX_AMOUNT_CENTS
+# Un nombre à virgule est converti par son écriture décimale la plus courte (12.3 -> 1230, sans erreur binaire)
+def euros_to_cents(value):
+    text = str(value)
+    plain = PLAIN_AMOUNT_PATTERN.fullmatch(text)
+    if plain:
+        return checked_cents(plain_amount_cents(plain), value)
+    try:
+        amount = Decimal(text)
+        # Vérifié avant l'arrondi : un exposant démesuré (« 1e999999999 ») ne doit pas être calculé
+        if not amount.is_finite() or abs(amount) > MAX_AMOUNT_CENTS:
+            raise ValueError
+        cents = int(amount.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Montant invalide : {value!r}") from None
+    return checked_cents(cents, value)
+
+# Fonction pour convertir un montant écrit ("12.5", "12,50", "-1 234,56 €", "1.234,56") en centimes
+# Lève ValueError si le texte n'est pas un montant ou s'il dépasse MAX_AMOUNT_CENTS
+def parse_amount(text):
+    plain = PLAIN_AMOUNT_PATTERN.fullmatch(text)
+    if plain:
+        return checked_cents(plain_amount_cents(plain), text)
+    cleaned = text.strip().replace('\u00a0', '').replace('\u202f', '').replace(' ', '').replace('€', '').replace('EUR', '')
+    if ',' in cleaned and '.' in cleaned:
+        # Le dernier séparateur est le séparateur décimal
+        if cleaned.rfind(',') > cleaned.rfind('.'):
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+    else:
+        cleaned = cleaned.replace(',', '.')
+    if not AMOUNT_PATTERN.fullmatch(cleaned):
+        raise ValueError(f"Montant invalide : {text!r}")
+    return euros_to_cents(cleaned)
+
+# Fonction pour écrire un montant en centimes sous la forme "1234.50" (sans passer par un nombre à virgule)
+def format_amount(cents):
+    cents = operator.index(cents)
+    euros, remainder = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{euros}.{remainder:02d}"
+
+# Fonction pour convertir des centimes (entier, moyenne ou tableau numpy) en euros pour les graphiques et le JSON
+# Le nombre obtenu est le plus proche du montant exact : il s'écrit avec ses deux décimales
+def cents_to_euros(cents):
+    return cents / 100
@@ -0,0 +1,98 @@
+"""Récapitulatifs par mois (`data/rollups/AAAA_MM.json`) : nombre de tickets, total, minimum, maximum
+et totaux par catégorie (montants en centimes), tenus à jour à chaque écriture dans l'index.
+
+La vue d'ensemble (total, moyenne mensuelle, mois le plus coûteux, catégories principales, tendance)
+se calcule en lisant un fichier par mois, sans charger les tickets (voir RollupTable dans expense_tracker.aggregates).
+Les récapitulatifs sont rangés dans data/ et non dans les dossiers de mois, qui disparaissent quand ils sont
+vides ou archivés.
+
+Les mois modifiés sont notés dans l'index (table dirty_rollups) dans la même transaction que les tickets,
+puis leurs récapitulatifs sont réécrits : une interruption entre les deux est rattrapée à l'écriture suivante.
+"""
+
+import os
+import json
+
+from expense_tracker.files import replace_file
+
+ROLLUPS_FOLDER = os.path.join("data", "rollups")
+ROLLUP_SUFFIX = ".json"
+
+# Fonction pour obtenir le chemin du récapitulatif d'un mois
+def rollup_path(year_month):
+    return os.path.join(ROLLUPS_FOLDER, year_month + ROLLUP_SUFFIX)
+
+# Fonction pour créer la table des mois à recalculer si nécessaire
+def init_rollup_state(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS dirty_rollups (year_month TEXT PRIMARY KEY)")
+
+# Fonction pour noter des mois à recalculer (dans la transaction en cours de l'index)
+def mark_rollups_dirty(conn, months):
+    conn.executemany("INSERT OR IGNORE INTO dirty_rollups VALUES (?)", ((month,) for month in months))
+
+# Fonction pour noter les récapitulatifs manquants ou orphelins (index reconstruit, dossier data/rollups supprimé...)
+def mark_missing_rollups(conn):
+    indexed = {month for (month,) in conn.execute("SELECT DISTINCT year_month FROM receipts")}
+    mark_rollups_dirty(conn, indexed.symmetric_difference(read_rollup_months()))
+
+# Fonction pour calculer le récapitulatif d'un mois à partir de l'index (None si le mois n'a plus de ticket)
+def compute_month_rollup(conn, year_month):
+    rows = conn.execute("""
+        SELECT category, COUNT(*), SUM(total), MIN(total), MAX(total) FROM receipts
+        WHERE year_month = ? GROUP BY category ORDER BY category
+    """, (year_month,)).fetchall()
+    if not rows:
+        return None
+    return {
+        'year_month': year_month,
+        'count': sum(row[1] for row in rows),
+        'sum': sum(row[2] for row in rows),
+        'min': min(row[3] for row in rows),
+        'max': max(row[4] for row in rows),
+        'categories': {category: {'count': count, 'sum': total} for category, count, total, _, _ in rows},
+    }
+
+# Fonction pour écrire le récapitulatif d'un mois (fichier temporaire puis remplacement atomique)
+# Un mois sans ticket (None) n'a pas de récapitulatif
+def write_month_rollup(year_month, rollup):
+    path = rollup_path(year_month)
+    if rollup is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(ROLLUPS_FOLDER, exist_ok=True)
+    # Sans fsync : un récapitulatif se recalcule depuis l'index
+    with replace_file(path, durable=False) as f:
+        f.write(json.dumps(rollup, ensure_ascii=False).encode('utf-8'))
+
+# Fonction pour réécrire les récapitulatifs des mois notés (après la validation des changements de l'index)
+# Le verrou d'écriture de l'index est gardé pendant le calcul : aucun autre processus ne peut modifier
+# un mois entre son calcul et le retrait de sa marque
+def refresh_month_rollups(conn):
+    if conn.execute("SELECT 1 FROM dirty_rollups LIMIT 1").fetchone() is None:
+        return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for (year_month,) in conn.execute("SELECT year_month FROM dirty_rollups").fetchall():
+            write_month_rollup(year_month, compute_month_rollup(conn, year_month))
+        conn.execute("DELETE FROM dirty_rollups")
+
+# Fonction pour lister les mois qui ont un récapitulatif
+def read_rollup_months():
+    try:
+        names = os.listdir(ROLLUPS_FOLDER)
+    except FileNotFoundError:
+        return set()
+    return {name[:-len(ROLLUP_SUFFIX)] for name in names if name.endswith(ROLLUP_SUFFIX)}
+
+# Fonction pour lire tous les récapitulatifs : {mois: récapitulatif}, un fichier par mois
+def read_month_rollups():
+    rollups = {}
+    for year_month in sorted(read_rollup_months()):
+        try:
+            with open(rollup_path(year_month), encoding='utf-8') as f:
+                rollups[year_month] = json.load(f)
+        except FileNotFoundError:
+            # Mois supprimé entre la liste et la lecture
+            continue
+    return rollups
@@ -0,0 +1,900 @@
+"""Stockage des tickets : fichiers Markdown par mois et index SQLite des métadonnées."""
+
+import os
+import re
+from datetime import datetime
+import glob
+import logging
+import sqlite3
+import threading
+import multiprocessing
+import concurrent.futures
+
+from expense_tracker.archive import (
+    PACK_SUFFIX,
+    lock_receipt_pack,
+    pack_path,
+    pack_signature,
+    read_pack_table,
+    read_packed_receipt,
+    remove_packed_receipt,
+    write_receipt_pack,
+)
+from expense_tracker.metrics import count, timed
+from expense_tracker.money import checked_cents, format_amount, parse_amount
+from expense_tracker.rollups import init_rollup_state, mark_missing_rollups, mark_rollups_dirty, refresh_month_rollups
+
+logger = logging.getLogger("expense_tracker")
+
+# Fonction pour créer les dossiers nécessaires
+def create_folder_structure():
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("receipts", exist_ok=True)
+
+MONTH_FOLDER_PATTERN = re.compile(r"[0-9]{4}_[0-9]{2}")
+
+# Fonction pour savoir si un nom est celui d'un dossier de mois (AAAA_MM)
+def is_month_folder(name):
+    return MONTH_FOLDER_PATTERN.fullmatch(name) is not None
+
+# Fonction pour retrouver le mois d'une archive à partir de son nom (None si ce n'est pas une archive)
+def pack_month(name):
+    if name.endswith(PACK_SUFFIX) and is_month_folder(name[:-len(PACK_SUFFIX)]):
+        return name[:-len(PACK_SUFFIX)]
+    return None
+
+# Fonction pour construire un nom de fichier : AAAA-MM-JJ_Entreprise.md, puis _1, _2... en cas de doublon
+def receipt_filename(stem, suffix):
+    return f"{stem}.md" if suffix == 0 else f"{stem}_{suffix}.md"
+
+# Séparateurs de chemin remplacés (comme les espaces) dans le nom de l'entreprise : le fichier reste dans son dossier
+# de mois, quel que soit le nom saisi (« ../x », « a/b »)
+FILENAME_SEPARATORS = re.compile("[ " + re.escape(os.sep + (os.altsep or "")) + "]")
+
+# Fonction pour obtenir le dossier de mois et la racine du nom de fichier d'un ticket : (AAAA_MM, AAAA-MM-JJ_Entreprise)
+def receipt_stem(date, enterprise):
+    year_month = date.split('-')[0] + '_' + date.split('-')[1]
+    return year_month, f"{date}_{FILENAME_SEPARATORS.sub('_', enterprise)}"
+
+# Longueur maximale d'un nom de fichier (en octets, sur la plupart des systèmes de fichiers), suffixe compris
+MAX_FILENAME_BYTES = 255
+MAX_FILENAME_SUFFIX = 999999
+
+# Fonction pour vérifier qu'un ticket peut être enregistré sous un nom de fichier valide (ValueError sinon)
+def check_receipt_name(date, enterprise):
+    year_month, stem = receipt_stem(date, enterprise)
+    if parse_receipt_filename(receipt_filename(stem, 0)) is None or not is_month_folder(year_month):
+        raise ValueError(f"Date ou entreprise invalide : {date!r}, {enterprise!r} (date attendue AAAA-MM-JJ)")
+    if "\0" in stem:
+        raise ValueError(f"Nom d'entreprise invalide : {enterprise!r}")
+    if len(receipt_filename(stem, MAX_FILENAME_SUFFIX).encode('utf-8')) > MAX_FILENAME_BYTES:
+        raise ValueError(f"Nom d'entreprise trop long : {enterprise[:40]!r}...")
+
+# Fonction pour générer un nom de fichier unique
+# Le suffixe est réservé via un compteur par dossier et par nom, sans tester les fichiers existants un à un
+def generate_unique_filename(date, enterprise):
+    year_month, stem = receipt_stem(date, enterprise)
+    os.makedirs(os.path.join("receipts", year_month), exist_ok=True)
+    
+    return year_month, receipt_filename(stem, reserve_filename_suffix(year_month, stem))
+
+# Fonction pour générer les noms de fichiers uniques d'un lot de tickets [(date, entreprise)], en une seule transaction
+def generate_unique_filenames(receipts):
+    names = [receipt_stem(date, enterprise) for date, enterprise in receipts]
+    for year_month in {year_month for year_month, _ in names}:
+        os.makedirs(os.path.join("receipts", year_month), exist_ok=True)
+    suffixes = reserve_filename_suffixes(names)
+    return [(year_month, receipt_filename(stem, suffix)) for (year_month, stem), suffix in zip(names, suffixes)]
+
+# Fonction pour créer le fichier d'un ticket sous un nom libre
+# Création exclusive (O_EXCL) : si le nom a été pris entre-temps, un nouveau suffixe est réservé
+def create_receipt_file(date, enterprise, content, allocate=generate_unique_filename):
+    while True:
+        year_month, filename = allocate(date, enterprise)
+        try:
+            with open(os.path.join("receipts", year_month, filename), 'x', encoding='utf-8') as f:
+                f.write(content)
+            return year_month, filename
+        except FileExistsError:
+            continue
+
+# Fonction pour créer les fichiers d'un lot de tickets [(date, entreprise, contenu)], noms réservés en une fois
+# Retourne les couples (mois, nom de fichier) ; un nom pris entre-temps est remplacé comme dans create_receipt_file
+def create_receipt_files(receipts):
+    names = generate_unique_filenames([(date, enterprise) for date, enterprise, _ in receipts])
+    created = []
+    for (date, enterprise, content), (year_month, filename) in zip(receipts, names):
+        try:
+            with open(os.path.join("receipts", year_month, filename), 'x', encoding='utf-8') as f:
+                f.write(content)
+        except FileExistsError:
+            year_month, filename = create_receipt_file(date, enterprise, content)
+        created.append((year_month, filename))
+    return created
+
+# Fonction pour mettre en forme un ticket en markdown (total en centimes)
+# Un total hors limites (ValueError) donnerait un fichier illisible à la synchronisation suivante
+def format_receipt_markdown(date, enterprise, total, category, notes):
+    checked_cents(total, total)
+    return (
+        f"# Ticket: {enterprise}\n\n"
+        f"**Date:** {date}\n\n"
+        f"**Catégorie:** {category}\n\n"
+        f"**Total:** {format_amount(total)}€\n\n"
+        "## Notes\n\n"
+        + (notes if notes else "_Aucune note_")
+    )
+
+# Fonction pour sauvegarder un ticket en markdown
+# Le total est en centimes ; si un magasin (ReceiptStore) est fourni, le ticket y est ajouté sans relire le dossier
+def save_receipt_as_markdown(date, enterprise, total, category, notes, store=None):
+    check_receipt_name(date, enterprise)
+    content = format_receipt_markdown(date, enterprise, total, category, notes)
+    year_month, filename = create_receipt_file(date, enterprise, content)
+    filepath = os.path.join("receipts", year_month, filename)
+    
+    # Mise à jour de l'index et du magasin partagé (sans rescanner le dossier)
+    receipt = parse_receipt_file(filepath, year_month, filename)
+    generation = index_receipts([(filepath, receipt)])
+    if store is not None:
+        store.add(receipt, generation)
+    
+    return year_month, filename
+
+# Index persistant des métadonnées des tickets
+INDEX_PATH = os.path.join("data", "receipts_index.sqlite")
+INDEX_VERSION = 5
+SEARCH_KEY = "(CAST(replace({row}.date, '-', '') AS INTEGER) << 32) + {row}.id"
+
+# Fonction pour créer la table de l'index si nécessaire
+def init_receipt_index(conn):
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            conn.execute("DROP TABLE IF EXISTS receipts_search")
+            conn.execute("DROP TABLE IF EXISTS receipts")
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute("DROP TABLE IF EXISTS dirty_rollups")
+            conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS receipts (
+                id INTEGER PRIMARY KEY,
+                year_month TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                enterprise TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                notes TEXT NOT NULL DEFAULT '',
+                UNIQUE (year_month, filename)
+            )
+        """)
+        # Index plein texte (FTS5) de l'entreprise, de la catégorie et des notes, tenu à jour par des déclencheurs
+        # Sans contenu (les textes restent dans `receipts`) ; les préfixes de 2 et 3 caractères sont indexés
+        # Clé de recherche = date AAAAMMJJ (32 bits de poids fort) puis id : parcourir l'index par clé décroissante
+        # donne les tickets du plus récent au plus ancien, et une recherche limitée s'arrête aux premiers trouvés
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS receipts_search USING fts5(
+                enterprise, category, notes, content='',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS receipts_search_insert AFTER INSERT ON receipts BEGIN
+                INSERT INTO receipts_search (rowid, enterprise, category, notes)
+                VALUES ({SEARCH_KEY.format(row="new")}, new.enterprise, new.category, new.notes);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS receipts_search_delete AFTER DELETE ON receipts BEGIN
+                INSERT INTO receipts_search (receipts_search, rowid, enterprise, category, notes)
+                VALUES ('delete', {SEARCH_KEY.format(row="old")}, old.enterprise, old.category, old.notes);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS receipts_search_update AFTER UPDATE ON receipts
+            WHEN old.date IS NOT new.date OR old.enterprise IS NOT new.enterprise
+                OR old.category IS NOT new.category OR old.notes IS NOT new.notes BEGIN
+                INSERT INTO receipts_search (receipts_search, rowid, enterprise, category, notes)
+                VALUES ('delete', {SEARCH_KEY.format(row="old")}, old.enterprise, old.category, old.notes);
+                INSERT INTO receipts_search (rowid, enterprise, category, notes)
+                VALUES ({SEARCH_KEY.format(row="new")}, new.enterprise, new.category, new.notes);
+            END
+        """)
+        # Génération : incrémentée à chaque écriture, pour détecter les changements faits par d'autres processus
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Mois dont le récapitulatif (data/rollups) est à réécrire
+        init_rollup_state(conn)
+    except sqlite3.DatabaseError:
+        conn.close()
+        raise
+    return conn
+
+# Fonction pour ouvrir l'index (recréé s'il est absent, obsolète ou corrompu)
+def open_receipt_index():
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    try:
+        return init_receipt_index(sqlite3.connect(INDEX_PATH))
+    except sqlite3.DatabaseError:
+        # Fichier illisible : on repart d'un index vide
+        reset_receipt_index()
+        return init_receipt_index(sqlite3.connect(INDEX_PATH))
+
+# Fonction pour supprimer un index inutilisable
+def reset_receipt_index():
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(INDEX_PATH + suffix):
+            os.remove(INDEX_PATH + suffix)
+
+# Fonction pour lire la génération de l'index
+def read_index_generation(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
+
+# Fonction pour incrémenter la génération de l'index (dans la transaction en cours)
+def bump_index_generation(conn):
+    conn.execute("""
+        INSERT INTO meta VALUES ('generation', 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1
+    """)
+    return read_index_generation(conn)
+
+# Fonction pour préparer la ligne de l'index d'un ticket dont le fichier a la signature (mtime, taille) donnée
+def receipt_index_row(signature, receipt):
+    return (receipt['year_month'], receipt['filename'], *signature, receipt['date'], receipt['enterprise'],
+            receipt['total'], receipt['category'], receipt.get('notes', ""))
+
+# Fonction pour écrire des changements dans l'index (dans la transaction en cours)
+# `deleted` : couples (mois, nom de fichier) ; `rows` : lignes de receipt_index_row, ajoutées ou mises à jour
+# Les mois touchés sont notés pour refresh_month_rollups, à appeler une fois la transaction validée
+# Les lignes passent par des tables temporaires pour être écrites en une seule requête : FTS5 vide son tampon
+# à chaque requête qui déclenche ses déclencheurs, une requête par ligne écrirait un segment par ticket.
+# Les nouveaux tickets sont ajoutés par date croissante, pour que les clés de recherche arrivent dans l'ordre
+def write_index_changes(conn, deleted, rows):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS pending_deletes (year_month TEXT, filename TEXT)")
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS pending_rows (
+            year_month TEXT, filename TEXT, mtime_ns INTEGER, size INTEGER,
+            date TEXT, enterprise TEXT, total INTEGER, category TEXT, notes TEXT
+        )
+    """)
+    if deleted:
+        conn.executemany("INSERT INTO pending_deletes VALUES (?, ?)", deleted)
+        conn.execute("DELETE FROM receipts WHERE (year_month, filename) IN (SELECT * FROM pending_deletes)")
+        conn.execute("DELETE FROM pending_deletes")
+    if rows:
+        conn.executemany("INSERT INTO pending_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        # Ligne existante : mise à jour sur place (même id), l'index plein texte n'est touché que si un texte change
+        conn.execute("""
+            INSERT INTO receipts (year_month, filename, mtime_ns, size, date, enterprise, total, category, notes)
+            SELECT * FROM pending_rows WHERE true ORDER BY date
+            ON CONFLICT (year_month, filename) DO UPDATE SET
+                mtime_ns = excluded.mtime_ns, size = excluded.size, date = excluded.date,
+                enterprise = excluded.enterprise, total = excluded.total, category = excluded.category,
+                notes = excluded.notes
+        """)
+        conn.execute("DELETE FROM pending_rows")
+    mark_rollups_dirty(conn, {year_month for year_month, _ in deleted} | {row[0] for row in rows})
+
+# Noms de fichiers connus du processus, par dossier de mois : {chemin du dossier: noms pris}
+# et prochain suffixe de chaque nom : {(chemin du dossier, racine): suffixe}
+# Chaque dossier n'est listé qu'une fois (avec l'archive du mois) ; la création exclusive (O_EXCL) des fichiers
+# reste la garantie entre processus : un nom pris entre-temps par un autre processus est simplement sauté
+taken_filenames = {}
+filename_counters = {}
+filename_lock = threading.Lock()
+
+# Fonction pour obtenir les noms pris dans un dossier de mois : (chemin du dossier, noms pris) ; verrou filename_lock tenu
+def folder_taken_filenames(year_month):
+    # Chemin absolu : les benchmarks changent de dossier de travail d'une arborescence à l'autre
+    folder_path = os.path.abspath(os.path.join("receipts", year_month))
+    taken = taken_filenames.get(folder_path)
+    if taken is None:
+        try:
+            listing = os.listdir(folder_path)
+        except FileNotFoundError:
+            listing = []
+        # Les noms déjà pris dans l'archive du mois (s'il a été archivé) restent réservés
+        taken = taken_filenames[folder_path] = set(listing) | set(read_pack_table(pack_path(year_month))[1])
+    return folder_path, taken
+
+# Fonction pour réserver des noms de fichiers [(mois, nom)] déjà attribués mais pas encore écrits
+# (ex. noms journalisés par la file d'écriture différée avant un arrêt brutal)
+def reserve_filenames(names):
+    with filename_lock:
+        for year_month, filename in names:
+            folder_taken_filenames(year_month)[1].add(filename)
+
+# Fonction pour réserver le prochain suffixe libre d'un nom (partagé entre les sessions du processus)
+def reserve_filename_suffix(year_month, stem):
+    return reserve_filename_suffixes([(year_month, stem)])[0]
+
+# Fonction pour réserver les suffixes d'un lot de noms [(mois, racine)]
+# Un même nom peut apparaître plusieurs fois : chaque occurrence reçoit son propre suffixe
+def reserve_filename_suffixes(names):
+    suffixes = []
+    with filename_lock:
+        for year_month, stem in names:
+            folder_path, taken = folder_taken_filenames(year_month)
+            suffix = filename_counters.get((folder_path, stem), 0)
+            while receipt_filename(stem, suffix) in taken:
+                suffix += 1
+            filename_counters[(folder_path, stem)] = suffix + 1
+            taken.add(receipt_filename(stem, suffix))
+            suffixes.append(suffix)
+    return suffixes
+
+# Motifs des noms de fichiers et du contenu des tickets (compilés une fois)
+RECEIPT_FILENAME_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})_(.+?)(?:_\d+)?\.md$")
+# Total : « **Total:** 12.5€ » (format de l'application) ou « Total : 12,50 € », « Total: 1 234,56€ »...
+TOTAL_PATTERN = re.compile(r'^(?:\*\*)?Total ?:(?:\*\*)?[ \u00a0]*([-+]?\d[\d \u00a0\u202f.,]*?)[ \u00a0]*€', re.MULTILINE)
+CATEGORY_PATTERN = re.compile(r'\*\*Catégorie:\*\* (.+?)\n')
+NOTES_PATTERN = re.compile(r'^## Notes\n', re.MULTILINE)
+
+# Fonction pour extraire la date et l'entreprise d'un nom de fichier (None s'il n'est pas reconnu)
+def parse_receipt_filename(filename):
+    date_match = RECEIPT_FILENAME_PATTERN.match(filename)
+    if not date_match:
+        return None
+    return date_match.group(1), date_match.group(2).replace('_', ' ')
+
+# Fonction pour lire un ticket et en extraire les informations
+def parse_receipt_file(receipt_file, year_month, filename):
+    if not parse_receipt_filename(filename):
+        return None
+    with open(receipt_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return parse_receipt_content(content, year_month, filename)
+
+# Fonction pour extraire les informations d'un ticket à partir de son nom et de son contenu Markdown
+def parse_receipt_content(content, year_month, filename):
+    # Extraire les informations du nom de fichier
+    parsed_filename = parse_receipt_filename(filename)
+    if not parsed_filename:
+        return None
+    date, enterprise = parsed_filename
+    
+    # Extraire le total (en centimes) et la catégorie du contenu
+    total_match = TOTAL_PATTERN.search(content)
+    category_match = CATEGORY_PATTERN.search(content)
+    
+    category = category_match.group(1) if category_match else "Non catégorisé"
+    total = parse_amount(total_match.group(1)) if total_match else 0
+    
+    return {
+        'date': date,
+        'enterprise': enterprise,
+        'total': total,
+        'category': category,
+        'year_month': year_month,
+        'filename': filename,
+        'notes': parse_receipt_notes(content)
+    }
+
+# Fonction pour extraire la section Notes d'un ticket ("" s'il n'y en a pas)
+def parse_receipt_notes(content):
+    notes_match = NOTES_PATTERN.search(content)
+    if not notes_match:
+        return ""
+    notes = content[notes_match.end():].strip()
+    return "" if notes == "_Aucune note_" else notes
+
+# Fonction pour signaler un fichier illisible (journal et, si une liste est fournie, `errors`)
+def report_read_error(message, errors=None):
+    logger.warning(message)
+    if errors is not None:
+        errors.append(message)
+
+# Fonction pour lire un ticket en journalisant les erreurs (None si le fichier est illisible ou mal nommé)
+def read_receipt_entry(filepath, year_month, filename, errors=None):
+    try:
+        return parse_receipt_file(filepath, year_month, filename)
+    except Exception as e:
+        report_read_error(f"Erreur lors de la lecture de {filepath}: {str(e)}", errors)
+        return None
+
+# Fonction pour lire la signature (mtime, taille) de chaque fichier indexé
+def read_indexed_signatures(conn):
+    return {
+        (year_month, filename): (mtime_ns, size)
+        for year_month, filename, mtime_ns, size
+        in conn.execute("SELECT year_month, filename, mtime_ns, size FROM receipts")
+    }
+
+# Lecture parallèle des fichiers lors d'une synchronisation (premier chargement, index reconstruit...)
+# Les dossiers de mois sont listés par un pool de threads (le temps d'ouverture domine sur un stockage réseau),
+# puis les fichiers à relire sont lus par lots, dans le même pool ou dans un pool de processus
+PARSE_WORKERS = int(os.environ.get("EXPENSE_TRACKER_PARSE_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+PARSE_EXECUTORS = ["thread", "process"]
+PARSE_EXECUTOR = os.environ.get("EXPENSE_TRACKER_PARSE_EXECUTOR", "thread")
+PARSE_CHUNK_SIZE = 256
+# En dessous de ce nombre de fichiers à relire, la lecture reste séquentielle (coût du pool inutile)
+PARALLEL_PARSE_THRESHOLD = 2 * PARSE_CHUNK_SIZE
+
+# Fonction pour lister les fichiers d'un dossier de mois avec leur signature (mtime, taille)
+def scan_receipt_folder(year_month):
+    files = []
+    with os.scandir(os.path.join("receipts", year_month)) as entries:
+        for entry in entries:
+            if entry.name.endswith(".md") and entry.is_file():
+                stat = entry.stat()
+                files.append((year_month, entry.name, (stat.st_mtime_ns, stat.st_size)))
+    return files
+
+# Fonction pour lire un lot de fichiers : liste de (ticket ou None, message d'erreur ou None)
+# Sans journalisation ni état partagé, pour pouvoir s'exécuter dans un autre processus
+def parse_receipt_chunk(chunk):
+    results = []
+    for year_month, filename, _ in chunk:
+        filepath = os.path.join("receipts", year_month, filename)
+        try:
+            results.append((parse_receipt_file(filepath, year_month, filename), None))
+        except Exception as e:
+            results.append((None, f"Erreur lors de la lecture de {filepath}: {str(e)}"))
+    return results
+
+# Fonction pour lire des fichiers (mois, nom, signature) : tickets dans le même ordre, None si illisibles
+def parse_receipt_files(files, errors=None, workers=None, executor=None):
+    workers = PARSE_WORKERS if workers is None else workers
+    executor = PARSE_EXECUTOR if executor is None else executor
+    chunks = [files[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(files), PARSE_CHUNK_SIZE)]
+    
+    if workers <= 1 or len(files) < PARALLEL_PARSE_THRESHOLD:
+        results = map(parse_receipt_chunk, chunks)
+    elif executor == "process":
+        # « spawn » : pas de fork d'un processus qui a déjà des threads (serveur Streamlit, watcher)
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+            results = list(pool.map(parse_receipt_chunk, chunks))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="receipt-parser") as pool:
+            results = list(pool.map(parse_receipt_chunk, chunks))
+    
+    receipts = []
+    for chunk_results in results:
+        for receipt, error in chunk_results:
+            if error is not None:
+                report_read_error(error, errors)
+            receipts.append(receipt)
+    return receipts
+
+# Fonction pour synchroniser l'index avec le dossier receipts
+# Seuls les fichiers ajoutés, modifiés (mtime/taille) ou supprimés sont traités
+# Les erreurs de lecture sont journalisées et, si une liste est fournie, ajoutées à `errors`
+def sync_receipt_index(conn, errors=None, workers=None, executor=None):
+    # Lister les fichiers (dossiers de mois et tables des archives) et repérer ceux à relire
+    with timed("scan"):
+        indexed = read_indexed_signatures(conn)
+        workers = PARSE_WORKERS if workers is None else workers
+        folders = [os.path.basename(os.path.dirname(folder)) for folder in glob.glob("receipts/*_*/")]
+        
+        # Lister tous les dossiers de mois en parallèle
+        if workers > 1 and len(folders) > 1:
+            with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="receipt-scanner") as pool:
+                listings = list(pool.map(scan_receipt_folder, folders))
+        else:
+            listings = [scan_receipt_folder(year_month) for year_month in folders]
+        
+        seen = set()
+        changed = []
+        for files in listings:
+            for year_month, filename, signature in files:
+                key = (year_month, filename)
+                seen.add(key)
+                if indexed.get(key) != signature:
+                    changed.append((year_month, filename, signature))
+        
+        # Tickets des mois archivés : les métadonnées viennent de la table de l'archive, sans relire les contenus
+        # Toutes les entrées d'une archive ont sa signature ; un fichier Markdown du même nom est prioritaire
+        upserts = []
+        for path in glob.glob(os.path.join("receipts", "*_*" + PACK_SUFFIX)):
+            year_month = pack_month(os.path.basename(path))
+            if year_month is None:
+                continue
+            try:
+                signature, table = read_pack_table(path)
+            except (OSError, ValueError) as e:
+                report_read_error(f"Erreur lors de la lecture de {path}: {str(e)}", errors)
+                continue
+            for filename, entry in table.items():
+                key = (year_month, filename)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if indexed.get(key) != signature:
+                    upserts.append(receipt_index_row(signature, packed_receipt(entry, year_month, filename)))
+    
+    count("files_scanned", len(seen))
+    with timed("parse"):
+        receipts = parse_receipt_files(changed, errors, workers, executor)
+    count("files_read", len(changed))
+    count("bytes_read", sum(signature[1] for _, _, signature in changed))
+    for (year_month, filename, signature), receipt in zip(changed, receipts):
+        if receipt:
+            upserts.append(receipt_index_row(signature, receipt))
+        else:
+            seen.discard((year_month, filename))
+    
+    deleted = [key for key in indexed if key not in seen]
+    if deleted or upserts:
+        with timed("index_write"), conn:
+            conn.execute("BEGIN IMMEDIATE")
+            write_index_changes(conn, deleted, upserts)
+            bump_index_generation(conn)
+    
+    with timed("rollups"):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            mark_missing_rollups(conn)
+        refresh_month_rollups(conn)
+
+# Fonction pour synchroniser l'index pour quelques fichiers seulement (changements signalés par le watcher)
+# Reçoit des couples (mois, nom de fichier) et retourne (tickets présents, couples supprimés, génération)
+# Les fichiers déjà indexés avec la même signature (mtime/taille) sont lus depuis l'index, pas depuis le disque
+def sync_receipt_entries(keys, errors=None):
+    receipts, removed, upserts, deleted = [], [], [], []
+    packs = {}
+    conn = open_receipt_index()
+    try:
+        for year_month, filename in keys:
+            filepath = os.path.join("receipts", year_month, filename)
+            row = conn.execute("""
+                SELECT mtime_ns, size, date, enterprise, total, category FROM receipts
+                WHERE year_month = ? AND filename = ?
+            """, (year_month, filename)).fetchone()
+            
+            # Fichier Markdown, sinon entrée de l'archive du mois
+            signature, entry = None, None
+            try:
+                stat = os.stat(filepath)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                if year_month not in packs:
+                    packs[year_month] = read_month_pack(year_month, errors)
+                entry = packs[year_month][1].get(filename)
+                if entry is not None:
+                    signature = packs[year_month][0]
+            
+            receipt = None
+            if signature is not None and row is not None and row[:2] == signature:
+                receipt = receipt_from_row((*row[2:], year_month, filename))
+            elif signature is not None:
+                if entry is not None:
+                    receipt = packed_receipt(entry, year_month, filename)
+                else:
+                    receipt = read_receipt_entry(filepath, year_month, filename, errors)
+                    count("files_read")
+                    count("bytes_read", signature[1])
+                if receipt:
+                    upserts.append(receipt_index_row(signature, receipt))
+            
+            if receipt:
+                receipts.append(receipt)
+            else:
+                removed.append((year_month, filename))
+                if row is not None:
+                    deleted.append((year_month, filename))
+        
+        if upserts or deleted:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                write_index_changes(conn, deleted, upserts)
+                bump_index_generation(conn)
+            refresh_month_rollups(conn)
+        generation = read_index_generation(conn)
+    finally:
+        conn.close()
+    
+    return receipts, removed, generation
+
+# Fonction pour lire la table de l'archive d'un mois : (signature, table), ou (None, {}) si absente ou illisible
+def read_month_pack(year_month, errors=None):
+    path = pack_path(year_month)
+    try:
+        return read_pack_table(path)
+    except (OSError, ValueError) as e:
+        report_read_error(f"Erreur lors de la lecture de {path}: {str(e)}", errors)
+        return None, {}
+
+# Fonction pour convertir une entrée de la table d'une archive en ticket
+def packed_receipt(entry, year_month, filename):
+    receipt = receipt_from_row((*entry[2:6], year_month, filename))
+    receipt['notes'] = entry[6]
+    return receipt
+
+# Fonction pour lister les fichiers d'un mois, sur le disque et dans l'index (dossier créé, déplacé ou supprimé)
+def month_receipt_keys(year_month):
+    folder = os.path.join("receipts", year_month)
+    keys = set()
+    if os.path.isdir(folder):
+        keys.update((year_month, filename) for filename in os.listdir(folder) if filename.endswith(".md"))
+    keys.update((year_month, filename) for filename in read_month_pack(year_month)[1])
+    conn = open_receipt_index()
+    try:
+        keys.update(conn.execute("SELECT year_month, filename FROM receipts WHERE year_month = ?", (year_month,)))
+    finally:
+        conn.close()
+    return keys
+
+# Fonction pour enregistrer des tickets dans l'index, en une seule transaction
+# Reçoit des couples (chemin, ticket) et retourne la nouvelle génération de l'index
+def index_receipts(entries):
+    return update_receipt_index(entries, [])
+
+# Fonction pour retirer un ticket de l'index
+def unindex_receipt(year_month, filename, packed=None, signature=None):
+    return update_receipt_index([], [((year_month, filename), (packed, signature))])
+
+# Fonction pour appliquer un lot de changements à l'index, en une seule transaction ; retourne la nouvelle génération
+# `entries` : couples (chemin, ticket) écrits ; `removed` : couples ((mois, nom de fichier), résultat de remove_receipt_file)
+# Pour un ticket archivé, les tickets restants de l'archive prennent sa nouvelle signature (sans être relus)
+def update_receipt_index(entries, removed):
+    rows = []
+    for filepath, receipt in entries:
+        stat = os.stat(filepath)
+        rows.append(receipt_index_row((stat.st_mtime_ns, stat.st_size), receipt))
+    conn = open_receipt_index()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            write_index_changes(conn, [key for key, _ in removed], rows)
+            for (year_month, _), (packed, signature) in removed:
+                if packed and signature is not None:
+                    conn.executemany("UPDATE receipts SET mtime_ns = ?, size = ? WHERE year_month = ? AND filename = ?",
+                                     ((*signature, year_month, name) for name in packed))
+            generation = bump_index_generation(conn)
+        refresh_month_rollups(conn)
+        return generation
+    finally:
+        conn.close()
+
+# Fonction pour ouvrir l'index après l'avoir synchronisé avec le dossier receipts
+# Un index corrompu est supprimé puis reconstruit à partir des fichiers
+def open_synced_receipt_index(errors=None, workers=None):
+    conn = open_receipt_index()
+    with timed("sync"):
+        try:
+            sync_receipt_index(conn, errors, workers)
+        except sqlite3.DatabaseError:
+            conn.close()
+            reset_receipt_index()
+            conn = open_receipt_index()
+            sync_receipt_index(conn, errors, workers)
+    return conn
+
+# Fonction pour convertir une ligne de l'index en ticket
+def receipt_from_row(row):
+    date, enterprise, total, category, year_month, filename = row
+    return {
+        'date': date,
+        'enterprise': enterprise,
+        'total': total,
+        'category': category,
+        'year_month': year_month,
+        'filename': filename
+    }
+
+# Fonction pour parcourir les tickets indexés (du plus récent au plus ancien) sans tout charger en mémoire
+def iter_indexed_receipts(conn, year_month=None, category=None):
+    clauses, params = [], []
+    if year_month is not None:
+        clauses.append("year_month = ?")
+        params.append(year_month)
+    if category is not None:
+        clauses.append("category = ?")
+        params.append(category)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    for row in conn.execute(f"""
+            SELECT date, enterprise, total, category, year_month, filename
+            FROM receipts {where} ORDER BY date DESC, year_month, filename
+        """, params):
+        yield receipt_from_row(row)
+
+# Fonction pour calculer les totaux par mois ou par catégorie directement dans l'index
+# Retourne des tuples (clé, nombre de tickets, total en centimes), triés comme dans l'application
+def indexed_totals(conn, by):
+    if by == "month":
+        query = "SELECT year_month, COUNT(*), SUM(total) FROM receipts GROUP BY year_month ORDER BY year_month DESC"
+    elif by == "category":
+        query = "SELECT category, COUNT(*), SUM(total) FROM receipts GROUP BY category ORDER BY SUM(total) DESC"
+    else:
+        raise ValueError(f"Regroupement inconnu : {by}")
+    return conn.execute(query)
+
+# Fonction pour transformer un texte saisi en requête FTS5 : chaque mot est cherché en début de mot
+# ("rembours carr" trouve les tickets contenant un mot commençant par « rembours » ET un par « carr »)
+def search_query(text):
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{word}"*' for word in words) or None
+
+# Fonction pour rechercher des tickets (du plus récent au plus ancien) par texte, montant et période
+# Le texte est cherché dans l'entreprise, la catégorie et les notes ; les filtres absents (None) sont ignorés
+# Les montants (min_total, max_total) sont en centimes
+def search_receipts(conn, text=None, year_month=None, category=None, min_total=None, max_total=None,
+                    date_from=None, date_to=None, limit=None):
+    clauses, params = [], []
+    for clause, value in (("r.year_month = ?", year_month), ("r.category = ?", category),
+                          ("r.total >= ?", min_total), ("r.total <= ?", max_total),
+                          ("r.date >= ?", date_from), ("r.date <= ?", date_to)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    
+    query = search_query(text)
+    columns = "r.date, r.enterprise, r.total, r.category, r.year_month, r.filename"
+    if query is None:
+        sql = f"SELECT {columns} FROM receipts AS r"
+        order = "ORDER BY r.date DESC, r.year_month, r.filename"
+    else:
+        # L'index plein texte est parcouru par clé décroissante (date, puis ordre d'enregistrement)
+        sql = f"SELECT {columns} FROM receipts_search JOIN receipts AS r ON r.id = receipts_search.rowid & 0xFFFFFFFF"
+        clauses.insert(0, "receipts_search MATCH ?")
+        params.insert(0, query)
+        order = "ORDER BY receipts_search.rowid DESC"
+    if clauses:
+        sql += f" WHERE {' AND '.join(clauses)}"
+    sql += f" {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    
+    with timed("search"):
+        rows = conn.execute(sql, params).fetchall()
+    return [receipt_from_row(row) for row in rows]
+
+# Fonction pour synchroniser puis lire l'index
+# Retourne (génération, tickets) ; les tickets valent None si la génération est déjà connue
+def load_receipt_index(known_generation=None, errors=None):
+    conn = open_synced_receipt_index(errors)
+    try:
+        generation = read_index_generation(conn)
+        if generation == known_generation:
+            return generation, None
+        
+        # Trier par date (plus récent au plus ancien)
+        with timed("index_query"):
+            receipts = list(iter_indexed_receipts(conn))
+    finally:
+        conn.close()
+    
+    return generation, receipts
+
+# Fonction pour charger tous les tickets
+def load_all_receipts():
+    return load_receipt_index()[1]
+
+# Fonction pour supprimer un ticket (et le retirer du magasin s'il est fourni)
+def delete_receipt(year_month, filename, store=None):
+    removed = remove_receipt_file(year_month, filename)
+    if removed is None:
+        return False
+    generation = unindex_receipt(year_month, filename, *removed)
+    if store is not None:
+        store.remove(year_month, filename, generation)
+    return True
+
+# Fonction pour supprimer le fichier d'un ticket, sans toucher à l'index (None si le ticket n'existe pas)
+# Retourne (tickets restants de l'archive, signature de l'archive) pour un ticket archivé, (None, None) sinon
+def remove_receipt_file(year_month, filename):
+    filepath = os.path.join("receipts", year_month, filename)
+    # Verrou de l'archive du mois : un archivage en cours copie puis supprime le fichier avant qu'on le cherche,
+    # et un archivage suivant ne voit plus le fichier supprimé
+    with lock_receipt_pack(pack_path(year_month)):
+        if os.path.exists(filepath):
+            os.remove(filepath)
+            # Vérifier si le dossier est vide après suppression
+            if not os.listdir(os.path.join("receipts", year_month)):
+                os.rmdir(os.path.join("receipts", year_month))
+            return None, None
+    
+    # Ticket d'un mois archivé (l'archive est supprimée avec son dernier ticket)
+    path = pack_path(year_month)
+    if os.path.exists(path):
+        packed = remove_packed_receipt(path, filename)
+        if packed is not None:
+            if not packed:
+                os.remove(path)
+            return packed, pack_signature(path)
+    return None
+
+# Fonction pour afficher un ticket
+def view_receipt(year_month, filename):
+    filepath = os.path.join("receipts", year_month, filename)
+    if os.path.exists(filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+        count("files_read")
+        count("bytes_read", len(content.encode('utf-8')))
+        return content
+    if os.path.exists(pack_path(year_month)):
+        return read_packed_receipt(pack_path(year_month), filename)
+    return None
+
+# Fonction pour archiver un mois : ses fichiers Markdown (et son archive existante) sont regroupés dans une seule archive
+# L'archive est réécrite en entier, ce qui libère la place des tickets supprimés ; retourne le nombre de tickets archivés
+def pack_receipt_month(year_month, errors=None):
+    folder = os.path.join("receipts", year_month)
+    path = pack_path(year_month)
+    items = {}
+    
+    with lock_receipt_pack(path):
+        _, table = read_month_pack(year_month, errors)
+        if table:
+            with open(path, 'rb') as f:
+                for filename, entry in table.items():
+                    f.seek(entry[0])
+                    items[filename] = (f.read(entry[1]).decode('utf-8'), packed_receipt(entry, year_month, filename))
+        
+        packed_files = []
+        for filename in (os.listdir(folder) if os.path.isdir(folder) else []):
+            filepath = os.path.join(folder, filename)
+            if not filename.endswith(".md"):
+                continue
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                receipt = parse_receipt_content(content, year_month, filename)
+            except Exception as e:
+                report_read_error(f"Erreur lors de la lecture de {filepath}: {str(e)}", errors)
+                continue
+            # Les fichiers mal nommés restent dans le dossier
+            if receipt:
+                items[filename] = (content, receipt)
+                packed_files.append(filepath)
+        
+        if not packed_files:
+            return 0
+        
+        # Noms triés : les tickets sont rangés par date dans l'archive (écrite sur le disque avant de
+        # supprimer les fichiers d'origine)
+        write_receipt_pack(path, [items[filename] for filename in sorted(items)])
+        
+        # Fichiers supprimés pendant l'écriture hors de l'application (qui attend le verrou) : retirés de l'archive
+        vanished = [filepath for filepath in packed_files if not os.path.exists(filepath)]
+        if vanished:
+            for filepath in vanished:
+                del items[os.path.basename(filepath)]
+            packed_files = [filepath for filepath in packed_files if filepath not in vanished]
+            if not items:
+                os.remove(path)
+                return 0
+            write_receipt_pack(path, [items[filename] for filename in sorted(items)])
+        
+        # Les tickets gardent leurs métadonnées : seule leur signature change dans l'index
+        signature = pack_signature(path)
+        conn = open_receipt_index()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                write_index_changes(conn, [], [receipt_index_row(signature, receipt) for _, receipt in items.values()])
+                bump_index_generation(conn)
+            refresh_month_rollups(conn)
+        finally:
+            conn.close()
+        
+        # Supprimer les fichiers archivés, puis le dossier s'il est vide (verrou gardé : un autre archivage
+        # du mois attend que les fichiers d'origine aient disparu)
+        for filepath in packed_files:
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+        try:
+            if not os.listdir(folder):
+                os.rmdir(folder)
+        except FileNotFoundError:
+            pass
+    return len(packed_files)
+
+# Fonction pour archiver tous les mois terminés (antérieurs à `before`, au plus tard le mois en cours)
+# Retourne {mois: nombre de tickets archivés}
+def pack_closed_months(before=None, errors=None):
+    current_month = datetime.now().strftime('%Y_%m')
+    before = min(before or current_month, current_month)
+    packed = {}
+    for folder in sorted(glob.glob("receipts/*_*/")):
+        year_month = os.path.basename(os.path.dirname(folder))
+        if year_month < before:
+            packed[year_month] = pack_receipt_month(year_month, errors)
+    return packed
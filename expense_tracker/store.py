@@ -0,0 +1,273 @@
+"""Stockage en colonnes (numpy) des tickets, partagé en lecture entre les sessions.
+
+Les totaux sont en centimes (int64) : les sommes par (mois, catégorie) sont exactes, quel que soit l'ordre
+dans lequel les tickets ont été lus, ajoutés ou retirés.
+"""
+
+import threading
+
+import numpy as np
+
+from expense_tracker.metrics import timed
+from expense_tracker.storage import load_receipt_index
+
+# Colonnes des tickets : instantané immuable, trié par date (plus récent au plus ancien)
+# Les colonnes texte répétitives sont encodées par dictionnaire (un code entier par ligne)
+class ReceiptColumns:
+    def __init__(self, dates, totals, month_codes, category_codes, enterprise_codes, filenames,
+                 months, categories, enterprises, sums, counts, version):
+        self.dates = dates                       # datetime64[D]
+        self.totals = totals                     # int64, en centimes
+        self.month_codes = month_codes           # int32, index dans months
+        self.category_codes = category_codes     # int32, index dans categories
+        self.enterprise_codes = enterprise_codes # int32, index dans enterprises
+        self.filenames = filenames               # object
+        self.months = months                     # dictionnaires {libellé: code}, en ajout seul
+        self.categories = categories
+        self.enterprises = enterprises
+        self.month_labels = list(months)
+        self.category_labels = list(categories)
+        self.enterprise_labels = list(enterprises)
+        self.sums = sums                         # int64 [mois, catégorie], en centimes
+        self.counts = counts                     # int64 [mois, catégorie]
+        self.version = version
+    
+    def __len__(self):
+        return len(self.dates)
+    
+    # Reconstituer un ticket au format dictionnaire (pour l'affichage)
+    def receipt(self, position):
+        return {
+            'date': str(self.dates[position]),
+            'enterprise': self.enterprise_labels[self.enterprise_codes[position]],
+            'total': int(self.totals[position]),
+            'category': self.category_labels[self.category_codes[position]],
+            'year_month': self.month_labels[self.month_codes[position]],
+            'filename': self.filenames[position]
+        }
+    
+    # Noms de fichiers des tickets d'un mois
+    def month_filenames(self, year_month):
+        if year_month not in self.months:
+            return []
+        return list(self.filenames[self.month_codes == self.months[year_month]])
+
+# Fonction pour encoder une liste de libellés en codes entiers
+def encode_labels(values):
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values),
+                        dtype=np.int32, count=len(values))
+    return codes, lookup
+
+# Fonction pour calculer les totaux et nombres de tickets par (mois, catégorie), en une seule passe
+# Additions entières (np.add.at) : contrairement à np.bincount, qui additionne en nombres à virgule, le total est exact
+def cell_totals(month_codes, category_codes, totals, shape):
+    cells = month_codes * shape[1] + category_codes
+    sums = np.zeros(shape[0] * shape[1], dtype=np.int64)
+    np.add.at(sums, cells, totals)
+    counts = np.bincount(cells, minlength=shape[0] * shape[1])
+    return sums.reshape(shape), counts.reshape(shape)
+
+# Fonction pour construire les colonnes à partir d'une liste de tickets triée
+def build_receipt_columns(receipts, version):
+    month_codes, months = encode_labels([r['year_month'] for r in receipts])
+    category_codes, categories = encode_labels([r['category'] for r in receipts])
+    enterprise_codes, enterprises = encode_labels([r['enterprise'] for r in receipts])
+    totals = np.fromiter((r['total'] for r in receipts), dtype=np.int64, count=len(receipts))
+    sums, counts = cell_totals(month_codes, category_codes, totals, (len(months), len(categories)))
+    
+    return ReceiptColumns(
+        np.array([r['date'] for r in receipts], dtype='datetime64[D]'),
+        totals, month_codes, category_codes, enterprise_codes,
+        np.array([r['filename'] for r in receipts], dtype=object),
+        months, categories, enterprises, sums, counts, version
+    )
+
+# Fonction pour obtenir le code d'un libellé (le dictionnaire est copié s'il faut l'agrandir)
+def label_code(lookup, label):
+    if label in lookup:
+        return lookup[label], lookup
+    lookup = dict(lookup)
+    lookup[label] = len(lookup)
+    return lookup[label], lookup
+
+# Fonction pour trouver la position d'un ticket dans les colonnes (recherche dichotomique)
+# Ordre : date décroissante, puis mois et nom de fichier croissants
+def find_receipt_position(columns, date, year_month, filename):
+    date = np.datetime64(date, 'D')
+    key = (year_month, filename)
+    low, high = 0, len(columns)
+    while low < high:
+        middle = (low + high) // 2
+        current = columns.dates[middle]
+        if current > date or (current == date and (
+                columns.month_labels[columns.month_codes[middle]], columns.filenames[middle]) < key):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+# Fonction pour tester si la ligne à une position correspond au ticket donné
+def is_receipt_at(columns, position, year_month, filename):
+    return position < len(columns) and columns.filenames[position] == filename \
+        and columns.month_labels[columns.month_codes[position]] == year_month
+
+# Fonction pour ajouter un ticket (nouvelles colonnes, l'instantané d'origine n'est pas modifié)
+def insert_receipt_row(columns, position, receipt):
+    month_code, months = label_code(columns.months, receipt['year_month'])
+    category_code, categories = label_code(columns.categories, receipt['category'])
+    enterprise_code, enterprises = label_code(columns.enterprises, receipt['enterprise'])
+    
+    # Agrandir la table (mois, catégorie) si un nouveau libellé apparaît
+    shape = (len(months), len(categories))
+    sums = np.zeros(shape, dtype=np.int64)
+    counts = np.zeros(shape, dtype=np.int64)
+    sums[:columns.sums.shape[0], :columns.sums.shape[1]] = columns.sums
+    counts[:columns.counts.shape[0], :columns.counts.shape[1]] = columns.counts
+    sums[month_code, category_code] += receipt['total']
+    counts[month_code, category_code] += 1
+    
+    return ReceiptColumns(
+        np.insert(columns.dates, position, np.datetime64(receipt['date'], 'D')),
+        np.insert(columns.totals, position, receipt['total']),
+        np.insert(columns.month_codes, position, month_code),
+        np.insert(columns.category_codes, position, category_code),
+        np.insert(columns.enterprise_codes, position, enterprise_code),
+        np.insert(columns.filenames, position, receipt['filename']),
+        months, categories, enterprises, sums, counts, columns.version + 1
+    )
+
+# Fonction pour retirer un ticket (nouvelles colonnes, l'instantané d'origine n'est pas modifié)
+def delete_receipt_row(columns, position):
+    month_code = columns.month_codes[position]
+    category_code = columns.category_codes[position]
+    sums = columns.sums.copy()
+    counts = columns.counts.copy()
+    sums[month_code, category_code] -= columns.totals[position]
+    counts[month_code, category_code] -= 1
+    
+    return ReceiptColumns(
+        np.delete(columns.dates, position),
+        np.delete(columns.totals, position),
+        np.delete(columns.month_codes, position),
+        np.delete(columns.category_codes, position),
+        np.delete(columns.enterprise_codes, position),
+        np.delete(columns.filenames, position),
+        columns.months, columns.categories, columns.enterprises, sums, counts, columns.version + 1
+    )
+
+# Fonction pour ajouter un lot de tickets absents des colonnes (fusion vectorisée puis tri)
+# Les tickets déjà présents sont écartés par apply_receipt_changes, qui est le seul appelant
+def merge_receipt_columns(columns, receipts):
+    months, categories, enterprises = dict(columns.months), dict(columns.categories), dict(columns.enterprises)
+    count = len(receipts)
+    month_codes = np.fromiter((months.setdefault(r['year_month'], len(months)) for r in receipts), np.int32, count)
+    category_codes = np.fromiter((categories.setdefault(r['category'], len(categories)) for r in receipts), np.int32, count)
+    enterprise_codes = np.fromiter((enterprises.setdefault(r['enterprise'], len(enterprises)) for r in receipts), np.int32, count)
+    
+    dates = np.concatenate((columns.dates, np.array([r['date'] for r in receipts], dtype='datetime64[D]')))
+    totals = np.concatenate((columns.totals, np.fromiter((r['total'] for r in receipts), dtype=np.int64, count=count)))
+    month_codes = np.concatenate((columns.month_codes, month_codes))
+    category_codes = np.concatenate((columns.category_codes, category_codes))
+    enterprise_codes = np.concatenate((columns.enterprise_codes, enterprise_codes))
+    filenames = np.concatenate((columns.filenames, np.array([r['filename'] for r in receipts], dtype=object)))
+    
+    # Trier : date décroissante, puis mois et nom de fichier croissants
+    month_ranks = np.argsort(np.argsort(np.array(list(months), dtype=str)))
+    order = np.lexsort((filenames.astype(str), month_ranks[month_codes], -dates.astype(np.int64)))
+    
+    sums, counts = cell_totals(month_codes, category_codes, totals, (len(months), len(categories)))
+    
+    return ReceiptColumns(
+        dates[order], totals[order], month_codes[order], category_codes[order], enterprise_codes[order],
+        filenames[order], months, categories, enterprises, sums, counts, columns.version + 1
+    )
+
+# Au-delà de ce nombre de tickets ajoutés d'un coup, fusionner les colonnes plutôt qu'insérer ligne par ligne
+MERGE_THRESHOLD = 32
+
+# Fonction pour appliquer un lot de changements : tickets présents (ajoutés ou modifiés) et tickets supprimés
+# Les tickets déjà identiques dans l'instantané (ex. écrits par cette même session) ne créent pas de version
+def apply_receipt_changes(columns, receipts, removed):
+    added = []
+    for receipt in receipts:
+        position = find_receipt_position(columns, receipt['date'], receipt['year_month'], receipt['filename'])
+        if is_receipt_at(columns, position, receipt['year_month'], receipt['filename']):
+            # Comparaison sur les champs des colonnes : les notes (index plein texte) ne sont pas dans le magasin
+            stored = columns.receipt(position)
+            if all(receipt[key] == value for key, value in stored.items()):
+                continue
+            columns = delete_receipt_row(columns, position)
+        added.append(receipt)
+    for year_month, filename in removed:
+        position = find_receipt_position(columns, filename[:10], year_month, filename)
+        if is_receipt_at(columns, position, year_month, filename):
+            columns = delete_receipt_row(columns, position)
+    
+    # Quelques tickets : insertion à leur place ; un gros lot (ex. synchronisation) : fusion puis tri
+    if len(added) > MERGE_THRESHOLD:
+        return merge_receipt_columns(columns, added)
+    for receipt in added:
+        position = find_receipt_position(columns, receipt['date'], receipt['year_month'], receipt['filename'])
+        columns = insert_receipt_row(columns, position, receipt)
+    return columns
+
+# Magasin de tickets partagé par toutes les sessions du processus
+# Les lecteurs utilisent l'instantané `columns` ; les écritures le remplacent sous verrou
+class ReceiptStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = build_receipt_columns([], 0)
+        self.generation = None
+    
+    # Resynchroniser avec les fichiers (seulement si l'index a changé, y compris depuis un autre processus)
+    # Retourne la liste des erreurs de lecture rencontrées
+    def refresh(self):
+        errors = []
+        with self.lock:
+            generation, receipts = load_receipt_index(self.generation, errors)
+            if receipts is not None:
+                with timed("store_build"):
+                    self.columns = build_receipt_columns(receipts, self.columns.version + 1)
+            self.generation = generation
+        return errors
+    
+    # Suivre la génération de l'index si l'écriture qu'on applique est la seule depuis le dernier état connu
+    # (sinon le prochain refresh relira l'index pour récupérer les autres écritures)
+    def follow_generation(self, generation):
+        if generation is not None and self.generation is not None and generation == self.generation + 1:
+            self.generation = generation
+    
+    def add(self, receipt, generation=None):
+        with self.lock:
+            columns = self.columns
+            position = find_receipt_position(columns, receipt['date'], receipt['year_month'], receipt['filename'])
+            if is_receipt_at(columns, position, receipt['year_month'], receipt['filename']):
+                columns = delete_receipt_row(columns, position)
+            self.columns = insert_receipt_row(columns, position, receipt)
+            self.follow_generation(generation)
+    
+    # Appliquer un lot de changements constatés sur le disque (watcher) : tickets présents et tickets supprimés
+    def apply_changes(self, receipts, removed, generation=None):
+        with self.lock:
+            self.columns = apply_receipt_changes(self.columns, receipts, removed)
+            
+            # Le watcher voit toutes les écritures, y compris celles des autres processus :
+            # l'instantané est à jour pour la génération lue après l'application du lot
+            if generation is not None:
+                self.generation = generation
+    
+    # Appliquer un lot écrit par ce processus (file d'écriture différée, import en masse) : tickets enregistrés
+    # et tickets supprimés. Le watcher a pu appliquer les mêmes fichiers avant : ils ne sont pas ajoutés deux fois
+    def apply_writes(self, receipts, removed, generation=None):
+        with self.lock:
+            self.columns = apply_receipt_changes(self.columns, receipts, removed)
+            self.follow_generation(generation)
+    
+    def remove(self, year_month, filename, generation=None):
+        with self.lock:
+            # La date est le préfixe du nom de fichier (AAAA-MM-JJ_...)
+            position = find_receipt_position(self.columns, filename[:10], year_month, filename)
+            if is_receipt_at(self.columns, position, year_month, filename):
+                self.columns = delete_receipt_row(self.columns, position)
+            self.follow_generation(generation)
@@ -0,0 +1,301 @@
+"""Surveillance du dossier receipts : les fichiers ajoutés, modifiés ou supprimés (par cette application,
+un autre processus ou une synchronisation) sont appliqués au fil de l'eau au magasin partagé.
+
+inotify (Linux) est utilisé s'il est disponible, sinon un balayage périodique des dossiers de mois.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+from expense_tracker.storage import (
+    is_month_folder,
+    month_receipt_keys,
+    open_receipt_index,
+    pack_month,
+    read_indexed_signatures,
+    sync_receipt_entries,
+)
+
+logger = logging.getLogger("expense_tracker")
+
+RECEIPTS_ROOT = "receipts"
+WATCHER_MODES = ["auto", "inotify", "poll", "off"]
+DEFAULT_WATCHER_MODE = os.environ.get("EXPENSE_TRACKER_WATCHER", "auto")
+
+# Délai de regroupement des événements avant application (une copie de 100 fichiers = un seul lot)
+SETTLE_DELAY = 0.1
+# Intervalle du balayage périodique (mode poll) ; les fichiers modifiés sur place ne changent pas
+# la date du dossier : la signature de chaque fichier est revérifiée à chaque balayage
+POLL_INTERVAL = 1.0
+
+# Constantes inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+ROOT_EVENTS = IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+MONTH_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# Accès à inotify par ctypes (aucune dépendance supplémentaire)
+class Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify indisponible")
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+    
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+        return wd
+    
+    # Lire les événements disponibles : liste de (wd, masque, nom)
+    def read_events(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+# Surveillance du dossier receipts pour un magasin (un seul fil d'exécution par processus)
+class ReceiptWatcher:
+    def __init__(self, store, mode=DEFAULT_WATCHER_MODE):
+        self.store = store
+        self.mode = mode
+        self.backend = None
+        self.running = False
+        self.stopping = threading.Event()
+        self.thread = None
+        self.pending = set()
+        self.full_refresh = False
+    
+    # Démarrer la surveillance : les dossiers sont surveillés AVANT la synchronisation initiale,
+    # pour ne manquer aucun fichier écrit entre les deux
+    def start(self):
+        if self.mode == "off":
+            return False
+        self.inotify = None
+        if self.mode in ("auto", "inotify"):
+            try:
+                self.inotify = Inotify()
+                self.watches = {}
+                self.watch_folders()
+                self.backend = "inotify"
+            except OSError as e:
+                if self.inotify is not None:
+                    self.inotify.close()
+                    self.inotify = None
+                if self.mode == "inotify":
+                    raise
+                logger.info("inotify indisponible (%s) : balayage périodique du dossier receipts", e)
+        if self.inotify is None:
+            self.backend = "poll"
+        
+        self.store.refresh()
+        if self.backend == "poll":
+            self.snapshot = self.indexed_snapshot()
+            self.folder_mtimes = self.read_folder_mtimes()
+        
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="receipt-watcher", daemon=True)
+        self.thread.start()
+        return True
+    
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.running = False
+    
+    def run(self):
+        batch_start = None
+        while not self.stopping.is_set():
+            try:
+                if self.backend == "inotify":
+                    events = self.inotify.read_events(SETTLE_DELAY if self.pending else POLL_INTERVAL)
+                    for wd, mask, name in events:
+                        self.handle_event(wd, mask, name)
+                    if not self.pending and not self.full_refresh:
+                        continue
+                    batch_start = batch_start or time.monotonic()
+                    # Appliquer dès que les événements se calment, ou au plus tard après une demi-seconde
+                    if not events or time.monotonic() - batch_start > POLL_INTERVAL / 2:
+                        self.flush()
+                        batch_start = None
+                else:
+                    self.stopping.wait(POLL_INTERVAL)
+                    self.poll()
+                    self.flush()
+            except Exception:
+                # Ne jamais arrêter la surveillance : l'erreur est journalisée et tout sera relu
+                logger.exception("Erreur de la surveillance du dossier receipts")
+                self.full_refresh = True
+                batch_start = None
+                self.stopping.wait(POLL_INTERVAL)
+        if self.inotify is not None:
+            self.inotify.close()
+    
+    # Appliquer les changements en attente au magasin
+    def flush(self):
+        if self.full_refresh:
+            self.full_refresh = False
+            self.pending.clear()
+            if self.backend == "inotify":
+                self.watch_folders()
+            self.store.refresh()
+            if self.backend == "poll":
+                self.snapshot = self.indexed_snapshot()
+            return
+        if not self.pending:
+            return
+        keys, self.pending = sorted(self.pending), set()
+        receipts, removed, generation = sync_receipt_entries(keys)
+        self.store.apply_changes(receipts, removed, generation)
+    
+    # Tickets d'un mois à revérifier : fichiers, archive et index, plus ceux du magasin
+    # (un autre processus a pu les retirer de l'index avant que l'événement soit traité)
+    def month_keys(self, year_month):
+        keys = month_receipt_keys(year_month)
+        keys.update((year_month, filename) for filename in self.store.columns.month_filenames(year_month))
+        return keys
+    
+    # Surveiller le dossier receipts et chacun de ses dossiers de mois
+    def watch_folders(self):
+        os.makedirs(RECEIPTS_ROOT, exist_ok=True)
+        self.watches = {self.inotify.add_watch(RECEIPTS_ROOT, ROOT_EVENTS): None}
+        for name in os.listdir(RECEIPTS_ROOT):
+            if is_month_folder(name):
+                self.watch_month(name)
+    
+    def watch_month(self, year_month):
+        try:
+            self.watches[self.inotify.add_watch(os.path.join(RECEIPTS_ROOT, year_month), MONTH_EVENTS)] = year_month
+        except FileNotFoundError:
+            pass
+    
+    def handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # File d'événements saturée : des changements ont été perdus
+            self.full_refresh = True
+            return
+        if mask & IN_IGNORED:
+            # Surveillance retirée (dossier supprimé) ; le dossier racine est recréé au besoin
+            if self.watches.pop(wd, 0) is None:
+                self.full_refresh = True
+            return
+        if wd not in self.watches:
+            return
+        
+        year_month = self.watches[wd]
+        if year_month is None:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.full_refresh = True
+            elif mask & IN_ISDIR and is_month_folder(name):
+                # Dossier de mois créé, déplacé ou supprimé : revérifier tous ses fichiers
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_month(name)
+                self.pending.update(self.month_keys(name))
+            elif pack_month(name) and not mask & IN_ISDIR:
+                # Archive d'un mois créée, modifiée (ticket retiré) ou supprimée
+                self.pending.update(self.month_keys(pack_month(name)))
+        elif name.endswith(".md") and not mask & IN_ISDIR:
+            self.pending.add((year_month, name))
+    
+    # Signatures (mtime, taille) connues, par mois : {mois: {nom de fichier: signature}}
+    def indexed_snapshot(self):
+        conn = open_receipt_index()
+        try:
+            signatures = read_indexed_signatures(conn)
+        finally:
+            conn.close()
+        snapshot = {}
+        for (year_month, filename), signature in signatures.items():
+            snapshot.setdefault(year_month, {})[filename] = signature
+        return snapshot
+    
+    # Dates des dossiers de mois et signatures (mtime, taille) des archives : {nom: valeur}
+    def read_folder_mtimes(self):
+        mtimes = {}
+        try:
+            with os.scandir(RECEIPTS_ROOT) as entries:
+                for entry in entries:
+                    if is_month_folder(entry.name) and entry.is_dir():
+                        mtimes[entry.name] = entry.stat().st_mtime_ns
+                    elif pack_month(entry.name) and entry.is_file():
+                        stat = entry.stat()
+                        mtimes[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return mtimes
+    
+    # Relire tous les dossiers de mois et comparer la signature (mtime, taille) de chaque fichier à celle connue :
+    # un fichier modifié sur place ne change pas la date de son dossier. Les archives ne sont relues que si
+    # leur signature a changé, et les dossiers disparus depuis le balayage précédent sont revérifiés
+    def poll(self):
+        folder_mtimes = self.read_folder_mtimes()
+        changed = set(self.folder_mtimes) - set(folder_mtimes)
+        changed.update(name for name, mtime in folder_mtimes.items()
+                       if is_month_folder(name) or self.folder_mtimes.get(name) != mtime)
+        self.folder_mtimes = folder_mtimes
+        
+        for name in changed:
+            if pack_month(name):
+                self.pending.update(self.month_keys(pack_month(name)))
+                continue
+            year_month = name
+            files = {}
+            if year_month in folder_mtimes:
+                try:
+                    with os.scandir(os.path.join(RECEIPTS_ROOT, year_month)) as entries:
+                        for entry in entries:
+                            if entry.name.endswith(".md") and entry.is_file():
+                                stat = entry.stat()
+                                files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    pass
+            known = self.snapshot.pop(year_month, {})
+            self.pending.update((year_month, filename) for filename in known if filename not in files)
+            self.pending.update((year_month, filename) for filename, signature in files.items()
+                                if known.get(filename) != signature)
+            if files:
+                self.snapshot[year_month] = files
+
+# Fonction pour démarrer la surveillance d'un magasin (None si elle est désactivée)
+def start_receipt_watcher(store, mode=DEFAULT_WATCHER_MODE):
+    watcher = ReceiptWatcher(store, mode)
+    return watcher if watcher.start() else None
@@ -0,0 +1,16 @@
+"""Configuration des tests : chaque test travaille dans un dossier vide (receipts/ et data/ sont relatifs)."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker.storage import create_folder_structure
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    create_folder_structure()
+    return tmp_path
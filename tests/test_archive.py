@@ -0,0 +1,112 @@
+"""Archives des mois terminés : regroupement, lecture, suppression d'un ticket pendant ou après l'archivage."""
+
+import os
+import time
+import threading
+
+from expense_tracker import storage
+from expense_tracker.archive import (
+    PACK_HEADER,
+    PACK_MAGIC,
+    pack_path,
+    read_pack_table,
+    write_receipt_pack,
+)
+from expense_tracker.storage import (
+    delete_receipt,
+    format_receipt_markdown,
+    load_all_receipts,
+    pack_receipt_month,
+    save_receipt_as_markdown,
+    view_receipt,
+)
+
+# Fonction pour lire la signature de format (en-tête) d'une archive
+def pack_magic(path):
+    with open(path, 'rb') as f:
+        return f.read(PACK_HEADER.size)[:8]
+
+def summary(receipts):
+    return sorted((r['filename'], r['date'], r['enterprise'], r['total'], r['category']) for r in receipts)
+
+def test_pack_round_trip():
+    saved = [save_receipt_as_markdown(f"2024-03-{day:02d}", "Shop", 1000 + day, "Alimentation", f"note {day}")
+             for day in range(1, 6)]
+    before = summary(load_all_receipts())
+    contents = {filename: view_receipt(year_month, filename) for year_month, filename in saved}
+    
+    assert pack_receipt_month("2024_03") == 5
+    assert not os.path.exists(os.path.join("receipts", "2024_03"))
+    assert pack_magic(pack_path("2024_03")) == PACK_MAGIC
+    assert summary(load_all_receipts()) == before
+    for year_month, filename in saved:
+        assert view_receipt(year_month, filename) == contents[filename]
+    
+    # Nouveau ticket du même mois : archivé avec les autres, sans reprendre un nom déjà archivé
+    year_month, filename = save_receipt_as_markdown("2024-03-01", "Shop", 1, "Alimentation", "")
+    assert (year_month, filename) not in saved
+    assert pack_receipt_month("2024_03") == 1
+    assert len(load_all_receipts()) == 6
+
+def test_delete_packed_receipt():
+    saved = [save_receipt_as_markdown(f"2024-04-{day:02d}", "Shop", 100 * day, "A", "") for day in (1, 2)]
+    pack_receipt_month("2024_04")
+    
+    assert delete_receipt(*saved[0])
+    assert not delete_receipt(*saved[0])
+    _, table = read_pack_table(pack_path("2024_04"))
+    assert list(table) == [saved[1][1]]
+    assert [r['filename'] for r in load_all_receipts()] == [saved[1][1]]
+    assert view_receipt(*saved[0]) is None
+    
+    # Dernier ticket supprimé : l'archive disparaît
+    assert delete_receipt(*saved[1])
+    assert not os.path.exists(pack_path("2024_04"))
+    assert load_all_receipts() == []
+
+def test_delete_during_packing_removes_the_ticket_from_the_archive(monkeypatch):
+    saved = [save_receipt_as_markdown(f"2024-05-{day:02d}", "Shop", 100 * day, "A", "") for day in (1, 2)]
+    writing = threading.Event()
+    
+    # Archivage ralenti : la suppression arrive pendant l'écriture de l'archive
+    def slow_write(path, items):
+        writing.set()
+        time.sleep(0.2)
+        return write_receipt_pack(path, items)
+    
+    monkeypatch.setattr(storage, "write_receipt_pack", slow_write)
+    thread = threading.Thread(target=pack_receipt_month, args=("2024_05",))
+    thread.start()
+    assert writing.wait(5)
+    assert delete_receipt(*saved[0])
+    thread.join()
+    
+    _, table = read_pack_table(pack_path("2024_05"))
+    assert list(table) == [saved[1][1]]
+    assert [r['filename'] for r in load_all_receipts()] == [saved[1][1]]
+    assert not os.path.exists(os.path.join("receipts", "2024_05"))
+
+def test_file_deleted_while_packing_is_not_archived(monkeypatch):
+    saved = [save_receipt_as_markdown(f"2024-07-{day:02d}", "Shop", 100 * day, "A", "") for day in (1, 2, 3)]
+    
+    # Fichier supprimé (hors application) pendant l'écriture de l'archive
+    def write_then_lose_file(path, items):
+        table = write_receipt_pack(path, items)
+        if os.path.exists(os.path.join("receipts", *saved[0])):
+            os.remove(os.path.join("receipts", *saved[0]))
+        return table
+    
+    monkeypatch.setattr(storage, "write_receipt_pack", write_then_lose_file)
+    assert pack_receipt_month("2024_07") == 2
+    _, table = read_pack_table(pack_path("2024_07"))
+    assert sorted(table) == [saved[1][1], saved[2][1]]
+    assert view_receipt(*saved[0]) is None
+    assert not os.path.exists(os.path.join("receipts", "2024_07"))
+
+def test_pack_keeps_unreadable_files():
+    save_receipt_as_markdown("2024-06-01", "Shop", 100, "A", "")
+    with open(os.path.join("receipts", "2024_06", "notes.md"), 'w', encoding='utf-8') as f:
+        f.write(format_receipt_markdown("2024-06-02", "Shop", 100, "A", ""))
+    
+    assert pack_receipt_month("2024_06") == 1
+    assert os.listdir(os.path.join("receipts", "2024_06")) == ["notes.md"]
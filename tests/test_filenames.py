@@ -0,0 +1,44 @@
+"""Noms de fichiers des tickets : suffixes _1, _2... réservés sans relister les dossiers, y compris entre fils d'exécution."""
+
+import os
+import threading
+
+from expense_tracker.storage import create_receipt_files, save_receipt_as_markdown
+
+def month_files(year_month):
+    return sorted(os.listdir(os.path.join("receipts", year_month)))
+
+def test_duplicates_get_increasing_suffixes():
+    names = [save_receipt_as_markdown("2025-06-01", "Le Shop", 100, "A", "")[1] for _ in range(3)]
+    assert names == ["2025-06-01_Le_Shop.md", "2025-06-01_Le_Shop_1.md", "2025-06-01_Le_Shop_2.md"]
+
+def test_names_already_on_disk_are_skipped():
+    # Fichiers présents avant le premier enregistrement du processus, puis créés par un autre processus
+    os.makedirs(os.path.join("receipts", "2025_06"))
+    open(os.path.join("receipts", "2025_06", "2025-06-02_Shop.md"), 'w').close()
+    assert save_receipt_as_markdown("2025-06-02", "Shop", 100, "A", "")[1] == "2025-06-02_Shop_1.md"
+    open(os.path.join("receipts", "2025_06", "2025-06-02_Shop_2.md"), 'w').close()
+    assert save_receipt_as_markdown("2025-06-02", "Shop", 100, "A", "")[1] == "2025-06-02_Shop_3.md"
+    
+    # Lot réservé en une fois : le nom pris entre-temps est remplacé
+    open(os.path.join("receipts", "2025_06", "2025-06-02_Shop_4.md"), 'w').close()
+    names = create_receipt_files([("2025-06-02", "Shop", "a"), ("2025-06-02", "Shop", "b")])
+    assert sorted(names) == [("2025_06", "2025-06-02_Shop_5.md"), ("2025_06", "2025-06-02_Shop_6.md")]
+    for (year_month, filename), content in zip(names, ["a", "b"]):
+        with open(os.path.join("receipts", year_month, filename), encoding='utf-8') as f:
+            assert f.read() == content
+
+def test_concurrent_saves_never_share_a_name():
+    names = []
+    
+    def save_many():
+        for _ in range(25):
+            names.append(save_receipt_as_markdown("2025-07-14", "Shop", 100, "A", "")[1])
+    
+    threads = [threading.Thread(target=save_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == 200
+    assert len(month_files("2025_07")) == 200
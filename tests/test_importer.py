@@ -0,0 +1,69 @@
+"""Import de relevés bancaires : lecture CSV et OFX, crédits ignorés, lots écrits et indexés."""
+
+import io
+
+from expense_tracker import importer
+from expense_tracker.importer import import_bank_statement
+from expense_tracker.storage import load_all_receipts
+
+OFX_STATEMENT = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250312120000<TRNAMT>-23.40<NAME>CB CARREFOUR</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250313<TRNAMT>1500.00<NAME>VIR SALAIRE</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250314<TRNAMT>-5<MEMO>SNCF / TGV</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+def summary(receipts):
+    return sorted((r['date'], r['enterprise'], r['total'], r['category']) for r in receipts)
+
+def test_csv_statement_in_cp1252_with_debit_and_credit_columns():
+    statement = ("Date opération;Libellé;Débit;Crédit;Catégorie\n"
+                 "02/01/2025;CB Boulangerie Pâtisserie;3,20;;Alimentation\n"
+                 "03/01/2025;VIR Remboursement;;45,00;\n"
+                 "04/01/2025;PRLV EDF;-1 234,56;;\n"
+                 "pas une date;CB Inconnue;1,00;;\n").encode('cp1252')
+    receipts, generation, stats = import_bank_statement(io.BytesIO(statement), "releve.csv", "Autre")
+    
+    assert stats == {'imported': 2, 'skipped': 1, 'invalid': 1}
+    assert generation is not None
+    assert summary(receipts) == [("2025-01-02", "CB Boulangerie Pâtisserie", 320, "Alimentation"),
+                                 ("2025-01-04", "PRLV EDF", 123456, "Autre")]
+    assert summary(load_all_receipts()) == summary(receipts)
+    # Les notes gardent le libellé d'origine (recherche plein texte)
+    assert receipts[0]['notes'] == "Importé depuis releve.csv : CB Boulangerie Pâtisserie"
+
+def test_ofx_statement_with_credits():
+    receipts, _, stats = import_bank_statement(io.BytesIO(OFX_STATEMENT.encode('utf-8')), "releve.ofx",
+                                               include_credits=True)
+    assert stats == {'imported': 3, 'skipped': 0, 'invalid': 0}
+    assert summary(receipts) == [("2025-03-12", "CB CARREFOUR", 2340, "Autre"),
+                                 ("2025-03-13", "VIR SALAIRE", 150000, "Autre"),
+                                 ("2025-03-14", "SNCF TGV", 500, "Autre")]
+
+def test_chunks_are_written_and_indexed_with_unique_names(monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 4)
+    rows = [f"2025-02-{day:02d},Magasin,-{day}.00" for day in (1, 1, 1, 2, 2, 3, 3, 3, 3, 4)]
+    statement = "\n".join(["date,label,amount"] + rows).encode('utf-8')
+    indexed = []
+    original = importer.index_receipts
+    monkeypatch.setattr(importer, "index_receipts", lambda entries: indexed.append(len(entries)) or original(entries))
+    
+    receipts, _, stats = import_bank_statement(io.BytesIO(statement), "releve.csv")
+    assert stats['imported'] == 10
+    # Une transaction d'index par lot
+    assert indexed == [4, 4, 2]
+    filenames = sorted(r['filename'] for r in load_all_receipts())
+    assert len(set(filenames)) == 10
+    assert filenames[:3] == ["2025-02-01_Magasin.md", "2025-02-01_Magasin_1.md", "2025-02-01_Magasin_2.md"]
+
+def test_date_formats_are_tracked_per_statement():
+    first = importer.import_date_parser()
+    assert first("2025-03-04") == "2025-03-04"
+    assert first("04.03.2025") == "2025-03-04"
+    assert first("31/12/24") == "2024-12-31"
+    assert first("le 4 mars") is None
+    # Un autre relevé part de l'ordre initial des formats, quel que soit le précédent
+    second = importer.import_date_parser()
+    assert second("04/03/2025") == "2025-03-04"
+    assert importer.IMPORT_DATE_FORMATS[0] == "%d/%m/%Y"
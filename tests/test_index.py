@@ -0,0 +1,76 @@
+"""Index SQLite des tickets : synchronisation incrémentale (signature mtime/taille), génération et reconstruction."""
+
+import os
+
+from expense_tracker.metrics import MetricsRecorder, activate_recorder, deactivate_recorder
+from expense_tracker.storage import (
+    INDEX_PATH,
+    format_receipt_markdown,
+    load_receipt_index,
+    open_receipt_index,
+)
+
+# Fonction pour écrire un ticket comme le ferait un autre programme (sans passer par l'index)
+def write_receipt(year_month, filename, total, category="A"):
+    os.makedirs(os.path.join("receipts", year_month), exist_ok=True)
+    with open(os.path.join("receipts", year_month, filename), 'w', encoding='utf-8') as f:
+        f.write(format_receipt_markdown(filename[:10], "Shop", total, category, ""))
+
+# Fonction pour synchroniser l'index : (génération, tickets ou None, fichiers relus)
+def load(known_generation=None, errors=None):
+    recorder = MetricsRecorder()
+    token = activate_recorder(recorder)
+    try:
+        generation, receipts = load_receipt_index(known_generation, errors)
+    finally:
+        deactivate_recorder(token)
+    return generation, receipts, recorder.snapshot()[1].get("files_read", 0)
+
+def summary(receipts):
+    return [(r['filename'], r['total']) for r in receipts]
+
+def test_sync_reads_only_added_and_modified_files():
+    for day in range(1, 6):
+        write_receipt("2025_01", f"2025-01-{day:02d}_Shop.md", day * 100)
+    generation, receipts, files_read = load()
+    assert files_read == 5
+    # Du plus récent au plus ancien
+    assert summary(receipts)[0] == ("2025-01-05_Shop.md", 500)
+    
+    # Rien n'a changé : ni relecture, ni nouvelle génération
+    assert load(generation) == (generation, None, 0)
+    
+    write_receipt("2025_01", "2025-01-02_Shop.md", 12345)
+    write_receipt("2025_02", "2025-02-01_Shop.md", 1)
+    os.remove(os.path.join("receipts", "2025_01", "2025-01-04_Shop.md"))
+    new_generation, receipts, files_read = load(generation)
+    assert files_read == 2
+    assert new_generation > generation
+    assert summary(receipts) == [("2025-02-01_Shop.md", 1), ("2025-01-05_Shop.md", 500),
+                                 ("2025-01-03_Shop.md", 300), ("2025-01-02_Shop.md", 12345),
+                                 ("2025-01-01_Shop.md", 100)]
+
+def test_unreadable_files_are_reported_and_not_indexed():
+    write_receipt("2025_03", "2025-03-01_Shop.md", 100)
+    with open(os.path.join("receipts", "2025_03", "2025-03-02_Broken.md"), 'w', encoding='utf-8') as f:
+        # Montant au-delà de la limite de l'index
+        f.write("# Ticket: Broken\n\n**Date:** 2025-03-02\n\n**Catégorie:** A\n\n**Total:** 99999999999999,00€\n")
+    errors = []
+    _, receipts, _ = load(errors=errors)
+    assert summary(receipts) == [("2025-03-01_Shop.md", 100)]
+    assert len(errors) == 1 and "2025-03-02_Broken.md" in errors[0]
+
+def test_corrupt_or_outdated_index_is_rebuilt():
+    write_receipt("2025_04", "2025-04-01_Shop.md", 100)
+    load()
+    with open(INDEX_PATH, 'wb') as f:
+        f.write(b"pas une base SQLite" * 100)
+    _, receipts, files_read = load()
+    assert (summary(receipts), files_read) == ([("2025-04-01_Shop.md", 100)], 1)
+    
+    # Version d'index différente : tables recréées, tickets relus
+    conn = open_receipt_index()
+    conn.execute("PRAGMA user_version = 1")
+    conn.close()
+    _, receipts, files_read = load()
+    assert (summary(receipts), files_read) == ([("2025-04-01_Shop.md", 100)], 1)
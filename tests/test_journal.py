@@ -0,0 +1,156 @@
+"""Écriture différée : application des opérations, reprise après un arrêt brutal et opérations impossibles."""
+
+import os
+import json
+
+import pytest
+
+from expense_tracker import journal
+from expense_tracker.journal import JOURNAL_PATH, ReceiptWriteQueue, replay_receipt_journal
+from expense_tracker.storage import format_receipt_markdown, load_all_receipts, save_receipt_as_markdown
+from expense_tracker.store import ReceiptStore
+
+@pytest.fixture
+def writer():
+    store = ReceiptStore()
+    store.refresh()
+    queue = ReceiptWriteQueue(store)
+    assert queue.start()
+    yield queue
+    queue.stop()
+    queue.close()
+
+# Fonction pour écrire un journal tel qu'un processus arrêté brutalement a pu le laisser
+def write_journal(records, tail=""):
+    with open(JOURNAL_PATH, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.write(tail)
+
+def save_record(seq, date, enterprise, total):
+    return {'seq': seq, 'op': 'save', 'date': date, 'enterprise': enterprise,
+            'content': format_receipt_markdown(date, enterprise, total, "A", "")}
+
+def saved_files():
+    return sorted((r['filename'], r['total']) for r in load_all_receipts())
+
+def test_save_and_delete_are_applied(writer):
+    seqs = [writer.save("2025-03-01", "Shop", 100 + i, "A", f"note {i}") for i in range(20)]
+    assert seqs == sorted(seqs)
+    assert writer.flush(10)
+    assert len(load_all_receipts()) == 20
+    assert len(writer.store.columns.filenames) == 20
+    assert os.path.getsize(JOURNAL_PATH) == 0
+    
+    year_month, filename = "2025_03", writer.store.columns.filenames[0]
+    assert writer.delete(year_month, filename)
+    # Retiré du magasin dès l'acquittement, puis du disque avec le lot
+    assert filename not in writer.store.columns.filenames
+    assert writer.flush(10)
+    assert not os.path.exists(os.path.join("receipts", year_month, filename))
+    assert len(load_all_receipts()) == 19
+
+@pytest.mark.skipif(journal.fcntl is None, reason="pas de verrou entre processus sous Windows")
+def test_journal_is_held_by_one_queue(writer):
+    assert not ReceiptWriteQueue().start()
+
+def test_replay_after_crash():
+    save_receipt_as_markdown("2025-05-01", "Old", 100, "A", "")
+    content = save_record(1, "2025-05-02", "Fnac", 4250)['content']
+    os.makedirs(os.path.join("receipts", "2025_05"), exist_ok=True)
+    # Fichier à moitié écrit sous le nom réservé : il est complété, pas dupliqué
+    with open(os.path.join("receipts", "2025_05", "2025-05-02_Fnac.md"), 'w', encoding='utf-8') as f:
+        f.write(content[:20])
+    write_journal([
+        save_record(1, "2025-05-02", "Fnac", 4250),
+        {'seq': 1, 'op': 'allocated', 'year_month': "2025_05", 'filename': "2025-05-02_Fnac.md"},
+        {'seq': 2, 'op': 'delete', 'year_month': "2025_05", 'filename': "2025-05-01_Old.md"},
+        save_record(3, "2025-05-03", "Fnac", 100),
+    ], tail='{"seq": 4, "op": "sa')
+    
+    assert replay_receipt_journal() == 3
+    assert saved_files() == [("2025-05-02_Fnac.md", 4250), ("2025-05-03_Fnac.md", 100)]
+    assert os.path.getsize(JOURNAL_PATH) == 0
+    # Journal vide : rien à rejouer
+    assert replay_receipt_journal() == 0
+
+def test_replay_skips_applied_operations_and_is_idempotent():
+    records = [
+        save_record(1, "2025-06-01", "A", 100),
+        {'seq': 1, 'op': 'allocated', 'year_month': "2025_06", 'filename': "2025-06-01_A.md"},
+        {'seq': 1, 'op': 'applied'},
+        save_record(2, "2025-06-02", "B", 200),
+        {'seq': 2, 'op': 'allocated', 'year_month': "2025_06", 'filename': "2025-06-02_B.md"},
+    ]
+    write_journal(records)
+    assert replay_receipt_journal() == 1
+    assert saved_files() == [("2025-06-02_B.md", 200)]
+    
+    # Même journal rejoué (arrêt avant la marque « applied ») : le ticket garde son nom, sans doublon
+    write_journal(records)
+    assert replay_receipt_journal() == 1
+    assert saved_files() == [("2025-06-02_B.md", 200)]
+
+def test_replay_keeps_identical_tickets_apart():
+    # Ticket acquitté et nommé mais pas encore écrit, puis un ticket identique acquitté juste avant l'arrêt
+    write_journal([
+        save_record(1, "2025-05-02", "Fnac", 4250),
+        {'seq': 1, 'op': 'allocated', 'year_month': "2025_05", 'filename': "2025-05-02_Fnac.md"},
+        save_record(2, "2025-05-02", "Fnac", 4250),
+    ])
+    assert replay_receipt_journal() == 2
+    assert saved_files() == [("2025-05-02_Fnac.md", 4250), ("2025-05-02_Fnac_1.md", 4250)]
+
+def test_identical_file_of_another_process_is_not_taken_over(writer):
+    save_receipt_as_markdown("2025-05-02", "Fnac", 4250, "A", "")
+    # Ticket identique écrit par un autre processus sous le prochain nom, inconnu de celui-ci
+    content = format_receipt_markdown("2025-05-02", "Fnac", 4250, "A", "")
+    with open(os.path.join("receipts", "2025_05", "2025-05-02_Fnac_1.md"), 'w', encoding='utf-8') as f:
+        f.write(content)
+    
+    writer.save("2025-05-02", "Fnac", 4250, "A", "")
+    assert writer.flush(10)
+    assert sorted(os.listdir(os.path.join("receipts", "2025_05"))) == [
+        "2025-05-02_Fnac.md", "2025-05-02_Fnac_1.md", "2025-05-02_Fnac_2.md"]
+
+@pytest.mark.parametrize("date, enterprise, total", [
+    ("2025-01-02", "A" * 300, 100),
+    ("2025-01-02", "x\0y", 100),
+    ("2025-01-02", "", 100),
+    ("2025-13", "A", 100),
+    ("2025-01-02", "A", 10 ** 13),
+])
+def test_invalid_save_is_rejected_before_acknowledgement(writer, date, enterprise, total):
+    with pytest.raises(ValueError):
+        writer.save(date, enterprise, total, "A", "")
+    assert writer.pending == []
+    assert os.path.getsize(JOURNAL_PATH) == 0
+
+def test_invalid_delete_is_rejected(writer):
+    with pytest.raises(ValueError):
+        writer.delete("..", "2025-01-02_A.md")
+    with pytest.raises(ValueError):
+        writer.delete("2025_01", "../2025-01-02_A.md")
+
+def test_enterprise_path_separators_stay_in_month_folder(writer):
+    save_receipt_as_markdown("2025-01-03", "../../../escaped", 100, "A", "")
+    writer.save("2025-01-04", "a/b/../c", 200, "A", "")
+    assert writer.flush(10)
+    
+    assert os.listdir("receipts") == ["2025_01"]
+    assert sorted(os.listdir(os.path.join("receipts", "2025_01"))) == ["2025-01-03_.._.._.._escaped.md",
+                                                                      "2025-01-04_a_b_.._c.md"]
+    assert len(load_all_receipts()) == 2
+
+def test_failing_operation_is_set_aside(monkeypatch):
+    monkeypatch.setattr(journal, "RETRY_DELAY", 0.01)
+    # Opération acquittée par une version qui ne vérifiait pas la longueur des noms
+    write_journal([save_record(1, "2025-01-02", "A" * 300, 100), save_record(2, "2025-01-03", "Good", 200)])
+    
+    assert replay_receipt_journal() == 2
+    assert saved_files() == [("2025-01-03_Good.md", 200)]
+    assert os.path.getsize(JOURNAL_PATH) == 0
+    with open(os.path.join("data", "receipts_journal.failed.jsonl"), encoding='utf-8') as f:
+        failed = [json.loads(line) for line in f]
+    assert [record['seq'] for record in failed] == [1]
+    assert failed[0]['error'].startswith("OSError")
@@ -0,0 +1,52 @@
+"""Montants : formats lus dans les tickets et les relevés, conversion en centimes et limites."""
+
+import pytest
+
+from expense_tracker.money import MAX_AMOUNT_CENTS, euros_to_cents, format_amount, parse_amount
+
+@pytest.mark.parametrize("text, cents", [
+    ("12", 1200),
+    ("12.5", 1250),
+    ("12,50", 1250),
+    ("0.05", 5),
+    ("+3.10", 310),
+    ("-1 234,56 €", -123456),
+    ("1.234,56", 123456),
+    ("1,234.56", 123456),
+    ("1 234,56", 123456),
+    ("1 234,56 EUR", 123456),
+    ("12.345", 1235),
+    ("0.005", 1),
+    ("9999999999.99", MAX_AMOUNT_CENTS),
+])
+def test_parse_amount(text, cents):
+    assert parse_amount(text) == cents
+
+@pytest.mark.parametrize("text", ["", "abc", "12..5", "--1", "nan", "inf", "1e999999999",
+                                  "10000000000.00", "100000000000000000.0"])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+@pytest.mark.parametrize("value, cents", [
+    (12.3, 1230),
+    (0.1 + 0.2, 30),
+    ("12.5", 1250),
+    (2.675, 268),
+    (-0.5, -50),
+])
+def test_euros_to_cents(value, cents):
+    assert euros_to_cents(value) == cents
+
+def test_euros_to_cents_rejects_out_of_range():
+    with pytest.raises(ValueError):
+        euros_to_cents(1e17)
+
+@pytest.mark.parametrize("cents, text", [(0, "0.00"), (5, "0.05"), (-5, "-0.05"), (123456, "1234.56")])
+def test_format_amount(cents, text):
+    assert format_amount(cents) == text
+    assert parse_amount(text) == cents
+
+def test_format_amount_requires_cents():
+    with pytest.raises(TypeError):
+        format_amount(12.5)
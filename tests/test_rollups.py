@@ -0,0 +1,55 @@
+"""Récapitulatifs mensuels : tenus à jour à chaque écriture, et mêmes agrégats que le magasin complet."""
+
+import os
+import sys
+import subprocess
+
+from expense_tracker.aggregates import ReceiptAggregates, RollupTable
+from expense_tracker.rollups import ROLLUPS_FOLDER, read_month_rollups
+from expense_tracker.storage import delete_receipt, load_all_receipts, pack_receipt_month, save_receipt_as_markdown
+from expense_tracker.store import ReceiptStore
+
+def test_rollups_follow_saves_deletes_and_packing():
+    saved = save_receipt_as_markdown("2024-09-01", "Shop", 1050, "Alimentation", "")
+    save_receipt_as_markdown("2024-09-15", "Garage", 20000, "Transport", "")
+    save_receipt_as_markdown("2024-10-02", "Shop", 999, "Alimentation", "")
+    
+    rollups = read_month_rollups()
+    assert sorted(rollups) == ["2024_09", "2024_10"]
+    assert rollups["2024_09"] == {
+        'year_month': "2024_09", 'count': 2, 'sum': 21050, 'min': 1050, 'max': 20000,
+        'categories': {"Alimentation": {'count': 1, 'sum': 1050}, "Transport": {'count': 1, 'sum': 20000}},
+    }
+    
+    assert pack_receipt_month("2024_09") == 2
+    assert read_month_rollups() == rollups
+    assert delete_receipt(*saved)
+    assert read_month_rollups()["2024_09"]['sum'] == 20000
+    
+    # Dernier ticket du mois supprimé : plus de récapitulatif, et aucun fichier temporaire laissé
+    assert delete_receipt("2024_10", "2024-10-02_Shop.md")
+    assert sorted(read_month_rollups()) == ["2024_09"]
+    assert os.listdir(ROLLUPS_FOLDER) == ["2024_09.json"]
+
+def test_rollup_table_gives_the_same_overview_as_the_store():
+    for month in range(1, 7):
+        for day, category in ((3, "Alimentation"), (9, "Loisirs"), (20, "Alimentation")):
+            save_receipt_as_markdown(f"2024-{month:02d}-{day:02d}", "Shop", month * 1000 + day, category, "")
+    store = ReceiptStore()
+    store.refresh()
+    assert len(load_all_receipts()) == 18
+    
+    from_store = ReceiptAggregates(store.columns)
+    from_rollups = ReceiptAggregates(RollupTable(read_month_rollups()))
+    assert from_rollups.months == from_store.months
+    assert from_rollups.categories == from_store.categories
+    assert from_rollups.total == from_store.total
+    assert from_rollups.monthly_totals.tolist() == from_store.monthly_totals.tolist()
+    assert from_rollups.max_month == from_store.max_month
+    assert from_rollups.trend_percentage == from_store.trend_percentage
+
+def test_cli_import_does_not_load_numpy():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", "import sys, expense_tracker.cli; print('numpy' in sys.modules)"],
+                            cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,49 @@
+"""Recherche plein texte : entreprise, catégorie et notes, y compris des mois archivés et après modification."""
+
+import os
+
+from expense_tracker.storage import (
+    delete_receipt,
+    format_receipt_markdown,
+    open_synced_receipt_index,
+    pack_receipt_month,
+    save_receipt_as_markdown,
+    search_receipts,
+)
+
+def search(text=None, **filters):
+    conn = open_synced_receipt_index()
+    try:
+        return [r['filename'] for r in search_receipts(conn, text, **filters)]
+    finally:
+        conn.close()
+
+def test_search_words_prefixes_and_accents():
+    save_receipt_as_markdown("2025-01-05", "Pharmacie", 1250, "Santé", "Remboursé par la mutuelle")
+    save_receipt_as_markdown("2025-01-07", "Boulangerie", 320, "Alimentation", "")
+    save_receipt_as_markdown("2025-02-01", "Pharmacie", 800, "Santé", "")
+    
+    # Du plus récent au plus ancien ; chaque mot est un début de mot, sans tenir compte des accents
+    assert search("pharma") == ["2025-02-01_Pharmacie.md", "2025-01-05_Pharmacie.md"]
+    assert search("rembourse mutu") == ["2025-01-05_Pharmacie.md"]
+    assert search("sante", max_total=1000) == ["2025-02-01_Pharmacie.md"]
+    assert search("alim", year_month="2025_02") == []
+    assert search(min_total=500, date_to="2025-01-31") == ["2025-01-05_Pharmacie.md"]
+    assert search("pharma", limit=1) == ["2025-02-01_Pharmacie.md"]
+
+def test_search_follows_edits_deletes_and_packing():
+    year_month, filename = save_receipt_as_markdown("2024-11-02", "Garage", 45000, "Transport", "vidange")
+    save_receipt_as_markdown("2024-11-03", "Garage", 9000, "Transport", "pneus hiver")
+    
+    # Fichier modifié à la main : les nouvelles notes remplacent les anciennes à la synchronisation
+    with open(os.path.join("receipts", year_month, filename), 'w', encoding='utf-8') as f:
+        f.write(format_receipt_markdown("2024-11-02", "Garage", 45000, "Transport", "courroie"))
+    assert search("vidange") == []
+    assert search("courroie") == [filename]
+    
+    # Les notes des tickets archivés restent cherchables
+    assert pack_receipt_month("2024_11") == 2
+    assert search("pneus") == ["2024-11-03_Garage.md"]
+    assert delete_receipt("2024_11", "2024-11-03_Garage.md")
+    assert search("pneus") == []
+    assert search("garage") == [filename]
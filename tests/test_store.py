@@ -0,0 +1,76 @@
+"""Magasin de tickets en colonnes : les mises à jour incrémentales donnent les mêmes colonnes qu'une reconstruction."""
+
+import random
+
+from expense_tracker.store import MERGE_THRESHOLD, ReceiptStore, apply_receipt_changes, build_receipt_columns
+
+def make_receipt(day, number, total, category="A", month="2025_05"):
+    date = f"{month[:4]}-{month[5:]}-{day:02d}"
+    return {'date': date, 'enterprise': f"Shop {number % 5}", 'total': total, 'category': category,
+            'year_month': month, 'filename': f"{date}_Shop_{number}.md"}
+
+# Colonnes reconstruites à partir de zéro, dans l'ordre du magasin (date décroissante, puis mois et nom croissants)
+def rebuilt(receipts):
+    receipts = sorted(receipts, key=lambda r: (r['year_month'], r['filename']))
+    return build_receipt_columns(sorted(receipts, key=lambda r: r['date'], reverse=True), 0)
+
+# Contenu des colonnes indépendant des codes attribués : tickets dans l'ordre, totaux et nombres par (mois, catégorie)
+def summary(columns):
+    cells = {}
+    for month, month_code in columns.months.items():
+        for category, category_code in columns.categories.items():
+            if columns.counts[month_code, category_code]:
+                cells[(month, category)] = (int(columns.sums[month_code, category_code]),
+                                            int(columns.counts[month_code, category_code]))
+    return [columns.receipt(position) for position in range(len(columns))], cells
+
+def test_single_changes_match_a_rebuild():
+    store = ReceiptStore()
+    receipts = [make_receipt(day % 28 + 1, day, day * 100 + 1, "AB"[day % 2]) for day in range(10)]
+    for receipt in receipts:
+        store.add(receipt)
+    assert summary(store.columns) == summary(rebuilt(receipts))
+    
+    # Ticket modifié (même nom, autre catégorie et autre total) puis ticket supprimé
+    changed = dict(receipts[3], total=999, category="C")
+    store.add(changed)
+    store.remove(receipts[5]['year_month'], receipts[5]['filename'])
+    expected = [changed if r is receipts[3] else r for r in receipts if r is not receipts[5]]
+    assert summary(store.columns) == summary(rebuilt(expected))
+    month_code, category_code = store.columns.months["2025_05"], store.columns.categories["B"]
+    assert int(store.columns.counts[month_code, category_code]) == 3
+
+def test_large_batches_merge_and_match_a_rebuild():
+    rng = random.Random(3)
+    existing = [make_receipt(rng.randint(1, 28), number, rng.randint(1, 10 ** 6), rng.choice("ABC"),
+                             rng.choice(["2025_04", "2025_05"])) for number in range(50)]
+    columns = apply_receipt_changes(build_receipt_columns([], 0), existing, [])
+    assert summary(columns) == summary(rebuilt(existing))
+    
+    # Lot au-delà du seuil : nouveaux mois et catégories, tickets modifiés et supprimés dans le même lot
+    added = [make_receipt(rng.randint(1, 28), number, rng.randint(1, 10 ** 6), rng.choice("CDE"),
+                          rng.choice(["2025_05", "2025_06"])) for number in range(50, 50 + 2 * MERGE_THRESHOLD)]
+    modified = [dict(receipt, total=receipt['total'] + 1) for receipt in existing[:5]]
+    removed = [(receipt['year_month'], receipt['filename']) for receipt in existing[5:10]]
+    columns = apply_receipt_changes(columns, added + modified, removed)
+    
+    expected = modified + existing[10:] + added
+    assert summary(columns) == summary(rebuilt(expected))
+    assert int(columns.sums.sum()) == sum(receipt['total'] for receipt in expected)
+
+def test_applying_the_same_changes_twice_changes_nothing():
+    store = ReceiptStore()
+    receipts = [make_receipt(day % 28 + 1, day, 100 + day) for day in range(2 * MERGE_THRESHOLD)]
+    store.apply_writes(receipts, [])
+    version = store.columns.version
+    
+    # Les mêmes tickets, vus une seconde fois (ex. par le watcher), ne créent ni doublon ni nouvelle version
+    store.apply_changes(receipts, [])
+    store.apply_writes(receipts[:3], [])
+    assert store.columns.version == version
+    assert summary(store.columns) == summary(rebuilt(receipts))
+    
+    removed = [(receipts[0]['year_month'], receipts[0]['filename'])]
+    store.apply_changes([], removed)
+    store.apply_writes([], removed)
+    assert summary(store.columns) == summary(rebuilt(receipts[1:]))
@@ -0,0 +1,68 @@
+"""Surveillance du dossier receipts : fichiers ajoutés, modifiés ou supprimés appliqués au magasin partagé."""
+
+import io
+import os
+import time
+
+import pytest
+
+from expense_tracker.importer import import_bank_statement
+from expense_tracker.storage import format_receipt_markdown, load_all_receipts, save_receipt_as_markdown
+from expense_tracker.store import ReceiptStore
+from expense_tracker.watcher import ReceiptWatcher
+
+@pytest.fixture(params=["auto", "poll"])
+def watcher(request):
+    store = ReceiptStore()
+    receipt_watcher = ReceiptWatcher(store, request.param)
+    assert receipt_watcher.start()
+    yield receipt_watcher
+    receipt_watcher.stop()
+
+# Fonction pour attendre que le magasin corresponde à l'index, puis laisser passer un éventuel lot en retard
+def wait_for_store(store, expected, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if store_summary(store) == expected:
+            time.sleep(0.3)
+            break
+        time.sleep(0.05)
+    return store_summary(store)
+
+def store_summary(store):
+    columns = store.columns
+    return sorted((columns.receipt(position)['filename'], columns.receipt(position)['total'])
+                  for position in range(len(columns)))
+
+def index_summary():
+    return sorted((r['filename'], r['total']) for r in load_all_receipts())
+
+def bank_statement(rows):
+    lines = ["Date;Libellé;Montant"] + [f"{row % 28 + 1:02d}/04/2025;Magasin {row % 7};-{row},50" for row in rows]
+    return io.BytesIO("\n".join(lines).encode('utf-8'))
+
+def test_added_modified_and_removed_files_appear_within_a_second(watcher):
+    year_month, filename = save_receipt_as_markdown("2025-04-01", "Shop", 100, "A", "")
+    assert wait_for_store(watcher.store, [(filename, 100)], timeout=1.5) == [(filename, 100)]
+    
+    # Fichier modifié sur place (même nom, même dossier) : vu aussi en mode balayage
+    filepath = os.path.join("receipts", year_month, filename)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(format_receipt_markdown("2025-04-01", "Shop", 1250, "A", ""))
+    assert wait_for_store(watcher.store, [(filename, 1250)], timeout=1.5) == [(filename, 1250)]
+    
+    os.remove(filepath)
+    assert wait_for_store(watcher.store, [], timeout=1.5) == []
+
+def test_bank_import_and_watcher_do_not_duplicate_receipts(watcher):
+    save_receipt_as_markdown("2025-04-30", "Shop", 100, "A", "", watcher.store)
+    receipts, generation, stats = import_bank_statement(bank_statement(range(100)), "releve.csv")
+    assert stats['imported'] == 100
+    expected = index_summary()
+    assert len(expected) == 101
+    # Fichiers de l'import déjà appliqués par le watcher, puis lot appliqué comme le fait le bouton d'import
+    assert wait_for_store(watcher.store, expected) == expected
+    watcher.store.apply_writes(receipts, [], generation)
+    
+    assert store_summary(watcher.store) == expected
+    assert int(watcher.store.columns.sums.sum()) == sum(total for _, total in expected)